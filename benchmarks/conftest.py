@@ -0,0 +1,120 @@
+"""Fixtures shared by the ipython-sql benchmark suite.
+
+Benchmarks need ``pytest-benchmark``; DuckDB variants additionally need
+``duckdb`` and ``duckdb_engine`` and are skipped when those are missing.
+"""
+import random
+import sqlite3
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from IPython.testing.globalipapp import start_ipython  # noqa: E402
+
+import sql.connection  # noqa: E402
+import sql.run  # noqa: E402
+
+SIZES = (100, 1000, 10000)
+
+CATEGORIES = ("apple", "banana", "cherry", "damson", "elderberry")
+
+
+def _rows(size):
+    rnd = random.Random(size)
+    for n in range(size):
+        yield (
+            n,
+            "name %d" % n,
+            rnd.random() * 1000,
+            CATEGORIES[n % len(CATEGORIES)],
+            None if n % 7 == 0 else rnd.randint(0, 100),
+        )
+
+
+CREATE_TABLE = (
+    "CREATE TABLE bench (id INTEGER, name TEXT, amount REAL, "
+    "category TEXT, score INTEGER)"
+)
+
+
+@pytest.fixture(scope="session")
+def ip():
+    """An IPython session with the sql extension loaded"""
+    ip_session = start_ipython() or get_ipython()  # noqa: F821
+    if "SqlMagic" not in ip_session.magics_manager.registry:
+        ip_session.extension_manager.load_extension("sql")
+    return ip_session
+
+
+@pytest.fixture
+def config(ip):
+    """The ``SqlMagic`` instance, reset to default configuration"""
+    magic = ip.magics_manager.registry["SqlMagic"]
+    for name, trait in magic.traits(config=True).items():
+        setattr(magic, name, trait.default())
+    magic.feedback = False
+    magic.displaycon = False
+    return magic
+
+
+@pytest.fixture(scope="session")
+def sqlite_url(tmp_path_factory):
+    """Builds one SQLite database file per benchmark size
+
+    Returns a function mapping a row count to a connect string
+    whose ``bench`` table holds that many rows."""
+    directory = tmp_path_factory.mktemp("sqlite")
+    urls = {}
+
+    def make(size):
+        if size not in urls:
+            path = directory / ("bench_%d.db" % size)
+            db = sqlite3.connect(str(path))
+            db.execute(CREATE_TABLE)
+            db.executemany("INSERT INTO bench VALUES (?, ?, ?, ?, ?)", _rows(size))
+            db.commit()
+            db.close()
+            urls[size] = "sqlite:///%s" % path
+        return urls[size]
+
+    return make
+
+
+@pytest.fixture(scope="session")
+def duckdb_url(tmp_path_factory):
+    """Like ``sqlite_url``, but for DuckDB database files"""
+    duckdb = pytest.importorskip("duckdb")
+    pytest.importorskip("duckdb_engine")
+    directory = tmp_path_factory.mktemp("duckdb")
+    urls = {}
+
+    def make(size):
+        if size not in urls:
+            path = directory / ("bench_%d.duckdb" % size)
+            db = duckdb.connect(str(path))
+            db.execute(CREATE_TABLE)
+            db.executemany("INSERT INTO bench VALUES (?, ?, ?, ?, ?)", list(_rows(size)))
+            db.close()
+            urls[size] = "duckdb:///%s" % path
+        return urls[size]
+
+    return make
+
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def database(request, sqlite_url):
+    """Connect string factory, parametrized over the local engines"""
+    if request.param == "duckdb":
+        return request.getfixturevalue("duckdb_url")
+    return sqlite_url
+
+
+def connect(url):
+    """Returns a ``sql.connection.Connection`` for ``url``, reusing an open one"""
+    return sql.connection.Connection.set(url, displaycon=False)
+
+
+def fetch(url, config, query="SELECT * FROM bench"):
+    """Runs ``query`` and returns its ``ResultSet``"""
+    return sql.run.run(connect(url), query, config, {})
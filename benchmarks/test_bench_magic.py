@@ -0,0 +1,32 @@
+"""Per-call overhead of the ``%sql`` magic itself"""
+import pytest
+
+from conftest import SIZES, connect
+
+
+def test_execute_overhead(benchmark, ip, config, sqlite_url):
+    url = sqlite_url(SIZES[0])
+    connect(url)
+    benchmark(ip.run_line_magic, "sql", "SELECT 1")
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_execute_select(benchmark, ip, config, database, size):
+    url = database(size)
+    connect(url)
+    result = benchmark(ip.run_line_magic, "sql", "SELECT * FROM bench")
+    assert len(result) == size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_persist_dataframe(benchmark, ip, config, sqlite_url, size):
+    pytest.importorskip("pandas")
+    conn = connect(sqlite_url(size))
+    frame = ip.run_line_magic("sql", "SELECT * FROM bench").DataFrame()
+    user_ns = {"bench_frame": frame}
+
+    def persist():
+        config._persist_dataframe("bench_frame", conn, user_ns)
+        conn.internal_connection.exec_driver_sql("DROP TABLE bench_frame")
+
+    benchmark(persist)
@@ -0,0 +1,30 @@
+"""Splitting cells into statements, and classifying them"""
+import pytest
+import sqlparse
+
+from sql.parse import split_statements, statement_kind
+
+CELL = ";\n".join(
+    "INSERT INTO bench VALUES (%d, 'name %d', %d.5)" % (i, i, i) for i in range(200)
+)
+
+
+def test_sqlparse_split(benchmark):
+    benchmark(sqlparse.split, CELL)
+
+
+def test_split_statements(benchmark):
+    statements = benchmark(split_statements.__wrapped__, CELL)
+    assert len(statements) == 200
+
+
+def test_split_statements_cached(benchmark):
+    benchmark(split_statements, CELL)
+
+
+@pytest.mark.parametrize(
+    "statement",
+    ["SELECT * FROM bench", "-- note\nWITH a AS (SELECT 1) INSERT INTO t SELECT 1"],
+)
+def test_statement_kind(benchmark, statement):
+    benchmark(statement_kind, statement)
@@ -0,0 +1,60 @@
+"""Fetching and rendering costs of ``sql.run.ResultSet``"""
+import pytest
+
+from conftest import SIZES, fetch
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_fetch(benchmark, config, database, size):
+    url = database(size)
+    result = benchmark(fetch, url, config)
+    assert len(result) == size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_repr_html(benchmark, config, sqlite_url, size):
+    result = fetch(sqlite_url(size), config)
+
+    def render():
+        result.pretty.row_count = 0  # defeat the rendered-rows cache
+        return result._repr_html_()
+
+    benchmark(render)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_csv(benchmark, config, sqlite_url, size):
+    result = fetch(sqlite_url(size), config)
+    output = benchmark(result.csv)
+    assert len(output.splitlines()) == size + 1
+
+
+@pytest.mark.parametrize("typed", [False, True])
+@pytest.mark.parametrize("size", SIZES)
+def test_dataframe(benchmark, config, sqlite_url, size, typed):
+    pytest.importorskip("pandas")
+    result = fetch(sqlite_url(size), config)
+    frame = benchmark(result.DataFrame, typed=typed)
+    benchmark.extra_info["memory_bytes"] = int(frame.memory_usage(deep=True).sum())
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_polars(benchmark, config, sqlite_url, size):
+    pytest.importorskip("polars")
+    result = fetch(sqlite_url(size), config)
+    frame = benchmark(result.PolarsDataFrame)
+    benchmark.extra_info["memory_bytes"] = int(frame.estimated_size())
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_to_numpy(benchmark, config, sqlite_url, size):
+    pytest.importorskip("numpy")
+    result = fetch(sqlite_url(size), config)
+    array = benchmark(result.to_numpy)
+    assert len(array) == size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_guess_plot_columns(benchmark, config, sqlite_url, size):
+    result = fetch(sqlite_url(size), config, "SELECT name, id, amount FROM bench")
+    benchmark(result.guess_plot_columns)
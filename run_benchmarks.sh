@@ -0,0 +1,5 @@
+#!/bin/bash
+# Results are saved under .benchmarks/, tagged with the current commit.
+# Compare against earlier runs with e.g. `pytest-benchmark compare`,
+# or pass `--benchmark-compare` to fail on regressions.
+pytest benchmarks --benchmark-autosave --benchmark-storage=file://./.benchmarks "$@"
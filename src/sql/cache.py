@@ -0,0 +1,151 @@
+"""
+A cache of SELECT results, kept per connection.
+
+Each cached result records the tables its query read.  Statements run
+through ``%sql`` that may change one of those tables drop it from the
+cache.  Changes made elsewhere - by other sessions, or other programs -
+are caught, on databases that count them cheaply, by comparing the
+tables' change counters with those seen when the result was fetched:
+
+* SQLite: ``PRAGMA data_version`` and ``total_changes()``
+* PostgreSQL: the tables' row counters in ``pg_stat_user_tables``
+* MySQL: the tables' ``UPDATE_TIME`` in ``information_schema``
+
+On other databases, only changes made through ``%sql`` are noticed.
+"""
+
+import sqlalchemy
+from sqlparse import tokens as T
+
+from .parse import statement_kind
+from .rewrite import (
+    _TABLE_PLACEHOLDER,
+    _lex,
+    is_read_only,
+    tables_read,
+    tables_written,
+)
+
+
+class Entry(object):
+    """A cached result, with the tables it was read from"""
+
+    def __init__(self, tables, probe, keys, rows):
+        self.tables = tables
+        self.probe = probe
+        self.keys = keys
+        self.rows = rows
+
+
+def key(statement, user_namespace, limit=0):
+    """``(key, tables)`` to cache ``statement``'s result under, or None
+
+    The key is the statement with the values bound to its ``:name``
+    placeholders, and the ``limit`` (as ``autolimit``) its rows were
+    cut to, so a result cut short isn't served once the limit changes.  Statements that aren't plain SELECTs, or that bind
+    unhashable values or DataFrames, can't be cached; nor can those
+    naming a variable as a table, which DuckDB may read as a DataFrame.
+    """
+    if statement.strip().startswith("\\") or not is_read_only(statement):
+        return None
+    binds = []
+    for ttype, value in _lex(statement):
+        if ttype is _TABLE_PLACEHOLDER:
+            return None
+        if ttype in T.Name.Placeholder and value.startswith(":"):
+            binds.append((value[1:], user_namespace.get(value[1:])))
+    tables = tables_read(statement)
+    if any(table in user_namespace for table in tables):
+        return None
+    try:
+        hash(tuple(binds))
+    except TypeError:
+        return None
+    return (statement, tuple(binds), limit), tables
+
+
+def _probe_sqlite(connection, tables):
+    return (
+        connection.exec_driver_sql("PRAGMA data_version").scalar(),
+        connection.exec_driver_sql("SELECT total_changes()").scalar(),
+    )
+
+
+def _probe_postgresql(connection, tables):
+    query = sqlalchemy.text(
+        "SELECT relid, n_tup_ins, n_tup_upd, n_tup_del, n_live_tup "
+        "FROM pg_stat_user_tables WHERE relname IN :tables"
+    ).bindparams(sqlalchemy.bindparam("tables", expanding=True))
+    return tuple(
+        sorted(
+            tuple(row) for row in connection.execute(query, {"tables": sorted(tables)})
+        )
+    )
+
+
+def _probe_mysql(connection, tables):
+    query = sqlalchemy.text(
+        "SELECT table_name, update_time FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name IN :tables"
+    ).bindparams(sqlalchemy.bindparam("tables", expanding=True))
+    return tuple(
+        sorted(
+            tuple(row) for row in connection.execute(query, {"tables": sorted(tables)})
+        )
+    )
+
+
+# by SQLAlchemy dialect name
+_PROBES = {
+    "sqlite": _probe_sqlite,
+    "postgresql": _probe_postgresql,
+    "mysql": _probe_mysql,
+    "mariadb": _probe_mysql,
+}
+
+
+def probe(conn, tables):
+    """A snapshot of what ``conn``'s database says of changes to ``tables``
+
+    None on databases without a cheap way to tell."""
+    check = _PROBES.get(conn.dialect.name)
+    if check is None:
+        return None
+    return check(conn.internal_connection, tables)
+
+
+def lookup(conn, key, tables):
+    """Returns ``(entry, snapshot)``: the result cached under ``key`` on
+    ``conn`` (None if there is none, or its tables have changed since),
+    and a snapshot of ``tables`` taken now, to store a new result with."""
+    snapshot = probe(conn, tables)
+    entry = conn.query_cache.get(key)
+    if entry is not None:
+        if entry.probe == snapshot:
+            conn.query_cache.move_to_end(key)
+            return entry, snapshot
+        del conn.query_cache[key]
+    return None, snapshot
+
+
+def store(conn, key, tables, snapshot, resultset, size):
+    """Caches ``resultset``, keeping the ``size`` most recently used results"""
+    conn.query_cache[key] = Entry(
+        tables, snapshot, list(resultset.keys), list(resultset)
+    )
+    conn.query_cache.move_to_end(key)
+    while len(conn.query_cache) > size:
+        conn.query_cache.popitem(last=False)
+
+
+def invalidate(conn, statement):
+    """Drops the results cached on ``conn`` that ``statement`` may change"""
+    if not conn.query_cache or statement_kind(statement) in ("META", "TRANSACTION"):
+        return
+    written = tables_written(statement)
+    if written is None:
+        conn.query_cache.clear()
+        return
+    stale = [k for k, entry in conn.query_cache.items() if entry.tables & written]
+    for k in stale:
+        del conn.query_cache[k]
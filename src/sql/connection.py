@@ -1,3 +1,4 @@
+import collections
 import os
 import traceback
 
@@ -8,6 +9,12 @@ class ConnectionError(Exception):
     pass
 
 
+# some dialects have autocommit
+# specific dialects break when commit is used:
+
+_COMMIT_BLACKLIST_DIALECTS = ("athena", "bigquery", "clickhouse", "ingres", "mssql", "teradata", "vertica")
+
+
 def rough_dict_get(dct, sought, default=None):
     """
     Like dct.get(sought), but any key containing sought will do.
@@ -55,8 +62,101 @@ class Connection(object):
         self.internal_connection = engine.connect()
         self.connections[repr(self.url)] = self
         self.connect_args = connect_args
+        self.can_commit = all(
+            dialect not in str(self.dialect) for dialect in _COMMIT_BLACKLIST_DIALECTS
+        )
+        # set when a statement fails, so the next one starts from a clean transaction
+        self.needs_rollback = False
+        # set while a transaction opened with BEGIN or --transaction is open
+        self.in_transaction = False
+        # name for this connection's tables in federated queries (--alias)
+        self.alias = None
+        # read replicas that SELECTs run on (--replica-of), and the
+        # next in turn for round-robin routing
+        self.replicas = []
+        self.next_replica = 0
+        # smoothed seconds per statement, when used as a replica
+        self.latency = None
+        # temporary tables holding DataFrames bound as tables (FROM :df),
+        # by id(frame), and those whose frames are gone, to be dropped
+        self.frame_tables = {}
+        self.stale_tables = []
+        # thread still fetching a progressively displayed result
+        self.fetching = None
+        # cached SELECT results (see sql.cache), least recently used first
+        self.query_cache = collections.OrderedDict()
         Connection.current = self
 
+    def wait(self):
+        """Waits for any result still being fetched in the background"""
+        if self.fetching is not None:
+            self.fetching.join()
+            self.fetching = None
+
+    def begin(self, commit=False):
+        """Opens an explicit transaction, suspending autocommit until it ends
+
+        With ``commit``, the work done so far is committed first, rather
+        than becoming part of the transaction."""
+        if self.in_transaction:
+            raise Exception("A transaction is already in progress on %s" % self.name)
+        if commit:
+            self.internal_connection.commit()
+        self.in_transaction = True
+
+    def commit(self):
+        """Commits and ends any explicit transaction"""
+        self.internal_connection.commit()
+        self.in_transaction = False
+
+    def rollback(self):
+        """Rolls back and ends any explicit transaction"""
+        self.internal_connection.rollback()
+        self.in_transaction = False
+        self.needs_rollback = False
+
+    def add_replica(self, replica):
+        """Makes ``replica`` take reads that would have run on this connection"""
+        if replica is self:
+            raise ConnectionError("A connection cannot be its own replica")
+        if replica not in self.replicas:
+            self.replicas.append(replica)
+
+    def pick_replica(self, routing="round-robin"):
+        """Chooses the replica for the next read
+
+        ``routing`` is ``round-robin``, or ``least-latency`` for the
+        replica that has been quickest lately (untried ones first)."""
+        if routing == "least-latency":
+            return min(
+                self.replicas,
+                key=lambda replica: replica.latency or 0.0,
+            )
+        replica = self.replicas[self.next_replica % len(self.replicas)]
+        self.next_replica += 1
+        return replica
+
+    def record_latency(self, seconds, weight=0.2):
+        """Folds a statement's running time into ``latency``"""
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency = (1 - weight) * self.latency + weight * seconds
+
+    @classmethod
+    def find(cls, descriptor):
+        """The connection with alias ``descriptor``, or matching it as for ``set``"""
+        return cls.aliases().get(descriptor) or rough_dict_get(
+            cls.connections, descriptor
+        )
+
+    @classmethod
+    def aliases(cls):
+        """Connections given an alias, by alias"""
+        return dict(
+            (conn.alias, conn) for conn in cls.connections.values() if conn.alias
+        )
+
     @classmethod
     def set(cls, descriptor, displaycon, connect_args={}, creator=None):
         """Sets the current database connection"""
@@ -117,4 +217,7 @@ class Connection(object):
                 % str(cls.connections.keys())
             )
         cls.connections.pop(str(conn.url))
+        for other in cls.connections.values():
+            if conn in other.replicas:
+                other.replicas.remove(conn)
         conn.internal_connection.close()
@@ -0,0 +1,320 @@
+"""
+Federated queries: one SELECT joining tables from several connections.
+
+Tables are referenced as ``alias.schema.table`` (or ``alias.table``),
+where ``alias`` was given to a connection with ``--alias``.  Each such
+table is fetched from its own database - with the columns the query
+uses, and the WHERE conditions that only concern that table, pushed
+down - and streamed into a local in-process database, where the query
+itself runs.
+"""
+
+import time
+
+import sqlalchemy
+from sqlparse import sql as S
+from sqlparse import tokens as T
+
+from . import querylog
+from .connection import Connection
+from .rewrite import parse, table_references
+from .run import ResultSet, _commit, _load_rows, _output
+
+# rows moved from a source to the local database at a time
+BATCH_SIZE = 10000
+
+
+class Source(object):
+    """A table from another connection that a federated query reads"""
+
+    def __init__(self, identifier, conn, remote_name, alias):
+        self.identifier = identifier
+        self.conn = conn
+        self.remote_name = remote_name
+        self.alias = alias
+        self.local_name = "%s_%s" % (conn.alias, alias)
+        self.columns = None  # None means all of them
+        self.conditions = []
+        self.rows = 0
+        self.seconds = 0.0
+
+    def table_columns(self):
+        """Names of the table's columns, or None if the database won't say"""
+        parts = [_unquote(part) for part in self.remote_name.split(".")]
+        try:
+            inspector = sqlalchemy.inspect(self.conn.internal_connection)
+            return [
+                column["name"]
+                for column in inspector.get_columns(
+                    parts[-1], schema=(parts[-2:-1] or [None])[0]
+                )
+            ]
+        except Exception:
+            return None
+
+    @property
+    def query(self):
+        quote = self.conn.internal_connection.dialect.identifier_preparer.quote
+        columns = (
+            ", ".join("%s.%s" % (self.alias, quote(column)) for column in self.columns)
+            if self.columns
+            else "*"
+        )
+        query = "SELECT %s FROM %s AS %s" % (columns, self.remote_name, self.alias)
+        if self.conditions:
+            query += " WHERE " + " AND ".join(self.conditions)
+        return query
+
+
+def _dotted_parts(identifier):
+    """The dot-separated parts of a table name, as written"""
+    parts = []
+    for token in identifier.tokens:
+        if token.is_whitespace or isinstance(token, S.Identifier):
+            break
+        if not (token.ttype is T.Punctuation and token.value == "."):
+            parts.append(token.value)
+    return parts
+
+
+def _unquote(name):
+    return name.strip('"`[]')
+
+
+def _qualified_columns(tokens):
+    """Yields ``(qualifier, column)`` for each ``qualifier.column`` in ``tokens``
+
+    ``tokens`` are flattened, and ``column`` may be ``*``."""
+    tokens = [token for token in tokens if not token.is_whitespace]
+    for idx in range(1, len(tokens) - 1):
+        dot = tokens[idx]
+        if dot.ttype is T.Punctuation and dot.value == ".":
+            before, after = tokens[idx - 1], tokens[idx + 1]
+            if (idx < 2 or tokens[idx - 2].value != ".") and (
+                idx + 2 >= len(tokens) or tokens[idx + 2].value != "."
+            ):
+                yield _unquote(before.value), after.value
+
+
+# keywords that may appear in a condition pushed down to a source
+_CONDITION_KEYWORDS = (
+    "AND",
+    "OR",
+    "NOT",
+    "IN",
+    "IS",
+    "NULL",
+    "LIKE",
+    "ILIKE",
+    "BETWEEN",
+    "TRUE",
+    "FALSE",
+)
+
+
+def _pushable_to(condition):
+    """The alias of the one table ``condition`` concerns, if it can be pushed down
+
+    Conditions with subqueries, unqualified names or unusual keywords
+    (which may be column names sqlparse didn't recognize) aren't."""
+    tokens = [
+        token
+        for token in parse("SELECT 1 WHERE " + condition)[0].flatten()
+        if not token.is_whitespace
+    ][3:]
+    for idx, token in enumerate(tokens):
+        if token.is_keyword and token.normalized not in _CONDITION_KEYWORDS:
+            return None
+        if token.ttype in T.Name and token.ttype not in T.Name.Placeholder:
+            neighbours = [
+                tokens[i].value for i in (idx - 1, idx + 1) if i < len(tokens)
+            ]
+            if "." not in neighbours:
+                return None
+    qualifiers = set(q.lower() for q, _ in _qualified_columns(tokens))
+    if len(qualifiers) == 1:
+        return qualifiers.pop()
+    return None
+
+
+def _conjuncts(where):
+    """Splits a WHERE clause into its top-level AND-ed conditions
+
+    Returns an empty list if the clause has a top-level OR, so
+    can't be split."""
+    conjuncts = [[]]
+    in_between = False
+    for token in where.tokens[1:]:  # skip WHERE itself
+        if token.is_keyword and token.normalized == "OR":
+            return []
+        if token.is_keyword and token.normalized == "BETWEEN":
+            in_between = True
+        elif token.is_keyword and token.normalized == "AND":
+            if in_between:
+                in_between = False
+            else:
+                conjuncts.append([])
+                continue
+        conjuncts[-1].append(token)
+    return ["".join(str(token) for token in tokens).strip() for tokens in conjuncts]
+
+
+def _nullable(statement):
+    """Ids of the tables an outer join in ``statement`` may pad with NULLs
+
+    Those on the right of a LEFT JOIN, the left of a RIGHT JOIN, and
+    either side of a FULL JOIN.  Conditions on them can't be pushed down:
+    a WHERE clause filters the joined rows, NULLs included, so pushed to
+    the source it would instead drop rows the join then pads back in,
+    as in the anti-join ``LEFT JOIN ... WHERE b.id IS NULL``."""
+    nullable = set()
+    joined = []
+    join = None
+    for token in statement.tokens:
+        if token.is_whitespace or token.ttype in T.Comment:
+            continue
+        if token.is_keyword and (
+            token.normalized == "FROM" or token.normalized.endswith("JOIN")
+        ):
+            join = token.normalized.split()
+            if "RIGHT" in join or "FULL" in join:
+                nullable.update(joined)
+            continue
+        if join is not None:
+            if isinstance(token, S.IdentifierList):
+                tables = [id(table) for table in token.get_identifiers()]
+            else:
+                tables = [id(token)]
+            joined.extend(tables)
+            if "LEFT" in join or "FULL" in join:
+                nullable.update(tables)
+            join = None
+    return nullable
+
+
+def plan(sql):
+    """Works out which tables to fetch from where, and the query to run locally
+
+    Returns ``(sources, local_statement)``, where ``local_statement``
+    is the parsed query with each source table replaced by the name it
+    will have in the local database.
+    """
+    statements = parse(sql)
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        raise ValueError("Federated queries must be a single SELECT statement")
+    statement = statements[0]
+    aliases = Connection.aliases()
+    sources = []
+    for identifier in table_references(statement):
+        parts = _dotted_parts(identifier)
+        conn = aliases.get(_unquote(parts[0]))
+        if len(parts) < 2 or conn is None:
+            continue
+        alias = identifier.get_alias() or _unquote(parts[-1])
+        sources.append(Source(identifier, conn, ".".join(parts[1:]), alias))
+    if not sources:
+        raise ValueError(
+            "No tables of the form alias.schema.table found, where alias is one of: %s"
+            % ", ".join(sorted(aliases))
+        )
+    by_alias = dict((source.alias.lower(), source) for source in sources)
+    excluded = set(
+        id(token) for source in sources for token in source.identifier.flatten()
+    )
+
+    # Projections: fetch only the columns named somewhere in the query
+    tokens = [
+        token
+        for token in statement.flatten()
+        if not (token.is_whitespace or id(token) in excluded)
+    ]
+    words = set(_unquote(token.value).lower() for token in tokens)
+    wildcards = set()  # aliases selected with alias.*, or None for a bare *
+    for idx, token in enumerate(tokens):
+        if token.ttype is T.Wildcard:
+            before = tokens[idx - 1].value
+            if before == ".":
+                wildcards.add(_unquote(tokens[idx - 2].value).lower())
+            elif before != "(":  # not COUNT(*)
+                wildcards.add(None)
+    for source in sources:
+        if None in wildcards or source.alias.lower() in wildcards:
+            continue
+        columns = source.table_columns()
+        if columns:
+            # keep one column even if none is named, as for COUNT(*)
+            source.columns = [
+                column for column in columns if column.lower() in words
+            ] or columns[:1]
+
+    # Predicates: conditions on a single source's columns alone, unless
+    # an outer join may pad that source with NULLs
+    where = next(
+        (token for token in statement.tokens if isinstance(token, S.Where)), None
+    )
+    nullable = _nullable(statement)
+    for condition in _conjuncts(where) if where else []:
+        source = by_alias.get(_pushable_to(condition))
+        if source is not None and id(source.identifier) not in nullable:
+            source.conditions.append(condition)
+
+    for source in sources:
+        siblings = source.identifier.parent.tokens
+        siblings[siblings.index(source.identifier)] = S.Token(
+            T.Other, "%s AS %s" % (source.local_name, source.alias)
+        )
+    return sources, statement
+
+
+def _transfer(source, local, config, user_namespace):
+    """Streams a source's rows into a new table in the ``local`` connection"""
+    started = time.time()
+    with querylog.logged(config, source.query, source.conn.name) as execution:
+        try:
+            result = source.conn.internal_connection.execute(
+                sqlalchemy.text(source.query),
+                user_namespace,
+                execution_options={"stream_results": True},
+            )
+            try:
+                _, source.rows = _load_rows(
+                    result, local, source.local_name, BATCH_SIZE
+                )
+            finally:
+                result.close()
+        except Exception:
+            source.conn.needs_rollback = True
+            raise
+        _commit(source.conn, config)
+        execution["rows"] = source.rows
+    source.seconds = time.time() - started
+
+
+def run(sql, config, user_namespace):
+    """Runs a federated query, returning a ``ResultSet`` (or DataFrame)
+
+    The local database is ``config.federation_engine``, created afresh
+    for each query."""
+    sources, statement = plan(sql)
+    engine = sqlalchemy.create_engine(config.federation_engine)
+    backend = engine.url.get_backend_name()
+    try:
+        with engine.connect() as local:
+            for source in sources:
+                _transfer(source, local, config, user_namespace)
+            if config.feedback:
+                print("Federated plan:")
+                for source in sources:
+                    print(
+                        "  %s: %s  -- %d rows in %.2fs"
+                        % (source.conn.alias, source.query, source.rows, source.seconds)
+                    )
+                print("  local (%s): %s" % (backend, statement))
+            local_name = "local (%s)" % backend
+            with querylog.logged(config, str(statement), local_name) as execution:
+                result = local.execute(sqlalchemy.text(str(statement)), user_namespace)
+                resultset = ResultSet(result, config)
+                execution["rows"] = len(resultset)
+    finally:
+        engine.dispose()
+    return _output(resultset, config)
@@ -0,0 +1,200 @@
+"""
+An interactive, virtual-scrolling grid for displaying result sets.
+
+The grid is a Jupyter widget built with ``anywidget``, so it works in
+any frontend with widget support (JupyterLab, Notebook, VS Code and
+the like).  Its state holds only the column headers and the first
+page of rows.  As the grid is scrolled, it asks the kernel for the
+rows coming into view, and they are sent from the ``ResultSet`` still
+held there.
+
+Alongside the widget, a preview table of the first page is sent, for
+where widgets can't be shown (as nbviewer, or a notebook reopened
+without its kernel).  Without ``anywidget``, or outside a kernel,
+results are shown as the ordinary table.
+"""
+
+import functools
+import html
+import math
+import weakref
+
+# rows in the grid's state and in the preview table
+FIRST_PAGE = 20
+
+# most rows sent in reply to one request
+MAX_WINDOW = 500
+
+# height of the grid's viewport, in rows
+VISIBLE_ROWS = 15
+
+
+def _jsonable(value):
+    """``value`` as something ``json.dumps`` can send"""
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    return str(value)
+
+
+def window(resultset, start, stop):
+    """Rows ``start`` to ``stop`` of ``resultset``, as JSON-ready lists"""
+    start = max(0, int(start))
+    stop = min(int(stop), start + MAX_WINDOW)
+    return [[_jsonable(value) for value in row] for row in resultset[start:stop]]
+
+
+def reply(resultset, request):
+    """The grid's answer to ``request`` for rows of ``resultset``
+
+    ``resultset`` is None once it has been garbage collected."""
+    if resultset is None:
+        return {"request": request.get("request"), "expired": True}
+    return {
+        "request": request.get("request"),
+        "start": max(0, int(request["start"])),
+        "rows": window(resultset, request["start"], request["stop"]),
+        "total": len(resultset),
+    }
+
+
+def preview_html(resultset):
+    """An HTML table of the first page of ``resultset``, noting how many
+    rows are left out"""
+    header = "".join(
+        "<th>%s</th>" % html.escape(str(name)) for name in resultset.field_names
+    )
+    rows = "".join(
+        "<tr>%s</tr>"
+        % "".join(
+            "<td>%s</td>" % html.escape("None" if value is None else str(value))
+            for value in row
+        )
+        for row in resultset[:FIRST_PAGE]
+    )
+    table = "<table><thead><tr>%s</tr></thead><tbody>%s</tbody></table>" % (
+        header,
+        rows,
+    )
+    more = len(resultset) - FIRST_PAGE
+    if more > 0:
+        table += '\n<span style="font-style:italic">%d more rows</span>' % more
+    return table
+
+
+_ESM = """
+function render({ model, el }) {
+  var rowHeight = 24, visible = model.get("visible");
+  var total = model.get("total"), first = 0, latest = 0;
+  var viewport = document.createElement("div");
+  viewport.style.maxHeight = (rowHeight * (visible + 1)) + "px";
+  viewport.style.overflowY = "auto";
+  viewport.style.position = "relative";
+  var spacer = document.createElement("div");
+  var table = document.createElement("table");
+  table.style.position = "absolute";
+  table.style.top = "0";
+  var head = table.createTHead().insertRow();
+  model.get("keys").forEach(function (key) {
+    var th = document.createElement("th");
+    th.textContent = key;
+    head.appendChild(th);
+  });
+  var body = table.createTBody();
+  var note = document.createElement("span");
+  note.style.fontStyle = "italic";
+  viewport.appendChild(spacer);
+  viewport.appendChild(table);
+  el.appendChild(viewport);
+  el.appendChild(note);
+  function show(start, rows) {
+    spacer.style.height = (total * rowHeight) + "px";
+    table.style.top = (start * rowHeight) + "px";
+    body.innerHTML = "";
+    rows.forEach(function (row) {
+      var tr = body.insertRow();
+      tr.style.height = rowHeight + "px";
+      row.forEach(function (value) {
+        tr.insertCell().textContent = value === null ? "None" : String(value);
+      });
+    });
+    note.textContent = total + " rows";
+  }
+  model.on("msg:custom", function (data) {
+    if (data.request !== latest || data.expired) { return; }
+    total = data.total;
+    show(data.start, data.rows);
+  });
+  viewport.addEventListener("scroll", function () {
+    var start = Math.max(0, Math.floor(viewport.scrollTop / rowHeight) - visible);
+    if (start === first) { return; }
+    first = start;
+    latest += 1;
+    model.send({request: latest, start: start, stop: start + visible * 3});
+  });
+  show(0, model.get("rows"));
+}
+export default { render };
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _widget_class():
+    """The grid's widget class, or None without ``anywidget``"""
+    try:
+        import anywidget
+        import traitlets
+    except ImportError:
+        return None
+
+    class Grid(anywidget.AnyWidget):
+        _esm = _ESM
+        keys = traitlets.List().tag(sync=True)
+        rows = traitlets.List().tag(sync=True)  # the first page
+        total = traitlets.Int().tag(sync=True)
+        visible = traitlets.Int(VISIBLE_ROWS).tag(sync=True)
+
+    return Grid
+
+
+def _in_kernel():
+    from IPython import get_ipython
+
+    return getattr(get_ipython(), "kernel", None) is not None
+
+
+def widget(resultset):
+    """A grid widget over ``resultset``, or None where it can't be shown
+
+    The widget holds ``resultset`` only weakly, and is closed when it
+    is garbage collected."""
+    grid_class = _widget_class()
+    if grid_class is None or not _in_kernel():
+        return None
+    grid = grid_class(
+        keys=[str(name) for name in resultset.field_names],
+        rows=window(resultset, 0, FIRST_PAGE),
+        total=len(resultset),
+    )
+    held = weakref.ref(resultset)
+
+    def _on_msg(_, request, buffers):
+        grid.send(reply(held(), request))
+
+    grid.on_msg(_on_msg)
+    weakref.finalize(resultset, grid.close)
+    return grid
+
+
+def grid_bundle(resultset):
+    """The MIME bundle showing ``resultset`` as a grid, with the preview
+    table as its HTML; None where the grid can't be shown"""
+    grid = widget(resultset)
+    if grid is None:
+        return None
+    bundle = grid._repr_mimebundle_()
+    if isinstance(bundle, tuple):
+        bundle = bundle[0]
+    bundle["text/html"] = preview_html(resultset)
+    return bundle
@@ -0,0 +1,264 @@
+"""
+Lazy results, whose pandas-like operations are compiled back to SQL.
+
+``%sql --lazy df << SELECT * FROM big_table`` runs nothing but a query
+for the column names, and returns a ``LazyResultSet``.  Its
+``filter``, ``select``, ``groupby(...).agg``, ``sort`` and ``head``
+methods each return a new ``LazyResultSet`` whose query wraps the one
+before, so::
+
+    df.filter(df.c.year > 1900).groupby("country").agg(n=("id", "count"))
+
+becomes a single ``SELECT ... GROUP BY`` run by the database, and
+only its result is fetched - its first rows on display, or all of it
+on ``collect()``.
+"""
+
+import sqlalchemy
+
+from . import querylog
+from .rewrite import _end_of_sql, parse
+from .run import ResultSet, _commit, _output, _text
+
+_BASE = "ipython_sql_lazy"
+
+# rows fetched for display when ``displaylimit`` doesn't cap them
+PREVIEW_ROWS = 10
+
+# pandas aggregation names that SQL spells differently
+_AGGREGATES = {
+    "mean": sqlalchemy.func.avg,
+    "size": sqlalchemy.func.count,
+    "nunique": lambda column: sqlalchemy.func.count(sqlalchemy.distinct(column)),
+    "std": sqlalchemy.func.stddev,
+    "var": sqlalchemy.func.variance,
+}
+
+
+def _aggregate(column, name):
+    """SQL aggregate function ``name`` (or its pandas name) of ``column``"""
+    function = _AGGREGATES.get(name) or getattr(sqlalchemy.func, name)
+    return function(column)
+
+
+def run(conn, sql, config, user_namespace):
+    """A ``LazyResultSet`` over SELECT ``sql``, fetching only its column names"""
+    statements = parse(sql)
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        raise ValueError("Only a single SELECT statement can be lazy")
+    statement = str(statements[0])[: _end_of_sql(statements[0])]
+    text, parameters = _text(conn, statement, user_namespace, config.in_list_threshold)
+    try:
+        probe = conn.internal_connection.execute(
+            sqlalchemy.text(
+                "SELECT * FROM (%s) AS %s WHERE 1 = 0" % (text.text, _BASE)
+            ).bindparams(*text._bindparams.values()),
+            parameters,
+        )
+        keys = list(probe.keys())
+        probe.close()
+    except Exception:
+        conn.needs_rollback = True
+        raise
+    _commit(conn, config)
+    base = text.columns(*(sqlalchemy.column(key) for key in keys)).subquery(_BASE)
+    return LazyResultSet(conn, config, sqlalchemy.select(base), parameters)
+
+
+class LazyResultSet(object):
+    """A query not yet run, built up from pandas-like operations
+
+    Columns are available as ``.c.name`` (or ``.c["name"]``), to build
+    conditions and expressions for ``filter`` and ``select``.
+    """
+
+    def __init__(self, conn, config, query, parameters, limit=None):
+        self.conn = conn
+        self.config = config
+        self.query = query
+        self.parameters = parameters
+        self.limit = limit  # on the number of rows ``query`` returns
+        self._subquery = None
+
+    def _derive(self, query, limit=None):
+        return LazyResultSet(self.conn, self.config, query, self.parameters, limit)
+
+    def _limited(self, n):
+        """``(query, limit)`` for the first ``n`` rows of this query
+
+        The limit goes on the query itself, rather than a query wrapping
+        it, so any ORDER BY still decides which rows come first."""
+        if self.limit is not None:
+            n = min(n, self.limit)
+        return self.query.limit(n), n
+
+    @property
+    def _wrapped(self):
+        """This query as a subquery, for the next operation to select from"""
+        if self._subquery is None:
+            self._subquery = self.query.subquery()
+        return self._subquery
+
+    @property
+    def c(self):
+        return self._wrapped.c
+
+    @property
+    def columns(self):
+        return [column.name for column in self.query.selected_columns]
+
+    def _column(self, column):
+        if isinstance(column, str):
+            return self.c[column]
+        return column
+
+    def filter(self, *conditions, **equal_to):
+        """Rows meeting every one of ``conditions``
+
+        Conditions are expressions on ``.c`` columns, or SQL strings;
+        keyword arguments require a column to equal a value."""
+        clauses = [
+            sqlalchemy.text(condition) if isinstance(condition, str) else condition
+            for condition in conditions
+        ]
+        clauses.extend(self.c[name] == value for name, value in equal_to.items())
+        return self._derive(sqlalchemy.select(self._wrapped).where(*clauses))
+
+    def select(self, *columns, **expressions):
+        """Just the named ``columns`` (or expressions on ``.c`` columns),
+        and ``expressions`` labelled with their keyword"""
+        selected = [self._column(column) for column in columns]
+        selected.extend(
+            self._column(expression).label(name)
+            for name, expression in expressions.items()
+        )
+        return self._derive(sqlalchemy.select(*selected))
+
+    def groupby(self, *keys):
+        """Groups rows by ``keys``, to be aggregated with ``.agg``"""
+        return GroupBy(self, [self._column(key) for key in keys])
+
+    def sort(self, *columns, **kwargs):
+        """Rows ordered by ``columns``; pass ``descending=True`` to reverse
+
+        A column name starting with ``-`` sorts that column descending."""
+        descending = kwargs.pop("descending", False)
+        if kwargs:
+            raise TypeError("Unexpected arguments: %s" % ", ".join(kwargs))
+        order = []
+        for column in columns:
+            reverse = descending
+            if isinstance(column, str) and column.startswith("-"):
+                column, reverse = column[1:], not reverse
+            column = self._column(column)
+            order.append(column.desc() if reverse else column.asc())
+        return self._derive(sqlalchemy.select(self._wrapped).order_by(*order))
+
+    sort_values = sort
+
+    def head(self, n=5):
+        """The first ``n`` rows"""
+        return self._derive(*self._limited(n))
+
+    def count(self):
+        """Runs the query for its number of rows"""
+        counted = self.query
+        if self.limit is None:
+            counted = counted.order_by(None)  # some databases refuse it here
+        query = sqlalchemy.select(sqlalchemy.func.count()).select_from(
+            counted.subquery()
+        )
+        with querylog.logged(self.config, self._compiled(query), self.conn.name):
+            return self._execute(query).scalar()
+
+    def sql(self):
+        """The SQL that ``collect`` would run, as compiled for the connection"""
+        return self._compiled(self.query)
+
+    def _compiled(self, query):
+        return str(query.compile(dialect=self.conn.internal_connection.dialect))
+
+    def _execute(self, query):
+        try:
+            result = self.conn.internal_connection.execute(query, self.parameters)
+        except Exception:
+            self.conn.needs_rollback = True
+            raise
+        return result
+
+    def _fetch(self, limit=None):
+        query = self.query
+        if limit:
+            query, _ = self._limited(limit)
+        with querylog.logged(
+            self.config, self._compiled(query), self.conn.name
+        ) as execution:
+            resultset = ResultSet(self._execute(query), self.config)
+            execution["rows"] = len(resultset)
+        _commit(self.conn, self.config)
+        return resultset
+
+    def collect(self):
+        """Runs the query, returning a ``ResultSet`` (or DataFrame,
+        with ``autopandas`` or ``autopolars``)"""
+        return _output(self._fetch(self.config.autolimit), self.config)
+
+    def DataFrame(self, **kwargs):
+        """Runs the query, returning a pandas DataFrame"""
+        return self._fetch(self.config.autolimit).DataFrame(**kwargs)
+
+    def _preview(self):
+        """The rows to display, and a note if there are more
+
+        Only ``displaylimit`` rows (or ``PREVIEW_ROWS``, without one)
+        are fetched, and one more to tell if any are left out."""
+        shown = self.config.displaylimit or PREVIEW_ROWS
+        resultset = self._fetch(shown + 1)
+        if len(resultset) <= shown:
+            return resultset, ""
+        del resultset[shown:]
+        return resultset, "First %d rows; collect() fetches them all" % shown
+
+    def _repr_html_(self):
+        resultset, note = self._preview()
+        html = resultset._repr_html_()
+        if note:
+            html += '\n<span style="font-style:italic">%s</span>' % note
+        return html
+
+    def __str__(self):
+        resultset, note = self._preview()
+        return "%s\n%s" % (resultset, note) if note else str(resultset)
+
+    def __repr__(self):
+        return "<LazyResultSet of %s>" % ", ".join(self.columns)
+
+
+class GroupBy(object):
+    """Rows of a ``LazyResultSet`` grouped by some of its columns"""
+
+    def __init__(self, lazy, keys):
+        self.lazy = lazy
+        self.keys = keys
+
+    def agg(self, spec=None, **named):
+        """Aggregates each group, as for pandas' ``agg``
+
+        ``spec`` maps columns to an aggregate function name (or a list of
+        them), as in ``{"amount": "sum"}``; keyword arguments name their
+        result, as in ``total=("amount", "sum")``.  Functions are SQL's
+        (``sum``, ``min``, ``max``, ``count``, ``avg``...) or pandas'
+        (``mean``, ``size``, ``nunique``)."""
+        selected = list(self.keys)
+        for column, names in (spec or {}).items():
+            if isinstance(names, str):
+                labels = [(names, column)]
+            else:
+                labels = [(name, "%s_%s" % (column, name)) for name in names]
+            for name, label in labels:
+                selected.append(
+                    _aggregate(self.lazy._column(column), name).label(label)
+                )
+        for label, (column, name) in named.items():
+            selected.append(_aggregate(self.lazy._column(column), name).label(label))
+        return self.lazy._derive(sqlalchemy.select(*selected).group_by(*self.keys))
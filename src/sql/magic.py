@@ -13,15 +13,20 @@ from IPython.core.magic_arguments import argument, magic_arguments, parse_argstr
 from sqlalchemy.exc import OperationalError, ProgrammingError, DatabaseError
 
 import sql.connection
+import sql.federate
+import sql.lazy
+import sql.materialize
+import sql.parallel
 import sql.parse
+import sql.querylog
 import sql.run
 
 try:
     from traitlets.config.configurable import Configurable
-    from traitlets import Bool, Int, Unicode
+    from traitlets import Bool, Enum, Float, Int, Unicode
 except ImportError:
     from IPython.config.configurable import Configurable
-    from IPython.utils.traitlets import Bool, Int, Unicode
+    from IPython.utils.traitlets import Bool, Enum, Float, Int, Unicode
 try:
     from pandas.core.frame import DataFrame, Series
 except ImportError:
@@ -64,9 +69,35 @@ class SqlMagic(Magics, Configurable):
         config=True,
         help="Return Pandas DataFrames instead of regular result sets",
     )
+    autopolars = Bool(
+        False,
+        config=True,
+        help="Return polars DataFrames instead of regular result sets "
+             "(autopandas takes precedence)",
+    )
+    polars_lazy = Bool(
+        False, config=True, help="With autopolars, return polars LazyFrames"
+    )
+    typed_dataframes = Bool(
+        False,
+        config=True,
+        help="Give DataFrame columns compact dtypes (nullable integers, "
+             "categories, datetimes, Arrow strings) chosen from their values",
+    )
+    downcast_dataframes = Bool(
+        False,
+        config=True,
+        help="With typed_dataframes, store numbers in the smallest dtype that holds them",
+    )
     column_local_vars = Bool(
         False, config=True, help="Return data into local variables from column names"
     )
+    displaygrid = Bool(
+        False,
+        config=True,
+        help="Display results as a scrolling grid whose rows are sent from "
+             "the kernel as they come into view, rather than saved in the notebook",
+    )
     feedback = Bool(True, config=True, help="Print number of rows affected by DML")
     dsn_filename = Unicode(
         "odbc.ini",
@@ -77,6 +108,59 @@ class SqlMagic(Magics, Configurable):
              "matching section in the DSN file.",
     )
     autocommit = Bool(True, config=True, help="Set autocommit mode")
+    query_dataframes = Bool(
+        True,
+        config=True,
+        help="On DuckDB connections, query DataFrames and Arrow tables "
+             "in the namespace by name, without copying them",
+    )
+    query_cache_size = Int(
+        0,
+        config=True,
+        help="Cache the results of this many SELECTs per connection, "
+             "served again until their tables change (0 to turn off)",
+    )
+    query_log = Unicode(
+        "",
+        config=True,
+        help="Path of a SQLite file to record every statement run in, with its "
+             "duration, for --top-queries (empty to turn off)",
+    )
+    statement_timeout = Float(
+        None,
+        config=True,
+        allow_none=True,
+        help="Cancel statements running longer than this many seconds",
+    )
+    materialize_engine = Unicode(
+        "sqlite:///ipython_sql_{name}.db",
+        config=True,
+        help="Connect string of the local database for --materialize name, "
+             "with {name} standing for the name",
+    )
+    federation_engine = Unicode(
+        "sqlite://",
+        config=True,
+        help="SQLAlchemy connect string of the local database --federated "
+             "queries gather their tables into and run in",
+    )
+    fanout_concurrency = Int(
+        8,
+        config=True,
+        help="Most connections a --fanout query runs on at once",
+    )
+    in_list_threshold = Int(
+        1000,
+        config=True,
+        help="Lists bound with IN :name longer than this are loaded into a "
+             "temporary table rather than expanded into the SQL (0 to always expand)",
+    )
+    replica_routing = Enum(
+        ("round-robin", "least-latency"),
+        "round-robin",
+        config=True,
+        help="How reads choose among a connection's --replica-of replicas",
+    )
 
     def __init__(self, shell):
         Configurable.__init__(self, config=shell.config)
@@ -121,6 +205,126 @@ class SqlMagic(Magics, Configurable):
         help="specify dictionary of connection arguments to pass to SQL driver",
     )
     @argument("-f", "--file", type=str, help="Run SQL from file at this path")
+    @argument(
+        "--commit-every",
+        type=int,
+        help="with --file, run statements as they are read from the file, "
+        "committing after every this many",
+    )
+    @argument(
+        "--resume",
+        action="store_true",
+        help="with --file and --commit-every, skip the statements committed "
+        "before an earlier run of the file failed",
+    )
+    @argument(
+        "--transaction",
+        action="store_true",
+        help="run the cell's statements as one transaction; "
+        "with no SQL, begin a transaction that lasts until COMMIT or ROLLBACK",
+    )
+    @argument(
+        "--timeout",
+        type=float,
+        help="cancel statements running longer than this many seconds",
+    )
+    @argument(
+        "--sample",
+        type=str,
+        help="read only a random sample of each table: a percentage like 10%%, "
+        "or a number of rows",
+    )
+    @argument("--seed", type=int, help="make --sample repeatable")
+    @argument(
+        "--chunks",
+        type=int,
+        help="return a generator of result sets of at most this many rows each",
+    )
+    @argument(
+        "--alias",
+        type=str,
+        help="name the connection, so --federated queries can refer to "
+        "its tables as alias.schema.table",
+    )
+    @argument(
+        "--federated",
+        action="store_true",
+        help="run a SELECT joining tables from several aliased connections",
+    )
+    @argument(
+        "--partition-on",
+        type=str,
+        help="fetch a large SELECT as concurrent range queries on this "
+        "numeric or date column",
+    )
+    @argument(
+        "--partitions",
+        type=int,
+        default=4,
+        help="number of ranges for --partition-on (default 4)",
+    )
+    @argument(
+        "--partition-bounds",
+        type=str,
+        help="low,high range of the --partition-on column, as numbers or ISO "
+        "dates, datetimes or times, instead of querying its min and max",
+    )
+    @argument(
+        "--fanout",
+        type=str,
+        help="run on each of these comma-separated connections (aliases, "
+        "names or connect strings; * wildcards allowed) and combine the results",
+    )
+    @argument(
+        "--replica-of",
+        type=str,
+        help="register the connection as a read replica of this one "
+        "(an alias, name or connect string), which stays current",
+    )
+    @argument(
+        "--progressive",
+        action="store_true",
+        help="show the first rows as soon as they arrive, "
+        "while the rest are fetched in the background",
+    )
+    @argument(
+        "--materialize",
+        type=str,
+        help="copy the query's result into a local database table of this "
+        "name, opened as a connection with this alias",
+    )
+    @argument(
+        "--watermark",
+        type=str,
+        help="with --materialize, a column that only grows, so --refresh "
+        "fetches just the newer rows",
+    )
+    @argument(
+        "--refresh",
+        type=str,
+        help="bring the table saved with --materialize under this name up to date",
+    )
+    @argument(
+        "--incremental-on",
+        type=str,
+        help="with result << SELECT ..., fetch only rows whose value in this "
+        "ever-growing column is above those already in result, and add them to it",
+    )
+    @argument(
+        "--lazy",
+        action="store_true",
+        help="return a query object whose filter, select, groupby, sort and "
+        "head run in the database, fetching rows only on display or collect()",
+    )
+    @argument(
+        "--top-queries",
+        type=int,
+        nargs="?",
+        const=10,
+        metavar="N",
+        help="list the N (default 10) queries in the query_log taking the most "
+        "time, with their p50, p95 and p99 latencies",
+    )
     def execute(self, line="", cell="", local_ns=None):
         """Runs SQL statement against a database, specified by SQLAlchemy connect string.
 
@@ -156,6 +360,13 @@ class SqlMagic(Magics, Configurable):
             return sql.connection.Connection.connections
         elif args.close:
             return sql.connection.Connection.close(args.close)
+        elif args.top_queries is not None:
+            if not self.query_log:
+                raise ValueError(
+                    "Set %config SqlMagic.query_log to a file path to log queries"
+                )
+            keys, rows = sql.querylog.top(self.query_log, args.top_queries)
+            return sql.run.ResultSet(sql.run.FakeResultProxy(rows, keys), self)
 
         # save globals and locals, so they can be referenced in bind vars
         user_ns = self.shell.user_ns.copy()
@@ -163,7 +374,9 @@ class SqlMagic(Magics, Configurable):
 
         command_text = " ".join(args.line) + "\n" + cell
 
-        if args.file:
+        if args.resume and not (args.file and args.commit_every):
+            raise ValueError("--resume needs --file and --commit-every")
+        if args.file and not args.commit_every:
             with open(args.file, "r") as infile:
                 command_text = infile.read() + "\n" + command_text
 
@@ -199,8 +412,22 @@ class SqlMagic(Magics, Configurable):
                 connect_args=args.connection_arguments,
                 creator=args.creator,
             )
-            # Rollback just in case there was an error in previous statement
-            conn.internal_connection.rollback()
+            for other in [conn] + conn.replicas:
+                other.wait()
+            # Clear out the transaction an earlier failed statement left behind.
+            # Dialects we can't commit on never end their transactions otherwise.
+            if conn.needs_rollback or not (conn.can_commit or conn.in_transaction):
+                conn.rollback()
+            if args.alias:
+                conn.alias = args.alias
+            if args.replica_of:
+                primary = sql.connection.Connection.find(args.replica_of)
+                if primary is None:
+                    raise sql.connection.ConnectionError(
+                        "No connection %s to be a replica of" % args.replica_of
+                    )
+                primary.add_replica(conn)
+                sql.connection.Connection.current = conn = primary
         except Exception:
             print(traceback.format_exc())
             print(sql.connection.Connection.tell_format())
@@ -212,15 +439,100 @@ class SqlMagic(Magics, Configurable):
         if args.append:
             return self._persist_dataframe(parsed["sql"], conn, user_ns, append=True)
 
-        if not parsed["sql"]:
+        if args.refresh:
+            return sql.materialize.refresh(args.refresh, self, user_ns)
+
+        streaming = args.file and args.commit_every
+        if streaming and parsed["sql"].strip():
+            raise ValueError(
+                "--commit-every runs only the --file; run other SQL in another cell"
+            )
+
+        if not parsed["sql"] and not streaming:
+            if args.transaction:
+                conn.begin()
+                return "Transaction started on %s" % conn.name
             return
 
+        if args.chunks:
+            result = sql.run.iter_batches(
+                conn, parsed["sql"], self, user_ns, args.chunks
+            )
+            if parsed["result_var"]:
+                result_var = parsed["result_var"]
+                print("Returning data to local variable {}".format(result_var))
+                self.shell.user_ns.update({result_var: result})
+                return None
+            return result
+
         try:
-            result = sql.run.run(conn, parsed["sql"], self, user_ns)
+            if streaming:
+                return sql.run.run_file(
+                    conn,
+                    args.file,
+                    self,
+                    user_ns,
+                    args.commit_every,
+                    resume=args.resume,
+                )
+            if args.materialize:
+                return sql.materialize.materialize(
+                    conn,
+                    parsed["sql"],
+                    self,
+                    user_ns,
+                    args.materialize,
+                    watermark=args.watermark,
+                )
+            elif args.incremental_on:
+                if not parsed["result_var"]:
+                    raise ValueError(
+                        "--incremental-on needs a result variable: "
+                        "%sql --incremental-on column result << SELECT ..."
+                    )
+                result = sql.run.incremental(
+                    conn,
+                    parsed["sql"],
+                    self,
+                    user_ns,
+                    self.shell.user_ns.get(parsed["result_var"]),
+                    args.incremental_on,
+                    timeout=args.timeout,
+                )
+            elif args.lazy:
+                result = sql.lazy.run(conn, parsed["sql"], self, user_ns)
+            elif args.federated:
+                result = sql.federate.run(parsed["sql"], self, user_ns)
+            elif args.fanout:
+                result = sql.parallel.fanout(
+                    parsed["sql"], self, user_ns, args.fanout
+                )
+            elif args.partition_on:
+                result = sql.parallel.run(
+                    conn,
+                    parsed["sql"],
+                    self,
+                    user_ns,
+                    args.partition_on,
+                    args.partitions,
+                    bounds=args.partition_bounds,
+                )
+            else:
+                result = sql.run.run(
+                    conn,
+                    parsed["sql"],
+                    self,
+                    user_ns,
+                    timeout=args.timeout,
+                    transaction=args.transaction,
+                    sample=args.sample,
+                    seed=args.seed,
+                    progressive=args.progressive,
+                )
 
             if (
                 result is not None
-                and not isinstance(result, str)
+                and not isinstance(result, (str, sql.lazy.LazyResultSet))
                 and self.column_local_vars
             ):
                 # Instead of returning values, set variables directly in the
@@ -228,9 +540,17 @@ class SqlMagic(Magics, Configurable):
 
                 if self.autopandas:
                     keys = result.keys()
+                elif self.autopolars:
+                    if self.polars_lazy:
+                        result = result.collect()
+                    keys = result.columns
+                    result = result.to_dict()
                 else:
                     keys = result.keys
-                    result = result.dict()
+                    try:
+                        result = result.arrays()
+                    except ImportError:
+                        result = result.dict()
 
                 if self.feedback:
                     print(
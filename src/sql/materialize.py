@@ -0,0 +1,176 @@
+"""
+Local copies of remote results, for fast repeated querying.
+
+``--materialize name`` streams a query's result from the current
+connection into table ``name`` of a local database file (SQLite, or
+DuckDB), opened as a connection with alias ``name``.  A metadata table
+there records where each materialized table came from, so
+``--refresh name`` can fetch it again - or, given a ``--watermark``
+column, fetch only the rows newer than those already copied.
+"""
+
+import datetime
+import re
+
+import sqlalchemy
+
+from .connection import Connection, ConnectionError
+from .run import _commit, _load_rows
+
+# rows moved from the source to the local database at a time
+BATCH_SIZE = 10000
+
+METADATA_TABLE = "ipython_sql_materialized"
+
+_SUBQUERY = "ipython_sql_refresh"
+
+_metadata = sqlalchemy.MetaData()
+_materialized = sqlalchemy.Table(
+    METADATA_TABLE,
+    _metadata,
+    sqlalchemy.Column("name", sqlalchemy.Text, primary_key=True),
+    sqlalchemy.Column("source", sqlalchemy.Text),
+    sqlalchemy.Column("query", sqlalchemy.Text),
+    sqlalchemy.Column("watermark_column", sqlalchemy.Text),
+    sqlalchemy.Column("materialized_at", sqlalchemy.DateTime),
+    sqlalchemy.Column("refreshed_at", sqlalchemy.DateTime),
+    sqlalchemy.Column("rows", sqlalchemy.BigInteger),
+)
+
+
+def local_connection(name, config):
+    """The local connection holding materialized table ``name``
+
+    Opened from ``config.materialize_engine``, in which ``{name}`` stands
+    for ``name``, and given alias ``name``."""
+    if not re.match(r"^\w+$", name):
+        raise ValueError(
+            "Materialized table names must be letters, digits and _, not %r" % name
+        )
+    url = config.materialize_engine.format(name=name)
+    current = Connection.current
+    try:
+        local = Connection.set(url, displaycon=False)
+    finally:
+        Connection.current = current  # the source stays current
+    local.alias = name
+    _metadata.create_all(local.internal_connection)
+    return local
+
+
+def _stream(conn, query, parameters):
+    return conn.internal_connection.execution_options(stream_results=True).execute(
+        sqlalchemy.text(query), parameters
+    )
+
+
+def materialize(conn, sql, config, user_namespace, name, watermark=None):
+    """Copies the result of ``sql`` on ``conn`` into local table ``name``
+
+    Replaces any earlier table of that name.  ``watermark``, a column of
+    the result that only grows (a timestamp or serial id), lets
+    ``refresh`` fetch just the new rows later.  Returns a message
+    saying where the table is."""
+    local = local_connection(name, config)
+    query = sql.strip().rstrip(";")
+    started = datetime.datetime.now()
+    try:
+        result = _stream(conn, query, user_namespace)
+        try:
+            if watermark is not None and watermark not in result.keys():
+                raise ValueError("Watermark column %s is not in the result" % watermark)
+            _drop(local, name)
+            _, rows = _load_rows(result, local.internal_connection, name, BATCH_SIZE)
+        finally:
+            result.close()
+    except Exception:
+        conn.needs_rollback = True
+        local.needs_rollback = True
+        raise
+    _commit(conn, config)
+    local.internal_connection.execute(
+        _materialized.delete().where(_materialized.c.name == name)
+    )
+    local.internal_connection.execute(
+        _materialized.insert().values(
+            name=name,
+            source=repr(conn.url),
+            query=query,
+            watermark_column=watermark,
+            materialized_at=started,
+            refreshed_at=started,
+            rows=rows,
+        )
+    )
+    local.internal_connection.commit()
+    return "%d rows materialized into %s on %s" % (rows, name, local.url)
+
+
+def refresh(name, config, user_namespace):
+    """Brings local table ``name`` up to date with its source query
+
+    With a watermark column, fetches only the rows above the highest
+    value already copied; otherwise, fetches everything again.  The
+    source connection must be open.  Returns a message saying how many
+    rows were fetched."""
+    local = Connection.aliases().get(name) or local_connection(name, config)
+    entry = (
+        local.internal_connection.execute(
+            _materialized.select().where(_materialized.c.name == name)
+        )
+        .mappings()
+        .first()
+    )
+    if entry is None:
+        raise ValueError("No materialized table %s on %s" % (name, local.url))
+    conn = Connection.find(entry["source"])
+    if conn is None:
+        raise ConnectionError(
+            "Connect to %s to refresh %s from it" % (entry["source"], name)
+        )
+    if entry["watermark_column"] is None:
+        message = materialize(conn, entry["query"], config, user_namespace, name)
+        return message.replace("materialized into", "refreshed in")
+
+    table = sqlalchemy.Table(
+        name, sqlalchemy.MetaData(), autoload_with=local.internal_connection
+    )
+    column = entry["watermark_column"]
+    highest = local.internal_connection.execute(
+        sqlalchemy.select(sqlalchemy.func.max(table.c[column]))
+    ).scalar()
+    query, parameters = entry["query"], dict(user_namespace)
+    if highest is not None:
+        query = "SELECT * FROM (%s) AS %s WHERE %s > :ipython_sql_watermark" % (
+            query,
+            _SUBQUERY,
+            column,
+        )
+        parameters["ipython_sql_watermark"] = highest
+    started = datetime.datetime.now()
+    try:
+        result = _stream(conn, query, parameters)
+        try:
+            _, rows = _load_rows(
+                result, local.internal_connection, name, BATCH_SIZE, table=table
+            )
+        finally:
+            result.close()
+    except Exception:
+        conn.needs_rollback = True
+        local.needs_rollback = True
+        raise
+    _commit(conn, config)
+    local.internal_connection.execute(
+        _materialized.update()
+        .where(_materialized.c.name == name)
+        .values(refreshed_at=started, rows=_materialized.c.rows + rows)
+    )
+    local.internal_connection.commit()
+    return "%d new rows refreshed in %s on %s" % (rows, name, local.url)
+
+
+def _drop(local, name):
+    sqlalchemy.Table(name, sqlalchemy.MetaData()).drop(
+        local.internal_connection, checkfirst=True
+    )
@@ -0,0 +1,385 @@
+"""
+Running SQL concurrently:
+
+* partitioned fetches, where one SELECT is split into ranges of a
+  column and the ranges fetched each over its own pooled connection
+* fan-out, where the same SQL runs on many connections (shards) at
+  once and their results are combined
+"""
+
+import concurrent.futures
+import datetime
+import decimal
+import fnmatch
+import time
+
+import sqlalchemy
+
+from . import querylog
+from .connection import Connection
+from .parse import split_statements
+from .rewrite import _end_of_sql, add_limit, parse
+from .run import (
+    FakeResultProxy,
+    ResultSet,
+    _commit,
+    _execute,
+    _known_rowcount,
+    _output,
+    _thread_bound,
+)
+
+_SUBQUERY = "ipython_sql_partition"
+
+
+# what partition bounds may be, tried in turn
+_BOUND_KINDS = (
+    int,
+    float,
+    datetime.date.fromisoformat,
+    datetime.datetime.fromisoformat,
+    datetime.time.fromisoformat,
+)
+
+
+def parse_bounds(spec):
+    """Parses ``--partition-bounds`` of the form ``"low,high"``
+
+    The bounds are numbers, or ISO dates, datetimes or times."""
+    try:
+        low, high = (part.strip() for part in spec.split(","))
+        for kind in _BOUND_KINDS:
+            try:
+                return kind(low), kind(high)
+            except ValueError:
+                pass
+    except ValueError:
+        pass
+    raise ValueError(
+        "Partition bounds must be two numbers, dates or times like 0,1000 "
+        "or 2024-01-01,2024-12-31, not %r" % spec
+    )
+
+
+def partition_starts(low, high, partitions):
+    """The lower bounds of up to ``partitions`` equal ranges spanning low..high
+
+    Works for numbers, dates and times."""
+    if isinstance(low, bool) or not isinstance(
+        low, (int, float, decimal.Decimal, datetime.date, datetime.time)
+    ):
+        raise ValueError(
+            "Can only partition on numeric or date/time columns, not %s"
+            % type(low).__name__
+        )
+    if isinstance(low, int):
+        step = max(1, -(-(high - low + 1) // partitions))  # rounded up
+        return list(range(low, high + 1, step))
+    if isinstance(low, datetime.time):
+        # times can't be subtracted, but the same times on any one day can
+        day = datetime.date.min
+        starts = partition_starts(
+            datetime.datetime.combine(day, low),
+            datetime.datetime.combine(day, high),
+            partitions,
+        )
+        return [start.timetz() for start in starts]
+    step = (high - low) / partitions
+    starts = []
+    for n in range(partitions):
+        start = low + step * n
+        if start not in starts:
+            starts.append(start)
+    return starts
+
+
+def _range_queries(statement, column, starts):
+    """``(query, parameters)`` for each range beginning at one of ``starts``
+
+    The first range also takes NULLs and anything below the first
+    start, and the last anything above the last, so together they
+    cover every row."""
+    if len(starts) < 2:
+        return [(statement, {})]
+    template = "SELECT * FROM (%s) AS %s WHERE %%s" % (statement, _SUBQUERY)
+    queries = [
+        (
+            template % ("%s < :ipython_sql_stop OR %s IS NULL" % (column, column)),
+            {"ipython_sql_stop": starts[1]},
+        )
+    ]
+    for start, stop in zip(starts[1:-1], starts[2:]):
+        queries.append(
+            (
+                template
+                % (
+                    "%s >= :ipython_sql_start AND %s < :ipython_sql_stop"
+                    % (column, column)
+                ),
+                {"ipython_sql_start": start, "ipython_sql_stop": stop},
+            )
+        )
+    queries.append(
+        (
+            template % ("%s >= :ipython_sql_start" % column),
+            {"ipython_sql_start": starts[-1]},
+        )
+    )
+    return queries
+
+
+def _fetch(connection, query, parameters):
+    result = connection.execute(sqlalchemy.text(query), parameters)
+    return list(result.keys()), result.fetchall()
+
+
+def _fetch_pooled(engine, query, parameters):
+    with engine.connect() as connection:
+        return _fetch(connection, query, parameters)
+
+
+def _shares_data(conn, config):
+    """Would other connections from ``conn``'s pool see the same data?
+
+    Not for in-memory databases, nor while changes may be uncommitted."""
+    url = conn.internal_connection.engine.url
+    return (
+        url.database not in (None, "", ":memory:")
+        and not url.database.startswith("file::memory:")
+        and config.autocommit
+        and not conn.in_transaction
+    )
+
+
+def _workers(engine, partitions):
+    """How many partitions can run at once without waiting on the pool"""
+    pool = engine.pool
+    if hasattr(pool, "size") and hasattr(pool, "_max_overflow"):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        return max(1, min(partitions, capacity - pool.checkedout()))
+    return partitions
+
+
+def run(conn, sql, config, user_namespace, column, partitions, bounds=None):
+    """Runs SELECT ``sql`` as ``partitions`` range queries on ``column``
+
+    The range of ``column`` is discovered with ``min``/``max`` unless
+    ``bounds`` (``"low,high"``) are given.  The ranges are fetched
+    concurrently over separate connections from ``conn``'s pool, and
+    assembled into one ``ResultSet`` (or DataFrame), in order of
+    ``column`` ranges.  In-memory databases, and connections with
+    uncommitted changes, fetch the ranges one after another instead.
+    """
+    if partitions < 1:
+        raise ValueError("--partitions must be a positive number")
+    statements = parse(sql)
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        raise ValueError("Only a single SELECT statement can be partitioned")
+    statement = str(statements[0])[: _end_of_sql(statements[0])]
+
+    execution = querylog.begin(statement, conn.name)
+    try:
+        if bounds:
+            low, high = parse_bounds(bounds)
+        else:
+            _, ((low, high),) = _fetch(
+                conn.internal_connection,
+                "SELECT min(%s), max(%s) FROM (%s) AS %s"
+                % (column, column, statement, _SUBQUERY),
+                user_namespace,
+            )
+        if low is None:
+            starts = []
+        else:
+            starts = partition_starts(low, high, partitions)
+        queries = [
+            (query, dict(user_namespace, **parameters))
+            for query, parameters in _range_queries(statement, column, starts)
+        ]
+
+        if _shares_data(conn, config) and len(queries) > 1:
+            engine = conn.internal_connection.engine
+            with concurrent.futures.ThreadPoolExecutor(
+                _workers(engine, len(queries))
+            ) as executor:
+                fetched = list(
+                    executor.map(lambda query: _fetch_pooled(engine, *query), queries)
+                )
+        else:
+            fetched = [_fetch(conn.internal_connection, *query) for query in queries]
+    except Exception as ex:
+        querylog.fail([execution], ex)
+        conn.needs_rollback = True
+        querylog.log(config, [execution])
+        raise
+    _commit(conn=conn, config=config)
+
+    keys = fetched[0][0]
+    rows = [row for _, partition in fetched for row in partition]
+    # logged once, as the user's statement, for all the partitions
+    querylog.finish(execution, len(rows))
+    querylog.log(config, [execution])
+    if config.feedback:
+        print("%d rows fetched in %d partitions." % (len(rows), len(fetched)))
+    resultset = ResultSet(FakeResultProxy(rows, keys), config)
+    return _output(resultset, config)
+
+
+def resolve_connections(spec):
+    """The connections named by ``spec``, a comma-separated list of patterns
+
+    Each pattern is matched, with ``*`` and ``?`` wildcards, against
+    connection aliases, ``user@db`` names and connect strings."""
+    found = []
+    for pattern in (part.strip() for part in spec.split(",")):
+        if not pattern:
+            continue
+        matched = [
+            conn
+            for key, conn in sorted(Connection.connections.items())
+            if any(
+                fnmatch.fnmatchcase(label, pattern)
+                for label in (conn.alias or "", conn.name, key)
+            )
+        ]
+        if not matched:
+            raise ValueError(
+                "No connection matches %r; connections are: %s"
+                % (pattern, ", ".join(sorted(Connection.connections)))
+            )
+        found.extend(conn for conn in matched if conn not in found)
+    return found
+
+
+class Shard(object):
+    """The outcome of running fan-out SQL on one connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.source = conn.alias or conn.name
+        self.keys = None  # None if the last statement returned no rows
+        self.rows = []
+        self.rowcount = -1
+        self.seconds = 0.0
+        self.error = None
+        self.executions = []  # for the query log
+
+    def __repr__(self):
+        if self.error is not None:
+            return "<Shard %s: %s>" % (self.source, self.error)
+        return "<Shard %s: %d rows in %.2fs>" % (
+            self.source,
+            len(self.rows),
+            self.seconds,
+        )
+
+
+def _run_shard(shard, statements, config, user_namespace):
+    """Runs ``statements`` on ``shard.conn``, recording rather than raising errors"""
+    started = time.time()
+    conn = shard.conn
+    try:
+        for statement in statements:
+            execution = querylog.begin(statement, conn.name)
+            shard.executions.append(execution)
+            result = _execute(
+                conn,
+                statement,
+                user_namespace,
+                in_list_threshold=config.in_list_threshold,
+                autocommit=config.autocommit,
+            )
+            querylog.finish(execution, _known_rowcount(result))
+        if result.returns_rows:
+            shard.keys = list(result.keys())
+            shard.rows = result.fetchall()
+            querylog.finish(execution, len(shard.rows))
+        shard.rowcount = result.rowcount
+        _commit(conn=conn, config=config)
+    except Exception as ex:
+        shard.error = ex
+        querylog.fail(shard.executions, ex)
+        try:
+            conn.rollback()
+        except Exception:
+            conn.needs_rollback = True
+    shard.seconds = time.time() - started
+    return shard
+
+
+def fanout(sql, config, user_namespace, spec):
+    """Runs ``sql`` on each connection matching ``spec``, concurrently
+
+    At most ``config.fanout_concurrency`` connections run at once
+    (in-memory SQLite databases run in this thread, as they must).
+    Returns one ``ResultSet`` (or DataFrame) of the last statement's
+    rows from every connection, each prefixed with a ``source`` column
+    naming its connection by alias or ``user@db``; for statements
+    returning no rows, one row per connection with its row count.
+
+    The ``ResultSet``'s ``shards`` lists each connection's rows, time
+    taken and any error; with ``feedback``, these are printed too.
+    A failure on one connection doesn't stop the others, but if all of
+    them fail, the first error is raised.
+    """
+    shards = [Shard(conn) for conn in resolve_connections(spec)]
+    for shard in shards:
+        shard.conn.wait()  # for any result still being fetched on it
+    workers = max(1, min(len(shards), config.fanout_concurrency or len(shards)))
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        here = []
+        for shard in shards:
+            dialect = shard.conn.dialect.name
+            shard_statements = list(split_statements(sql, dialect))
+            if config.autolimit:
+                shard_statements[-1] = (
+                    add_limit(shard_statements[-1], config.autolimit, dialect)
+                    or shard_statements[-1]
+                )
+            job = (shard, shard_statements, config, user_namespace)
+            if _thread_bound(shard.conn):
+                here.append(job)
+            else:
+                executor.submit(_run_shard, *job)
+        for job in here:
+            _run_shard(*job)
+    querylog.log(config, [e for shard in shards for e in shard.executions])
+
+    succeeded = [shard for shard in shards if shard.error is None]
+    if not succeeded:
+        raise shards[0].error
+    keys = next((shard.keys for shard in succeeded if shard.keys is not None), None)
+    for shard in succeeded:
+        if keys is not None and shard.keys != keys:
+            shard.error = ValueError("returned columns %s, not %s" % (shard.keys, keys))
+            shard.rows = []
+    if keys is None:
+        keys = ["rowcount"]
+        rows = [(shard.source, shard.rowcount) for shard in succeeded]
+    else:
+        rows = [
+            (shard.source,) + tuple(row)
+            for shard in shards
+            if shard.error is None
+            for row in shard.rows
+        ]
+    if config.feedback:
+        for shard in shards:
+            if shard.error is not None:
+                print(
+                    "%s: failed after %.2fs: %s"
+                    % (shard.source, shard.seconds, shard.error)
+                )
+            elif shard.keys is None:
+                print(
+                    "%s: %d rows affected in %.2fs"
+                    % (shard.source, shard.rowcount, shard.seconds)
+                )
+            else:
+                print(
+                    "%s: %d rows in %.2fs"
+                    % (shard.source, len(shard.rows), shard.seconds)
+                )
+    resultset = ResultSet(FakeResultProxy(rows, ["source"] + keys), config)
+    resultset.shards = shards
+    return _output(resultset, config)
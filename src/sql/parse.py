@@ -1,4 +1,7 @@
+import functools
+import io
 import itertools
+import re
 import shlex
 from os.path import expandvars
 
@@ -89,3 +92,271 @@ def without_sql_comment(parser, line):
         shlex.split(line, posix=False),
     )
     return " ".join(result)
+
+
+# the starts of quoted strings and comments, and statement terminators
+_SQL_SPECIAL = re.compile(r"""'|"|`|--|/\*|\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$|;""")
+_NON_SPACE = re.compile(r"\S")
+_QUOTE_ENDS = {"'": "'", '"': '"', "`": "`", "--": "\n", "/*": "*/"}
+# the rest of a quoted string in which a backslash escapes the next character
+_ESCAPED_STRINGS = {
+    "'": re.compile(r"[^'\\]*(?:\\.[^'\\]*)*'", re.DOTALL),
+    '"': re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL),
+}
+
+# SQLAlchemy dialects whose quoted strings follow the SQL standard, taking
+# a backslash as itself (but for PostgreSQL's E'...' strings); the others,
+# as MySQL, take it as an escape
+STANDARD_STRING_DIALECTS = ("postgresql", "sqlite", "duckdb", "oracle", "mssql")
+
+# words opening and closing blocks whose semicolons don't end the statement,
+# as in trigger bodies; END IF, END LOOP and the like close no such block
+_BLOCK_WORDS = re.compile(
+    r"\b(BEGIN|CASE|END)\b(?:\s+(IF|LOOP|WHILE|REPEAT|FOR|CASE)\b)?", re.IGNORECASE
+)
+
+# the start of a statement defining a routine, whose body is a block
+_BLOCK_HEADER = re.compile(
+    r"\s*(?:DECLARE\b|CREATE(?:\s+OR\s+REPLACE)?"
+    r"(?:\s+DEFINER\s*=\s*[^\s@]+(?:\s*@\s*\S+)?)?"
+    r"(?:\s+(?:TEMP|TEMPORARY|CONSTRAINT|AGGREGATE|EDITIONABLE|NONEDITIONABLE))?"
+    r"\s+(?:TRIGGER|PROCEDURE|FUNCTION|PACKAGE|EVENT)\b)",
+    re.IGNORECASE,
+)
+
+# how much of a statement's start to keep for matching ``_BLOCK_HEADER``
+_HEADER_SIZE = 256
+
+# what may follow a BEGIN that starts a transaction rather than a block
+_BEGIN_TRANSACTION = re.compile(
+    r"\s*(?:$|(?:TRANSACTION|TRAN|WORK|DEFERRED|IMMEDIATE|EXCLUSIVE"
+    r"|ISOLATION|READ)\b)",
+    re.IGNORECASE,
+)
+
+# characters read from a script at a time
+CHUNK_SIZE = 1 << 16
+
+
+def _closing(buffer, token, start, escapes):
+    """Where the quote or comment opened by ``token`` ends, searching from
+    ``start``; -1 if it doesn't end within ``buffer``"""
+    if escapes and token in _ESCAPED_STRINGS:
+        found = _ESCAPED_STRINGS[token].match(buffer, start)
+        return found.end() - 1 if found else -1
+    return buffer.find(_QUOTE_ENDS.get(token, token), start)
+
+
+def _escape_string(buffer, quote, start):
+    """Whether the quote at ``quote`` opens a PostgreSQL ``E'...'`` string"""
+    return (
+        quote > start
+        and buffer[quote - 1] in "eE"
+        and (quote - 1 == start or not re.match(r"\w", buffer[quote - 2]))
+    )
+
+
+def iter_statements(infile, chunk_size=CHUNK_SIZE, dialect=None):
+    """Yields ``(statement, line_number)`` for each statement in a SQL file
+
+    Reads ``infile`` a chunk at a time, so statements can be run while
+    the rest of a huge script is still unread.  Statements end at
+    semicolons outside quoted strings (with ``''`` escapes, and
+    backslash escapes unless ``dialect`` is one of
+    ``STANDARD_STRING_DIALECTS``), quoted
+    identifiers, ``$tag$`` dollar quotes and comments; ``\\`` meta-
+    commands like ``\\d`` end at the end of their line.  Statements of
+    nothing but comments are skipped.  ``line_number`` is the line the
+    statement starts on.  Semicolons within ``BEGIN ... END`` blocks
+    and ``CASE ... END`` don't end a statement, where the statement is
+    made of blocks: one defining a trigger, procedure or function, one
+    starting ``DECLARE``, or one starting ``BEGIN`` - though ``BEGIN``
+    alone, or followed by ``TRANSACTION`` and the like, starts a
+    transaction rather than a block.  Elsewhere, as in ``SELECT 1 AS
+    begin``, these words are only names.
+    """
+    backslashes = dialect not in STANDARD_STRING_DIALECTS
+    buffer = ""
+    eof = False
+    start = pos = 0  # of the current statement, and of the scan within it
+    line = 1  # of ``start``
+    has_code = False
+    head = ""  # the statement's start, outside strings and comments
+    block = None  # whether it is made of blocks, once that is known
+    depth = 0  # of BEGIN ... END blocks
+
+    def more():
+        chunk = infile.read(chunk_size)
+        return chunk, not chunk
+
+    while True:
+        if not has_code:
+            # skip whitespace, noting where the statement begins
+            code = _NON_SPACE.search(buffer, pos)
+            stripped = code.start() if code else len(buffer)
+            if stripped == len(buffer) and not eof:
+                chunk, eof = more()
+                buffer += chunk
+                continue
+            if pos == start:
+                line += buffer.count("\n", start, stripped)
+                start = pos = stripped
+            if buffer.startswith("\\", pos) and pos == start:
+                end = buffer.find("\n", pos)
+                if end < 0 and not eof:
+                    chunk, eof = more()
+                    buffer += chunk
+                    continue
+                end = len(buffer) if end < 0 else end
+                yield buffer[start:end].strip(), line
+                start = pos = end
+                continue
+        match = _SQL_SPECIAL.search(buffer, pos)
+        if match is None or (match.end() >= len(buffer) - 1 and not eof):
+            # a token may straddle the chunk boundary; read on
+            if eof:
+                if has_code or buffer[pos:].strip():
+                    yield buffer[start:].strip(), line
+                return
+            if start > chunk_size:
+                buffer, pos = buffer[start:], pos - start
+                start = 0
+            chunk, eof = more()
+            buffer += chunk
+            continue
+        code = buffer[pos : match.start()]
+        for word in _BLOCK_WORDS.finditer(code):
+            opening, closed = word.group(1).upper(), word.group(2)
+            if block is None:
+                before = head + code[: word.start()]
+                if before.strip():
+                    block = bool(_BLOCK_HEADER.match(before))
+                else:
+                    block = opening == "BEGIN" and not _BEGIN_TRANSACTION.match(
+                        code, word.end()
+                    )
+            if not block:
+                break
+            if opening == "END":
+                if closed is None or closed.upper() == "CASE":
+                    depth = max(0, depth - 1)
+            else:
+                depth += 1
+        if block is None and len(head) < _HEADER_SIZE:
+            head += code
+        if code.strip():
+            has_code = True
+        token = match.group()
+        if token == ";" and depth:
+            pos = match.end()
+            continue
+        if token == ";":
+            if has_code:
+                yield buffer[start : match.end()].strip(), line
+            line += buffer.count("\n", start, match.end())
+            start = pos = match.end()
+            has_code = False
+            head, block, depth = "", None, 0
+            continue
+        closing = _QUOTE_ENDS.get(token, token)
+        escapes = backslashes or (
+            token == "'" and _escape_string(buffer, match.start(), start)
+        )
+        end = _closing(buffer, token, match.end(), escapes)
+        while token == "'" and end >= 0 and buffer.startswith("''", end):
+            end = _closing(buffer, token, end + 2, escapes)  # a doubled quote
+        if end < 0 or (token == "'" and end == len(buffer) - 1 and not eof):
+            if eof:
+                end = len(buffer)  # unterminated; the rest belongs to it
+            else:
+                chunk, eof = more()
+                buffer += chunk
+                continue
+        if token not in ("--", "/*") or buffer.startswith("/*!", match.start()):
+            has_code = True  # a string, or one of MySQL's executable comments
+            if block is None and len(head) < _HEADER_SIZE:
+                head += " ? "
+        pos = end + len(closing)
+
+
+# results of ``split_statements`` kept for cells run again
+SPLIT_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=SPLIT_CACHE_SIZE)
+def split_statements(sql, dialect=None):
+    """The statements in ``sql``, as a tuple of strings
+
+    A faster ``sqlparse.split``, with the same rules as
+    ``iter_statements`` for the SQLAlchemy ``dialect`` named.  Results
+    are cached, as the same cell is often run again."""
+    return tuple(
+        found for found, _ in iter_statements(io.StringIO(sql), dialect=dialect)
+    )
+
+
+_LEADING_COMMENTS = re.compile(r"(?:\s+|--[^\n]*(?:\n|$)|/\*(?!!).*?\*/)*", re.DOTALL)
+
+
+def without_leading_comments(statement):
+    """``statement`` without the whitespace and comments it starts with"""
+    return statement[_LEADING_COMMENTS.match(statement).end() :]
+
+
+_KINDS = {
+    "SELECT": ("SELECT", "VALUES", "TABLE", "SHOW", "EXPLAIN", "DESCRIBE", "DESC"),
+    "DML": ("INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "REPLACE", "COPY"),
+    "DDL": (
+        "CREATE",
+        "ALTER",
+        "DROP",
+        "TRUNCATE",
+        "RENAME",
+        "COMMENT",
+        "GRANT",
+        "REVOKE",
+    ),
+    "TRANSACTION": (
+        "BEGIN",
+        "START",
+        "COMMIT",
+        "END",
+        "ROLLBACK",
+        "ABORT",
+        "SAVEPOINT",
+        "RELEASE",
+    ),
+}
+_KIND_OF = dict((word, kind) for kind, words in _KINDS.items() for word in words)
+
+# in a WITH statement, the words or brackets outside any string, and
+# the words that begin the statement after the WITH clause
+_WITH_TOKENS = re.compile(r"""'(?:[^']|'')*'|"[^"]*"|[()]|\w+""")
+_WITH_VERBS = ("SELECT", "INSERT", "UPDATE", "DELETE", "MERGE")
+
+
+def statement_kind(statement):
+    """What kind of statement ``statement`` is, by its first word
+
+    One of ``"SELECT"`` (including ``VALUES``, ``SHOW``, ``EXPLAIN``
+    and the like), ``"DML"``, ``"DDL"``, ``"TRANSACTION"``, ``"META"``
+    (a ``\\``-command) or ``"OTHER"``.  Statements starting with a
+    ``WITH`` clause are classed by the statement after it."""
+    statement = without_leading_comments(statement).lstrip("(")
+    if statement.startswith("\\"):
+        return "META"
+    first = re.match(r"\w+", statement)
+    if first is None:
+        return "OTHER"
+    word = first.group().upper()
+    if word == "WITH":
+        depth = 0
+        for token in _WITH_TOKENS.findall(statement, first.end()):
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif depth == 0 and token.upper() in _WITH_VERBS:
+                return _KIND_OF[token.upper()]
+        return "OTHER"
+    return _KIND_OF.get(word, "OTHER")
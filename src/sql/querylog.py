@@ -0,0 +1,265 @@
+"""
+A persistent log of the statements run, for finding the slow ones.
+
+With ``SqlMagic.query_log`` set to a file path, every statement
+``%sql`` executes is recorded in a SQLite database there: its
+fingerprint, the connection it ran on, how long it took, how many
+rows (and, for results, roughly how many bytes) it produced, and the
+error it failed with, if it did.  The fingerprint is the statement with
+its literals replaced by ``?``, so ``WHERE id = 1`` and ``WHERE id = 2``
+are counted together.
+
+The log outlives the session, so ``%sql --top-queries`` ranks queries
+by the time spent on them over every session that shared the file,
+with the median, 95th and 99th percentile of their latencies.
+"""
+
+import contextlib
+import datetime
+import hashlib
+import re
+import time
+
+import sqlalchemy
+from sqlparse import tokens as T
+
+from .rewrite import _lex
+
+LOG_TABLE = "ipython_sql_query_log"
+
+_metadata = sqlalchemy.MetaData()
+_log = sqlalchemy.Table(
+    LOG_TABLE,
+    _metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("fingerprint", sqlalchemy.Text, index=True),
+    sqlalchemy.Column("query", sqlalchemy.Text),
+    sqlalchemy.Column("connection", sqlalchemy.Text),
+    sqlalchemy.Column("started_at", sqlalchemy.DateTime),
+    sqlalchemy.Column("duration", sqlalchemy.Float),
+    sqlalchemy.Column("rows", sqlalchemy.BigInteger),
+    sqlalchemy.Column("bytes", sqlalchemy.BigInteger),
+    sqlalchemy.Column("error", sqlalchemy.Text),
+)
+
+# a parenthesized list of nothing but literals, like IN (1, 2, 3)
+_LITERAL_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+# several of them, like the rows of VALUES (1, 'a'), (2, 'b')
+_LITERAL_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+
+# engines on the log files, by path
+_engines = {}
+
+
+def normalize(statement):
+    """``statement`` with its literals replaced by ``?``
+
+    Comments are dropped, whitespace collapsed and keywords uppercased,
+    and lists of literals collapse to one, so that statements differing
+    only in their values normalize alike."""
+    pieces = []
+    for ttype, value in _lex(statement):
+        if ttype in T.Comment:
+            continue
+        if ttype in T.Whitespace or ttype in T.Newline:
+            value = " "
+        elif ttype in T.Literal.String or ttype in T.Literal.Number:
+            value = "?"
+        elif ttype in T.Keyword:
+            value = value.upper()
+        pieces.append(value)
+    normalized = re.sub(r"\s+", " ", "".join(pieces)).strip().rstrip(";").strip()
+    normalized = _LITERAL_LIST.sub("(?)", normalized)
+    return _LITERAL_ROWS.sub("(?)", normalized)
+
+
+def fingerprint(normalized):
+    """A short, stable id for a normalized statement"""
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def result_bytes(rows):
+    """Roughly how many bytes the values of ``rows`` take"""
+    total = 0
+    for row in rows:
+        for value in row:
+            if value is None:
+                continue
+            if isinstance(value, (str, bytes, bytearray, memoryview)):
+                total += len(value)
+            elif isinstance(value, (bool, int, float)):
+                total += 8
+            else:
+                total += len(str(value))
+    return total
+
+
+def _engine(path):
+    engine = _engines.get(path)
+    if engine is None:
+        engine = sqlalchemy.create_engine("sqlite:///%s" % path)
+        _metadata.create_all(engine)
+        columns = {c["name"] for c in sqlalchemy.inspect(engine).get_columns(LOG_TABLE)}
+        if "error" not in columns:
+            # a log from before errors were recorded
+            with engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "ALTER TABLE %s ADD COLUMN error TEXT" % LOG_TABLE
+                )
+        _engines[path] = engine
+    return engine
+
+
+def begin(statement, connection):
+    """A record of running ``statement`` on ``connection`` (named), from now
+
+    Pass it to ``finish`` once the statement has run, then to ``log``."""
+    return {
+        "statement": statement,
+        "connection": connection,
+        "started": time.time(),
+        "duration": None,
+        "rows": None,
+        "bytes": None,
+        "error": None,
+    }
+
+
+def finish(execution, rows=None, size=None, error=None):
+    """Completes ``execution``, the record from ``begin``, as of now
+
+    ``rows`` and ``size`` (in bytes) are what it produced, if known;
+    ``error`` the exception it failed with."""
+    execution["duration"] = time.time() - execution["started"]
+    execution["rows"] = rows
+    execution["bytes"] = size
+    if error is not None:
+        lines = str(error).strip().splitlines() or [""]
+        execution["error"] = "%s: %s" % (type(error).__name__, lines[0])
+
+
+def fail(executions, error):
+    """Marks the last of ``executions`` as failed with ``error``
+
+    That is the one that was running, or having its rows fetched, or
+    being committed, when the statements failed."""
+    if executions:
+        last = executions[-1]
+        finish(last, last["rows"], last["bytes"], error=error)
+
+
+def log(config, executions):
+    """Records the finished ``executions`` in ``config.query_log``, if set"""
+    finished = [
+        execution for execution in executions if execution["duration"] is not None
+    ]
+    if config.query_log and finished:
+        record(config.query_log, finished)
+
+
+@contextlib.contextmanager
+def logged(config, statement, connection):
+    """Logs the run of ``statement`` in the block, failed or not
+
+    The block is given the record from ``begin``, and may set its
+    ``rows`` and ``bytes``."""
+    execution = begin(statement, connection)
+    try:
+        yield execution
+    except BaseException as error:
+        finish(execution, error=error)
+        log(config, [execution])
+        raise
+    finish(execution, execution["rows"], execution["bytes"])
+    log(config, [execution])
+
+
+def record(path, executions):
+    """Adds ``executions`` to the log at ``path``
+
+    Each is a dict, as from ``begin`` and ``finish``, with the
+    ``statement`` run, the ``connection`` name, when it ``started`` (a
+    ``time.time()``), its ``duration`` in seconds, the ``rows`` and
+    ``bytes`` it produced (or None), and its ``error`` (or None)."""
+    entries = []
+    for execution in executions:
+        normalized = normalize(execution["statement"])
+        entries.append(
+            {
+                "fingerprint": fingerprint(normalized),
+                "query": normalized,
+                "connection": execution["connection"],
+                "started_at": datetime.datetime.fromtimestamp(execution["started"]),
+                "duration": execution["duration"],
+                "rows": execution["rows"],
+                "bytes": execution["bytes"],
+                "error": execution.get("error"),
+            }
+        )
+    if entries:
+        with _engine(path).begin() as connection:
+            connection.execute(_log.insert(), entries)
+
+
+def _percentile(ordered, fraction):
+    """The ``fraction`` percentile of sorted ``ordered``, interpolating"""
+    position = (len(ordered) - 1) * fraction
+    below = int(position)
+    above = min(below + 1, len(ordered) - 1)
+    return ordered[below] + (ordered[above] - ordered[below]) * (position - below)
+
+
+def top(path, limit=10):
+    """``(keys, rows)`` of the ``limit`` queries in the log at ``path``
+    taking the most time in all, with their latency percentiles
+
+    Failed runs count too, as timeouts are often the slowest of all."""
+    query = sqlalchemy.select(
+        _log.c.fingerprint,
+        _log.c.query,
+        _log.c.duration,
+        _log.c.rows,
+        _log.c.bytes,
+        _log.c.error,
+    )
+    queries = {}
+    with _engine(path).connect() as connection:
+        for fp, text, duration, rows, size, error in connection.execute(query):
+            entry = queries.setdefault(
+                fp, {"query": text, "durations": [], "rows": 0, "bytes": 0, "errors": 0}
+            )
+            entry["durations"].append(duration)
+            entry["rows"] += rows or 0
+            entry["bytes"] += size or 0
+            entry["errors"] += error is not None
+    ranked = []
+    for fp, entry in queries.items():
+        durations = sorted(entry["durations"])
+        ranked.append(
+            (
+                fp,
+                len(durations),
+                entry["errors"],
+                sum(durations),
+                _percentile(durations, 0.5),
+                _percentile(durations, 0.95),
+                _percentile(durations, 0.99),
+                entry["rows"],
+                entry["bytes"],
+                entry["query"],
+            )
+        )
+    ranked.sort(key=lambda row: row[3], reverse=True)
+    keys = [
+        "fingerprint",
+        "calls",
+        "errors",
+        "total_s",
+        "p50_s",
+        "p95_s",
+        "p99_s",
+        "rows",
+        "bytes",
+        "query",
+    ]
+    return keys, ranked[:limit]
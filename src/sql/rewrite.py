@@ -0,0 +1,464 @@
+"""
+Rewrites SQL statements before they are sent to the database,
+using the sqlparse token tree.
+"""
+
+import hashlib
+import re
+
+from sqlparse import lexer
+from sqlparse import sql as S
+from sqlparse import tokens as T
+from sqlparse.engine import FilterStack
+
+# dialects (by SQLAlchemy name) that spell LIMIT differently
+_TOP_DIALECTS = ("mssql", "sybase", "teradata")
+_FETCH_FIRST_DIALECTS = ("oracle", "db2", "ibm_db_sa")
+
+# top-level keywords that already bound the result, or would be
+# broken by a LIMIT appended after them
+_LIMIT_BLOCKERS = ("LIMIT", "TOP", "FETCH", "OFFSET", "FOR", "INTO")
+
+# token type of a ``:name`` placeholder where a table name belongs
+_TABLE_PLACEHOLDER = T.Name.Placeholder.Table
+
+
+class _TableNameFilter(object):
+    """Lexer filter retyping table names that sqlparse takes for keywords
+
+    Tables called ``work``, ``user``, ``data`` and the like would
+    otherwise be lexed as keywords, which derails grouping of the
+    whole FROM clause.  Placeholders in place of a table name are
+    marked too, as ``_TABLE_PLACEHOLDER``."""
+
+    _not_names = ("LATERAL", "ONLY", "TABLE", "UNNEST", "VALUES")
+    _from_list_ends = (
+        "WHERE",
+        "GROUP BY",
+        "ORDER BY",
+        "HAVING",
+        "LIMIT",
+        "OFFSET",
+        "FETCH",
+        "ON",
+        "USING",
+        "UNION",
+        "INTERSECT",
+        "EXCEPT",
+        "WINDOW",
+        "FOR",
+    )
+
+    def process(self, stream):
+        depth = 0
+        from_lists = set()  # parenthesis depths with an open FROM list
+        expecting = False  # is the next token a table reference?
+        for ttype, value in stream:
+            if ttype in T.Whitespace or ttype in T.Comment:
+                yield ttype, value
+                continue
+            word = value.upper()
+            if expecting and ttype in T.Keyword and word not in self._not_names:
+                ttype = T.Name
+            elif expecting and ttype in T.Name.Placeholder and value.startswith(":"):
+                ttype = _TABLE_PLACEHOLDER
+            expecting = False
+            if ttype is T.Punctuation:
+                if value == "(":
+                    depth += 1
+                elif value == ")":
+                    from_lists.discard(depth)
+                    depth -= 1
+                elif value == ",":
+                    expecting = depth in from_lists
+            elif ttype in T.Keyword:
+                if word == "FROM":
+                    from_lists.add(depth)
+                    expecting = True
+                elif word.endswith("JOIN"):
+                    expecting = True
+                elif ttype in T.DML or word in self._from_list_ends:
+                    from_lists.discard(depth)
+            yield ttype, value
+
+
+def parse(sql):
+    """Like ``sqlparse.parse``, but knows table names aren't keywords"""
+    stack = FilterStack()
+    stack.preprocess.append(_TableNameFilter())
+    stack.enable_grouping()
+    return tuple(stack.run(sql))
+
+
+def _lex(sql):
+    return list(_TableNameFilter().process(lexer.tokenize(sql)))
+
+
+def table_placeholders(sql):
+    """Names of the ``:name`` placeholders used in place of a table name"""
+    return [value[1:] for ttype, value in _lex(sql) if ttype is _TABLE_PLACEHOLDER]
+
+
+def bind_tables(sql, tables):
+    """Returns ``sql`` with ``:name`` placeholders for tables filled in
+
+    Each ``:name`` in place of a table, where ``name`` is a key of
+    ``tables``, is replaced by the table name it maps to, aliased as
+    ``name`` unless the query gives it an alias itself."""
+    stream = _lex(sql)
+    pieces = []
+    for idx, (ttype, value) in enumerate(stream):
+        if ttype is not _TABLE_PLACEHOLDER or value[1:] not in tables:
+            pieces.append(value)
+            continue
+        pieces.append(tables[value[1:]])
+        following = next(
+            (
+                (ttype, value)
+                for (ttype, value) in stream[idx + 1 :]
+                if not (ttype in T.Whitespace or ttype in T.Comment)
+            ),
+            (None, ""),
+        )
+        if not (following[1].upper() == "AS" or following[0] in T.Name):
+            pieces.append(" AS %s" % value[1:])
+    return "".join(pieces)
+
+
+def _is_trailing_noise(token):
+    return (
+        token.is_whitespace
+        or token.ttype in T.Comment
+        or (token.ttype is T.Punctuation and token.value == ";")
+    )
+
+
+def _end_of_sql(statement):
+    """Offset just past the statement's last meaningful token
+
+    Trailing whitespace, comments and semicolons come after it."""
+    offset = 0
+    end = 0
+    for token in statement.flatten():
+        offset += len(token.value)
+        if not _is_trailing_noise(token):
+            end = offset
+    return end
+
+
+def add_limit(sql, limit, dialect):
+    """Returns ``sql`` limited to ``limit`` rows, or None if it can't or needn't be
+
+    Only plain SELECT statements (including those starting with a CTE)
+    without any existing row limit are rewritten.  ``dialect`` is the
+    SQLAlchemy dialect name, and decides between ``LIMIT``, ``TOP``
+    and ``FETCH FIRST``.
+    """
+    statements = parse(sql)
+    if len(statements) != 1:
+        return None
+    statement = statements[0]
+    if statement.get_type() != "SELECT":
+        return None
+    top_level = [token.value.upper() for token in statement.tokens]
+    if any(word in top_level for word in _LIMIT_BLOCKERS):
+        return None
+    if dialect in _TOP_DIALECTS:
+        if any(word in top_level for word in ("UNION", "INTERSECT", "EXCEPT")):
+            return None  # TOP would only bind the first SELECT
+        position = 0
+        offset = None  # just past SELECT, or SELECT DISTINCT
+        for token in statement.tokens:
+            position += len(token.value)
+            if token.ttype is T.DML and token.normalized == "SELECT":
+                offset = position
+            elif offset is not None and token.normalized in ("DISTINCT", "ALL"):
+                offset = position
+            elif offset is not None and not token.is_whitespace:
+                break
+        return "%s TOP %d%s" % (sql[:offset], limit, sql[offset:])
+    end = _end_of_sql(statement)
+    if dialect in _FETCH_FIRST_DIALECTS:
+        clause = " FETCH FIRST %d ROWS ONLY" % limit
+    else:
+        clause = " LIMIT %d" % limit
+    return sql[:end] + clause + sql[end:]
+
+
+# DML that writes, wherever it appears - even in a CTE or after FOR
+_WRITES = ("INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "REPLACE")
+
+
+def is_read_only(sql):
+    """Does ``sql`` only read data, so it could run on a read replica?
+
+    True of SELECT statements (including those starting with a CTE)
+    that neither write, as with ``SELECT ... INTO`` or a data-modifying
+    CTE, nor lock rows with ``FOR UPDATE`` or ``FOR SHARE``."""
+    statements = parse(sql)
+    if not statements:
+        return False
+    for statement in statements:
+        if statement.get_type() != "SELECT":
+            return False
+        if any(token.normalized in ("INTO", "FOR") for token in statement.tokens):
+            return False
+        if any(
+            token.ttype in T.DML and token.normalized in _WRITES
+            for token in statement.flatten()
+        ):
+            return False
+    return True
+
+
+def _cte_names(statement):
+    """Names defined by the statement's WITH clause, lowercased"""
+    names = set()
+    expecting = False
+    for token in statement.tokens:
+        if token.is_whitespace:
+            continue
+        if token.ttype is T.CTE:
+            expecting = True
+        elif expecting:
+            if isinstance(token, S.IdentifierList):
+                candidates = token.get_identifiers()
+            else:
+                candidates = [token]
+            names.update(
+                c.get_name().lower()
+                for c in candidates
+                if isinstance(c, S.Identifier) and c.get_name()
+            )
+            expecting = False
+    return names
+
+
+def _names_table(identifier):
+    """Is ``identifier`` a (possibly schema-qualified, aliased) table name?"""
+    return isinstance(identifier, S.Identifier) and not any(
+        isinstance(token, (S.Parenthesis, S.Function)) for token in identifier.tokens
+    )
+
+
+def table_references(tokenlist, cte_names=frozenset()):
+    """Yields the Identifiers naming tables in FROM and JOIN clauses
+
+    Subqueries are searched too.  References to the names in
+    ``cte_names`` (lowercased) are skipped, as are table functions."""
+    expecting = False
+    for token in tokenlist.tokens:
+        if token.is_whitespace or token.ttype in T.Comment:
+            continue
+        if token.is_keyword and (
+            token.normalized == "FROM" or token.normalized.endswith("JOIN")
+        ):
+            expecting = True
+            continue
+        if expecting:
+            expecting = False
+            if isinstance(token, S.IdentifierList):
+                candidates = token.get_identifiers()
+            else:
+                candidates = [token]
+            for candidate in candidates:
+                if _names_table(candidate):
+                    if candidate.get_real_name().lower() not in cte_names:
+                        yield candidate
+                elif candidate.is_group:
+                    for found in table_references(candidate, cte_names):
+                        yield found
+        elif token.is_group and not isinstance(token, S.Function):
+            for found in table_references(token, cte_names):
+                yield found
+
+
+def tables_read(sql):
+    """Names (lowercased, without schema) of the tables ``sql`` reads"""
+    names = set()
+    for statement in parse(sql):
+        for identifier in table_references(statement, _cte_names(statement)):
+            names.add(identifier.get_real_name().lower())
+    return names
+
+
+# statements that change no tables
+_NO_CHANGES = ("BEGIN", "START", "COMMIT", "END", "ROLLBACK", "SHOW")
+
+# keywords followed by the name of the table a statement changes
+_TARGETS = ("INTO", "UPDATE", "TABLE", "TRUNCATE")
+
+
+def _target(statement):
+    """The lowercased name of the table a statement changes, or None"""
+    expecting = False
+    for token in statement.tokens:
+        if token.is_whitespace or token.ttype in T.Comment:
+            continue
+        if expecting:
+            if token.is_keyword and (
+                token.normalized in _TARGETS + ("ONLY",)
+                or token.normalized.startswith("IF ")
+            ):
+                continue
+            if isinstance(token, S.IdentifierList):
+                return [c.get_real_name().lower() for c in token.get_identifiers()]
+            if isinstance(token, (S.Identifier, S.Function)):
+                return [token.get_real_name().lower()]
+            if token.ttype in T.Name or (
+                # a table called "work" or "user", lexed as a keyword
+                token.is_keyword and _SIMPLE_NAME.match(token.value)
+            ):
+                return [token.value.lower()]
+            return None
+        if token.is_keyword and (
+            token.normalized in _TARGETS
+            or (token.normalized == "FROM" and statement.get_type() == "DELETE")
+        ):
+            expecting = True
+    return None
+
+
+def tables_written(sql):
+    """Names (lowercased, without schema) of the tables ``sql`` may change
+
+    Returns None if that can't be told, as for statements of kinds not
+    recognized, which might change anything."""
+    names = set()
+    for statement in parse(sql):
+        first = statement.token_first(skip_cm=True)
+        if first is None or (
+            first.is_keyword and first.normalized in _NO_CHANGES
+        ):
+            continue
+        if is_read_only(str(statement)):
+            continue
+        target = _target(statement)
+        if target is None:
+            return None
+        names.update(target)
+    return names
+
+
+def parse_sample(spec):
+    """Parses a sample size: ``"10%"`` is a percentage, ``"1000"`` a row count
+
+    Returns ``(size, is_percent)``."""
+    spec = str(spec).strip()
+    try:
+        if spec.endswith("%"):
+            percent = float(spec[:-1])
+            if 0 < percent <= 100:
+                return percent, True
+        elif int(spec) > 0:
+            return int(spec), False
+    except ValueError:
+        pass
+    raise ValueError(
+        "Sample size must be a percentage like 10%% or a number of rows, not %r" % spec
+    )
+
+
+_SIMPLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# hash range for SQLite's pseudo-random filters; a prime, so seeded hashes spread out
+_SQLITE_BUCKETS = 1000003
+
+# 32-bit multiply-xorshift hashing, for seeded samples in SQLite
+_MASK = 0xFFFFFFFF
+_MIX = 0x45D9F3B
+
+
+def _xor(a, b):
+    # SQLite has no XOR operator
+    return "((%s | %s) - (%s & %s))" % (a, b, a, b)
+
+
+def _sqlite_hash(seed):
+    """A SQLite expression hashing each row's rowid with ``seed``
+
+    The rowid is XORed with a key derived from the seed, multiplied by
+    another, xorshifted and multiplied again, all in 32 bits, so the
+    sample neither follows the rowids' order nor one seed's sample
+    another's; every product fits in SQLite's 64-bit integers."""
+    digest = hashlib.sha256(str(seed).encode("ascii")).digest()
+    key = int.from_bytes(digest[:4], "big")
+    multiplier = int.from_bytes(digest[4:8], "big") % (1 << 27) | 1
+    rowid = "(rowid & %d)" % _MASK
+    mixed = "(%s * %d & %d)" % (_xor(rowid, key), multiplier, _MASK)
+    return "(%s * %d & %d)" % (_xor(mixed, "(%s >> 16)" % mixed), _MIX, _MASK)
+
+
+def _sampled(identifier, size, is_percent, dialect, seed):
+    """SQL to put in place of table reference ``identifier`` to sample it"""
+    text = str(identifier)
+    name = ""
+    for token in identifier.tokens:
+        if token.is_whitespace:
+            break
+        name += token.value
+    alias = identifier.get_alias() or identifier.get_real_name()
+    if not _SIMPLE_NAME.match(alias):
+        alias = '"%s"' % alias
+    if dialect == "duckdb":
+        if is_percent:
+            method = "bernoulli" if seed is None else "bernoulli, %d" % seed
+            return "%s TABLESAMPLE %g%% (%s)" % (text, size, method)
+        method = "reservoir" if seed is None else "reservoir, %d" % seed
+        return "%s TABLESAMPLE %d ROWS (%s)" % (text, size, method)
+    if dialect in ("postgresql", "redshift"):
+        if is_percent:
+            repeatable = "" if seed is None else " REPEATABLE (%d)" % seed
+            return "%s TABLESAMPLE SYSTEM (%g)%s" % (text, size, repeatable)
+        if seed is None:
+            order = "random()"
+        else:
+            order = "md5(ctid::text || '%d')" % seed
+        return "(SELECT * FROM %s ORDER BY %s LIMIT %d) AS %s" % (
+            name,
+            order,
+            size,
+            alias,
+        )
+    if dialect == "sqlite":
+        if seed is None:
+            bucket = "abs(random()) %% %d" % _SQLITE_BUCKETS
+        else:
+            bucket = "%s %% %d" % (_sqlite_hash(seed), _SQLITE_BUCKETS)
+        if is_percent:
+            return "(SELECT * FROM %s WHERE %s < %d) AS %s" % (
+                name,
+                bucket,
+                round(_SQLITE_BUCKETS * size / 100),
+                alias,
+            )
+        return (
+            "(SELECT * FROM %s WHERE rowid IN "
+            "(SELECT rowid FROM %s ORDER BY %s LIMIT %d)) AS %s"
+            % (name, name, bucket, size, alias)
+        )
+    raise ValueError("Sampling is not supported for %s databases" % dialect)
+
+
+def add_sample(sql, sample, dialect, seed=None):
+    """Returns ``sql`` with every table it reads replaced by a random sample
+
+    ``sample`` is as for ``parse_sample``.  PostgreSQL samples
+    percentages with ``TABLESAMPLE SYSTEM`` and DuckDB with
+    ``TABLESAMPLE``; SQLite filters on a hash of each row's rowid.
+    Row counts take that many rows at random from each table.
+    A ``seed`` makes the sample repeatable.
+
+    Returns ``(sql, sampled_table_names)``.
+    """
+    size, is_percent = parse_sample(sample)
+    statements = parse(sql)
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        raise ValueError("Only SELECT statements can be sampled")
+    statement = statements[0]
+    references = list(table_references(statement, _cte_names(statement)))
+    for identifier in references:
+        replacement = _sampled(identifier, size, is_percent, dialect, seed)
+        siblings = identifier.parent.tokens
+        siblings[siblings.index(identifier)] = S.Token(T.Other, replacement)
+    return str(statement), [identifier.get_real_name() for identifier in references]
@@ -1,17 +1,43 @@
 import codecs
+import contextlib
 import csv
+import datetime
+import decimal
+import hashlib
+import itertools
 import operator
 import os.path
 import re
+import threading
+import time
 import traceback
-from functools import reduce
+import weakref
+from functools import reduce, wraps
 
 import prettytable
 import six
 import sqlalchemy
-import sqlparse
 
+from . import cache, querylog
 from .column_guesser import ColumnGuesserMixin
+from .connection import Connection
+from .grid import grid_bundle
+from .parse import (
+    iter_statements,
+    split_statements,
+    statement_kind,
+    without_leading_comments,
+)
+from .rewrite import (
+    _end_of_sql,
+    add_limit,
+    add_sample,
+    bind_tables,
+    is_read_only,
+    parse,
+    table_placeholders,
+    table_references,
+)
 
 try:
     from pgspecial.main import PGSpecial
@@ -118,6 +144,13 @@ class ResultSet(list, ColumnGuesserMixin):
             list.__init__(self, [])
             self.pretty = None
 
+    def _repr_mimebundle_(self, include=None, exclude=None):
+        """With ``displaygrid``, the result set as a scrolling grid widget,
+        where one can be shown; see ``sql.grid``"""
+        if self.pretty and self.config.displaygrid:
+            return grid_bundle(self)
+        return None
+
     def _repr_html_(self):
         _cell_with_spaces_pattern = re.compile(r"(<td>)( {2,})")
         if self.pretty:
@@ -163,13 +196,78 @@ class ResultSet(list, ColumnGuesserMixin):
         for row in self:
             yield dict(zip(self.keys, row))
 
-    def DataFrame(self):
-        """Returns a Pandas DataFrame instance built from the result set."""
+    def DataFrame(self, typed=None, downcast=None):
+        """Returns a Pandas DataFrame instance built from the result set.
+
+        With ``typed`` (by default, ``config.typed_dataframes``), each
+        column gets the most compact dtype its values allow, rather than
+        what pandas infers; see ``_compact_column``.  ``downcast`` (by
+        default, ``config.downcast_dataframes``) also shrinks numbers
+        to the smallest dtype that holds them."""
         import pandas as pd
 
-        frame = pd.DataFrame(self, columns=(self and self.keys) or [])
+        if typed is None:
+            typed = self.config.typed_dataframes
+        if not (typed and self):
+            frame = pd.DataFrame(self, columns=(self and self.keys) or [])
+            return frame
+        if downcast is None:
+            downcast = self.config.downcast_dataframes
+        frame = pd.DataFrame(
+            dict(
+                (idx, _compact_column(pd, column, downcast))
+                for idx, column in enumerate(zip(*self))
+            )
+        )
+        frame.columns = list(self.keys)
         return frame
 
+    def PolarsDataFrame(self, lazy=False):
+        """Returns a polars DataFrame (or, with ``lazy``, LazyFrame)
+        built from the result set, without going through pandas."""
+        import polars as pl
+
+        frame = pl.DataFrame(
+            [
+                pl.Series(str(key), column, strict=False)
+                for key, column in zip(self.field_names, self._columns())
+            ]
+        )
+        return frame.lazy() if lazy else frame
+
+    def arrays(self):
+        """Returns a single dict built from the result set
+
+        Keys are column names, numbered where repeated, as in
+        ``field_names``; values are NumPy arrays"""
+        import numpy
+
+        return dict(
+            (key, _numpy_column(numpy, column))
+            for key, column in zip(self.field_names, self._columns())
+        )
+
+    def to_numpy(self):
+        """Returns a NumPy structured array built from the result set,
+        with a field for each column"""
+        import numpy
+
+        columns = [_numpy_column(numpy, column) for column in self._columns()]
+        array = numpy.empty(
+            len(self),
+            dtype=[
+                (str(key), column.dtype)
+                for key, column in zip(self.field_names, columns)
+            ],
+        )
+        for key, column in zip(self.field_names, columns):
+            array[str(key)] = column
+        return array
+
+    def _columns(self):
+        """The result set's columns, as tuples of values"""
+        return list(zip(*self)) or [()] * len(self.keys or [])
+
     def pie(self, key_word_sep=" ", title=None, **kwargs):
         """Generates a pylab pie chart from the result set.
 
@@ -284,6 +382,281 @@ class ResultSet(list, ColumnGuesserMixin):
             return outfile.getvalue()
 
 
+class ProgressiveResultSet(ResultSet):
+    """A ``ResultSet`` that goes on filling itself in the background
+
+    The first ``batch_size`` rows are fetched straight away.  The rest
+    are fetched in batches by a background thread, while the table on
+    display, with a row counter and rate, is updated in place.
+    ``finish`` is called from that thread once fetching is over, with
+    None or the exception that stopped it.  ``wait()`` blocks until then.
+
+    Only the display shows the rows fetched so far: anything else using
+    the result set whole - its length, iterating it, ``DataFrame()``,
+    ``arrays()`` and the like - waits for all the rows first.
+    """
+
+    refresh_seconds = 0.5
+
+    def __init__(self, sqlaproxy, config, batch_size=1000, finish=None):
+        self.config = config
+        self.keys = sqlaproxy.keys()
+        self.field_names = unduplicate_field_names(self.keys)
+        self.pretty = PrettyTable(
+            self.field_names, style=prettytable.__dict__[config.style.upper()]
+        )
+        self.error = None
+        self.handle = None
+        self.started = time.time()
+        self.seconds = None
+        self.done = threading.Event()
+        self._result = sqlaproxy
+        self._batch_size = batch_size
+        self._finish = finish
+        self._refreshed = self.started
+        self._showing = threading.local()
+        list.__init__(self, self._next_batch())
+        self.thread = threading.Thread(target=self._fetch_rest)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _next_batch(self):
+        size = self._batch_size
+        if self.config.autolimit:
+            size = min(size, self.config.autolimit - list.__len__(self))
+        return list(self._result.fetchmany(size)) if size > 0 else []
+
+    def _fetch_rest(self):
+        try:
+            while not self.done.is_set():
+                rows = self._next_batch()
+                if not rows:
+                    break
+                self.extend(rows)
+                if time.time() - self._refreshed > self.refresh_seconds:
+                    self._refresh()
+        except Exception as ex:
+            self.error = ex
+        finally:
+            if hasattr(self._result, "close"):
+                self._result.close()
+            self.seconds = time.time() - self.started
+            if self._finish:
+                try:
+                    self._finish(self.error)
+                except Exception as ex:
+                    self.error = self.error or ex
+            self.done.set()
+            self._refresh()
+
+    def wait(self):
+        """Waits for all the rows, re-raising any error that stopped the fetch"""
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def _partial(self):
+        """May the rows fetched so far be used, rather than waiting for all?
+
+        Only by the fetch itself, and the display it updates."""
+        return (
+            threading.current_thread() is getattr(self, "thread", None)
+            or getattr(self._showing, "active", False)
+        )
+
+    def __len__(self):
+        if not self._partial():
+            self.wait()
+        return list.__len__(self)
+
+    def __iter__(self):
+        if not self._partial():
+            self.wait()
+        return list.__iter__(self)
+
+    def _waiting(method):
+        @wraps(method)
+        def waiting(self, *args, **kwargs):
+            self.wait()
+            return method(self, *args, **kwargs)
+
+        return waiting
+
+    # these may read the rows without going through __len__ or __iter__
+    dict = _waiting(ResultSet.dict)
+    dicts = _waiting(ResultSet.dicts)
+    DataFrame = _waiting(ResultSet.DataFrame)
+    PolarsDataFrame = _waiting(ResultSet.PolarsDataFrame)
+    arrays = _waiting(ResultSet.arrays)
+    to_numpy = _waiting(ResultSet.to_numpy)
+    csv = _waiting(ResultSet.csv)
+    pie = _waiting(ResultSet.pie)
+    plot = _waiting(ResultSet.plot)
+    bar = _waiting(ResultSet.bar)
+    del _waiting
+
+    def status(self):
+        fetched = list.__len__(self)
+        if self.error is not None:
+            return "Fetch failed after %d rows: %s" % (fetched, self.error)
+        if self.done.is_set():
+            return "%d rows in %.1fs" % (fetched, self.seconds)
+        elapsed = max(time.time() - self.started, 1e-6)
+        return "Fetching... %d rows so far (%d rows/s)" % (
+            fetched,
+            fetched / elapsed,
+        )
+
+    def _repr_html_(self):
+        return '%s\n<span style="font-style:italic;">%s</span>' % (
+            ResultSet._repr_html_(self),
+            self.status(),
+        )
+
+    def _bundle(self):
+        self._showing.active = True
+        try:
+            return {
+                "text/html": self._repr_html_(),
+                "text/plain": "%s\n%s" % (self, self.status()),
+            }
+        finally:
+            self._showing.active = False
+
+    def _refresh(self):
+        self._refreshed = time.time()
+        if self.handle is not None:
+            self.handle.update(self._bundle(), raw=True)
+
+    def _ipython_display_(self):
+        from IPython.display import display
+
+        self.handle = display(self._bundle(), raw=True, display_id=True)
+        if self.done.is_set():
+            self._refresh()  # in case it finished while being displayed
+
+
+# distinct values, as a share of all of them, below which strings are categorical
+CATEGORY_RATIO = 0.5
+
+_NULLABLE_INTS = ("Int8", "Int16", "Int32", "Int64")
+
+
+def _compact_column(pd, values, downcast=False):
+    """A pandas Series of ``values`` (from one column), compactly typed
+
+    Integers become nullable ``Int64`` (so NULLs don't turn them into
+    floats), floats ``float64``, dates and times ``datetime64``, booleans
+    ``boolean``, and strings either ``category``, when few are distinct,
+    or pandas strings (Arrow-backed, if ``pyarrow`` is installed).
+    Decimals stay exact, as Arrow decimals if ``pyarrow`` is installed.
+    Columns of mixed types stay as Python objects."""
+    import numpy
+
+    present = [value for value in values if value is not None]
+    kinds = set(type(value) for value in present)
+    try:
+        if not kinds:
+            return pd.Series(values, dtype=object)
+        if kinds == set([bool]):
+            return pd.Series(values, dtype="boolean")
+        if all(issubclass(kind, int) and kind is not bool for kind in kinds):
+            dtype = "Int64"
+            if downcast:
+                low, high = min(present), max(present)
+                dtype = next(
+                    name
+                    for name in _NULLABLE_INTS
+                    if numpy.iinfo(name.lower()).min <= low
+                    and high <= numpy.iinfo(name.lower()).max
+                )
+            return pd.Series(values, dtype=dtype)
+        if any(issubclass(kind, decimal.Decimal) for kind in kinds):
+            if all(
+                issubclass(kind, (int, decimal.Decimal)) and kind is not bool
+                for kind in kinds
+            ):
+                return _decimal_column(pd, values, present)
+            return pd.Series(values, dtype=object)
+        if all(issubclass(kind, (int, float)) and kind is not bool for kind in kinds):
+            series = pd.Series(
+                [numpy.nan if value is None else float(value) for value in values]
+            )
+            return series.astype("float32") if downcast else series
+        if all(issubclass(kind, datetime.date) for kind in kinds):
+            return pd.Series(pd.to_datetime(values))
+        if kinds == set([str]):
+            if len(set(present)) <= CATEGORY_RATIO * len(values):
+                return pd.Series(values, dtype="category")
+            try:
+                import pyarrow  # noqa: F401
+
+                return pd.Series(values, dtype="string[pyarrow]")
+            except ImportError:
+                return pd.Series(values, dtype="string")
+    except (OverflowError, StopIteration, TypeError, ValueError):
+        pass  # beyond the dtype's range, or mixing time zones
+    return pd.Series(values, dtype=object)
+
+
+def _decimal_column(pd, values, present):
+    """A pandas Series of ``values``, integers and Decimals, kept exact
+
+    As an Arrow ``decimal128`` (or ``decimal256``) wide enough for every
+    value, if ``pyarrow`` is installed; otherwise as Python objects."""
+    try:
+        import pyarrow
+    except ImportError:
+        return pd.Series(values, dtype=object)
+    whole, scale = 1, 0
+    for value in present:
+        _, digits, exponent = decimal.Decimal(value).as_tuple()
+        if not isinstance(exponent, int):  # NaN or Infinity
+            return pd.Series(values, dtype=object)
+        whole = max(whole, len(digits) + exponent)
+        scale = max(scale, -exponent)
+    precision = whole + scale
+    if precision > 76:
+        return pd.Series(values, dtype=object)
+    kind = pyarrow.decimal128 if precision <= 38 else pyarrow.decimal256
+    return pd.Series(
+        [None if value is None else decimal.Decimal(value) for value in values],
+        dtype=pd.ArrowDtype(kind(precision, scale)),
+    )
+
+
+def _numpy_column(numpy, values):
+    """A NumPy array of ``values`` (from one column)
+
+    Dates and times become ``datetime64``; columns NumPy can't hold
+    in a single typed array (with NULLs, say) hold Python objects."""
+    try:
+        if values and all(
+            isinstance(value, datetime.date) and getattr(value, "tzinfo", None) is None
+            for value in values
+        ):
+            return numpy.array(values, dtype="datetime64[us]")
+        column = numpy.array(values)
+        if column.ndim == 1:
+            return column
+    except (OverflowError, TypeError, ValueError):
+        pass
+    column = numpy.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _output(resultset, config):
+    """``resultset`` as the configured output: a pandas or polars
+    DataFrame, or the ``ResultSet`` itself"""
+    if config.autopandas:
+        return resultset.DataFrame()
+    if config.autopolars:
+        return resultset.PolarsDataFrame(lazy=config.polars_lazy)
+    return resultset
+
+
 def interpret_rowcount(rowcount):
     if rowcount < 0:
         result = "Done."
@@ -315,30 +688,20 @@ class FakeResultProxy(object):
 
         self.fetchall = lambda: source_list
         self.rowcount = len(source_list)
+        position = [0]
 
         def fetchmany(size):
-            pos = 0
-            while pos < len(source_list):
-                yield source_list[pos: pos + size]
-                pos += size
+            start = position[0]
+            position[0] = start + size
+            return source_list[start: start + size]
 
         self.fetchmany = fetchmany
 
 
-# some dialects have autocommit
-# specific dialects break when commit is used:
-
-_COMMIT_BLACKLIST_DIALECTS = ("athena", "bigquery", "clickhouse", "ingres", "mssql", "teradata", "vertica")
-
-
 def _commit(conn, config):
     """Issues a commit, if appropriate for current config and dialect"""
 
-    _should_commit = config.autocommit and all(
-        dialect not in str(conn.dialect) for dialect in _COMMIT_BLACKLIST_DIALECTS
-    )
-
-    if _should_commit:
+    if config.autocommit and conn.can_commit and not conn.in_transaction:
         try:
             conn.internal_connection.commit()
         except sqlalchemy.exc.OperationalError:
@@ -349,38 +712,933 @@ def _commit(conn, config):
             raise ex
 
 
-def run(conn, sql, config, user_namespace):
-    if sql.strip():
-        for statement in sqlparse.split(sql):
-            first_word = sql.strip().split()[0].lower()
-            if first_word == "begin":
-                raise Exception("ipython_sql does not support transactions")
-            if first_word.startswith("\\") and \
-                ("postgres" in str(conn.dialect) or
-                 "redshift" in str(conn.dialect)):
-                if not PGSpecial:
-                    raise ImportError("pgspecial not installed")
-                pgspecial = PGSpecial()
-                _, cur, headers, _ = pgspecial.execute(
-                    conn.internal_connection.connection.cursor(), statement
-                )[0]
-                result = FakeResultProxy(cur, headers)
-            else:
-                txt = sqlalchemy.sql.text(statement)
-                result = conn.internal_connection.execute(txt, user_namespace)
-            _commit(conn=conn, config=config)
-            if result and config.feedback:
-                print(interpret_rowcount(result.rowcount))
-        resultset = ResultSet(result, config)
-        if config.autopandas:
-            return resultset.DataFrame()
+def _thread_bound(conn):
+    """Must ``conn`` be used only from the thread that opened it?
+
+    True of in-memory SQLite databases."""
+    url = conn.internal_connection.engine.url
+    return url.get_backend_name() == "sqlite" and url.database in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def _cancel(conn):
+    """Asks the driver to abandon whatever statement ``conn`` is running
+
+    Safe to call from another thread.  Returns True if a cancel
+    request could be sent."""
+    raw = conn.internal_connection.connection.driver_connection
+    for method in ("cancel", "interrupt"):  # psycopg2 & co; sqlite3, duckdb
+        if hasattr(raw, method):
+            getattr(raw, method)()
+            return True
+    if conn.dialect.name in ("mysql", "mariadb") and hasattr(raw, "thread_id"):
+        # MySQL can only kill a query from a second connection
+        with conn.internal_connection.engine.connect() as killer:
+            killer.exec_driver_sql("KILL QUERY %d" % raw.thread_id())
+        return True
+    return False
+
+
+# dialects where ``SET LOCAL statement_timeout`` applies to the current transaction
+_SET_LOCAL_TIMEOUT_DIALECTS = ("postgresql", "redshift")
+
+
+@contextlib.contextmanager
+def _statement_timeout(conn, seconds):
+    """Aborts statements run within the block after ``seconds``
+
+    MySQL enforces the limit server-side, for each statement.  SQLite
+    uses a progress handler, and other databases a watchdog thread
+    that cancels through the driver; for those, the limit applies to
+    the block as a whole.  PostgreSQL is handled per statement by
+    ``_execute``, with ``SET LOCAL``; that lapses with the transaction,
+    but an explicit transaction may go on past the block, so there the
+    limit is reset at its end."""
+    dialect = conn.dialect.name
+    if not seconds:
+        yield
+    elif dialect in _SET_LOCAL_TIMEOUT_DIALECTS:
+        yield
+        # a failed statement rolls the transaction back, resetting it anyway
+        if conn.in_transaction:
+            conn.internal_connection.exec_driver_sql(
+                "SET LOCAL statement_timeout = DEFAULT"
+            )
+    elif dialect in ("mysql", "mariadb"):
+        conn.internal_connection.exec_driver_sql(
+            "SET SESSION max_execution_time = %d" % (seconds * 1000)
+        )
+        try:
+            yield
+        finally:
+            conn.internal_connection.exec_driver_sql(
+                "SET SESSION max_execution_time = DEFAULT"
+            )
+    elif dialect == "sqlite":
+        raw = conn.internal_connection.connection.driver_connection
+        deadline = time.monotonic() + seconds
+        raw.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        try:
+            yield
+        finally:
+            raw.set_progress_handler(None, 0)
+    else:
+        watchdog = threading.Timer(seconds, _cancel, args=(conn,))
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            yield
+        finally:
+            watchdog.cancel()
+
+
+class TransactionControlResult(object):
+    """Stands in for the result of a BEGIN, COMMIT or ROLLBACK we handled ourselves"""
+
+    returns_rows = False
+    rowcount = -1
+
+
+_TRANSACTION_CONTROL = {
+    "begin": Connection.begin,
+    "begin transaction": Connection.begin,
+    "begin work": Connection.begin,
+    "start transaction": Connection.begin,
+    "commit": Connection.commit,
+    "commit transaction": Connection.commit,
+    "commit work": Connection.commit,
+    "end": Connection.commit,
+    "end transaction": Connection.commit,
+    "rollback": Connection.rollback,
+    "rollback transaction": Connection.rollback,
+    "rollback work": Connection.rollback,
+    "abort": Connection.rollback,
+}
+
+
+def _transaction_control(statement):
+    """The ``Connection`` method a BEGIN/COMMIT/ROLLBACK statement maps to, if any
+
+    Statements like ``BEGIN ... END`` blocks or ``ROLLBACK TO SAVEPOINT``
+    are not transaction control in this sense and are left to the database."""
+    if statement_kind(statement) != "TRANSACTION":
+        return None
+    words = without_leading_comments(statement).rstrip().rstrip(";").lower().split()
+    return _TRANSACTION_CONTROL.get(" ".join(words))
+
+
+def _column_type(values):
+    """A SQLAlchemy type able to hold ``values``"""
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return sqlalchemy.Boolean
+        if isinstance(value, int):
+            return sqlalchemy.BigInteger
+        if isinstance(value, float):
+            return sqlalchemy.Float
+        if isinstance(value, decimal.Decimal):
+            return sqlalchemy.Numeric
+        if isinstance(value, datetime.datetime):
+            return sqlalchemy.DateTime
+        if isinstance(value, datetime.date):
+            return sqlalchemy.Date
+        if isinstance(value, bytes):
+            return sqlalchemy.LargeBinary
+        return sqlalchemy.Text
+    return sqlalchemy.Text
+
+
+def _load_rows(result, local, table_name, batch_size, table=None):
+    """Streams ``result``'s rows into a table in SQLAlchemy connection ``local``
+
+    Unless an existing ``table`` is given, ``table_name`` is created with
+    column types suited to the first batch of rows.  Returns the table
+    and the number of rows loaded."""
+    keys = list(result.keys())
+    rows = result.fetchmany(batch_size)
+    if table is None:
+        columns = [
+            sqlalchemy.Column(key, _column_type(row[idx] for row in rows))
+            for idx, key in enumerate(keys)
+        ]
+        table = sqlalchemy.Table(table_name, sqlalchemy.MetaData(), *columns)
+        table.create(local)
+    loaded = 0
+    while rows:
+        local.execute(table.insert(), [dict(zip(keys, row)) for row in rows])
+        loaded += len(rows)
+        rows = result.fetchmany(batch_size)
+    return table, loaded
+
+
+def _is_sequence(value):
+    """Is ``value`` a list-like of values, to match with ``IN :name``?"""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return True
+    return (
+        type(value).__module__.split(".")[0] in ("numpy", "pandas")
+        and getattr(value, "ndim", None) == 1
+    )
+
+
+def _in_list_table(conn, name, values):
+    """Bulk-loads ``values`` into a temporary table, returning its name
+
+    The table is replaced on its next use, and disappears with the
+    connection."""
+    table = sqlalchemy.Table(
+        "ipython_sql_in_%s" % name,
+        sqlalchemy.MetaData(),
+        sqlalchemy.Column("value", _column_type(values)),
+        prefixes=["TEMPORARY"],
+    )
+    table.drop(conn.internal_connection, checkfirst=True)
+    table.create(conn.internal_connection)
+    if values:
+        conn.internal_connection.execute(
+            table.insert(), [{"value": value} for value in values]
+        )
+    return table.name
+
+
+def _text(conn, statement, user_namespace, in_list_threshold=None):
+    """``statement`` as a ``TextClause``, with its parameters
+
+    A ``:name`` bound to a list, tuple, set, or one-dimensional array
+    or Series, and only used as ``IN :name`` (or ``IN (:name)``), is
+    expanded to match any of its values.  With more values than
+    ``in_list_threshold``, they are bulk-loaded into a temporary table
+    instead, and ``IN :name`` becomes a subquery on it, keeping the
+    SQL short however many values there are.
+
+    Returns ``(text_clause, parameters)``."""
+    expanding = []
+    parameters = user_namespace
+    for name in sqlalchemy.sql.text(statement)._bindparams:
+        value = user_namespace.get(name)
+        if not _is_sequence(value):
+            continue
+        uses = re.compile(r"(?<![:\w]):%s(?!\w)" % name)
+        in_uses = re.compile(
+            r"\bIN\s*(?:\(\s*:%s\s*\)|:%s)(?!\w)" % (name, name), re.IGNORECASE
+        )
+        if len(in_uses.findall(statement)) != len(uses.findall(statement)):
+            continue  # used some other way, e.g. as an array
+        values = value.tolist() if hasattr(value, "tolist") else list(value)
+        if parameters is user_namespace:
+            parameters = dict(user_namespace)
+        if in_list_threshold and len(values) > in_list_threshold:
+            table = _in_list_table(conn, name, values)
+            statement = in_uses.sub("IN (SELECT value FROM %s)" % table, statement)
+            del parameters[name]
+        else:
+            statement = in_uses.sub("IN :%s" % name, statement)
+            parameters[name] = values
+            expanding.append(sqlalchemy.bindparam(name, expanding=True))
+    return sqlalchemy.sql.text(statement).bindparams(*expanding), parameters
+
+
+def _execute(
+    conn,
+    statement,
+    user_namespace,
+    stream=False,
+    timeout=None,
+    in_list_threshold=None,
+    autocommit=False,
+):
+    """Executes a single statement, returning a SQLAlchemy-style result proxy
+
+    With ``stream``, asks the driver for a server-side cursor where
+    supported, so rows are only transferred as they are fetched.
+    ``timeout`` is only applied here for dialects that scope it to a
+    transaction; see ``_statement_timeout`` for the others.
+    List-like parameters are bound as described for ``_text``, and
+    DataFrames used as tables as for ``_bind_frames``.
+    With ``autocommit``, a BEGIN first commits the statements before it,
+    whose commit would otherwise wait for the end of the cell."""
+    control = _transaction_control(statement)
+    if control is Connection.begin:
+        conn.begin(commit=autocommit and conn.can_commit)
+        return TransactionControlResult()
+    if control:
+        # Handled through SQLAlchemy, which tracks the DBAPI transaction itself
+        control(conn)
+        return TransactionControlResult()
+    if statement_kind(statement) == "META" and \
+        ("postgres" in str(conn.dialect) or
+         "redshift" in str(conn.dialect)):
+        if not PGSpecial:
+            raise ImportError("pgspecial not installed")
+        pgspecial = PGSpecial()
+        _, cur, headers, _ = pgspecial.execute(
+            conn.internal_connection.connection.cursor(),
+            without_leading_comments(statement),
+        )[0]
+        return FakeResultProxy(cur, headers)
+    if timeout and conn.dialect.name in _SET_LOCAL_TIMEOUT_DIALECTS:
+        # lapses at this statement's commit or rollback, or is reset by
+        # ``_statement_timeout`` if the transaction is to outlast the cell
+        conn.internal_connection.exec_driver_sql(
+            "SET LOCAL statement_timeout = %d" % (timeout * 1000)
+        )
+    cache.invalidate(conn, statement)
+    statement = _bind_frames(conn, statement, user_namespace)
+    txt, parameters = _text(conn, statement, user_namespace, in_list_threshold)
+    if stream:
+        return conn.internal_connection.execute(
+            txt, parameters, execution_options={"stream_results": True}
+        )
+    return conn.internal_connection.execute(txt, parameters)
+
+
+# (top-level module, class name) of objects DuckDB can scan in place
+_FRAME_TYPES = (
+    ("pandas", "DataFrame"),
+    ("polars", "DataFrame"),
+    ("polars", "LazyFrame"),
+    ("pyarrow", "Table"),
+    ("pyarrow", "RecordBatch"),
+    ("pyarrow", "Dataset"),
+)
+
+
+def _is_frame(obj):
+    cls = type(obj)
+    return (cls.__module__.split(".")[0], cls.__name__) in _FRAME_TYPES
+
+
+@contextlib.contextmanager
+def _namespace_frames(conn, statements, user_namespace, config):
+    """Lets DuckDB query DataFrames and Arrow tables in the namespace by name
+
+    Each unqualified table name in ``statements`` that isn't a table in
+    the database, but is a frame in ``user_namespace``, is registered as
+    a view over that frame for the duration of the block.  DuckDB scans
+    the frame's own buffers, without copying it into the database.
+    """
+    if not (config.query_dataframes and conn.dialect.name == "duckdb"):
+        yield
+        return
+    names = set()
+    for statement in statements:
+        for parsed in parse(statement):
+            for reference in table_references(parsed):
+                if reference.get_parent_name() is None:
+                    names.add(reference.get_real_name())
+    frames = dict(
+        (name, user_namespace[name])
+        for name in names
+        if _is_frame(user_namespace.get(name))
+    )
+    if frames:
+        existing = conn.internal_connection.exec_driver_sql(
+            "SELECT table_name FROM information_schema.tables"
+        )
+        for (table_name,) in existing:
+            frames.pop(table_name, None)
+    raw = conn.internal_connection.connection.driver_connection
+    for name, frame in frames.items():
+        raw.register(name, frame)
+    try:
+        yield
+    finally:
+        for name in frames:
+            raw.unregister(name)
+
+
+_frame_table_names = itertools.count()
+
+
+def _frame_digest(frame):
+    """A hash of ``frame``'s contents, or None if they can't be hashed"""
+    import pandas
+
+    try:
+        hashed = pandas.util.hash_pandas_object(frame, index=True).values
+    except TypeError:  # unhashable cells, like lists
+        return None
+    digest = hashlib.sha1(hashed.tobytes())
+    digest.update(repr((list(frame.columns), list(frame.dtypes))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _forget_frame(conn, key, table):
+    """Called once a bound frame is garbage-collected"""
+    conn.frame_tables.pop(key, None)
+    conn.stale_tables.append(table)  # dropped on the connection's next use
+
+
+def _upload_frame(conn, frame, table):
+    """Copies ``frame`` into a new temporary table, by the fastest route to hand"""
+    if any(name is not None for name in frame.index.names):
+        frame = frame.reset_index()
+    raw = conn.internal_connection.connection.driver_connection
+    if conn.dialect.name == "duckdb":
+        view = "%s_source" % table
+        raw.register(view, frame)
+        try:
+            raw.execute("CREATE TEMPORARY TABLE %s AS SELECT * FROM %s" % (table, view))
+        finally:
+            raw.unregister(view)
+        return
+    columns = [
+        sqlalchemy.Column(
+            str(column), _column_type(frame[column].dropna().head(1000).tolist())
+        )
+        for column in frame.columns
+    ]
+    sqla_table = sqlalchemy.Table(
+        table, sqlalchemy.MetaData(), *columns, prefixes=["TEMPORARY"]
+    )
+    sqla_table.create(conn.internal_connection)
+    if frame.empty:
+        return
+    cursor = conn.internal_connection.connection.cursor()
+    if hasattr(cursor, "copy_expert"):  # psycopg2: COPY is fastest
+        buffer = six.StringIO()
+        frame.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cursor.copy_expert("COPY %s FROM STDIN WITH (FORMAT csv)" % table, buffer)
+        return
+    rows = frame.astype(object).where(frame.notna(), None)
+    names = [str(column) for column in frame.columns]
+    conn.internal_connection.execute(
+        sqla_table.insert(),
+        [dict(zip(names, row)) for row in rows.itertuples(index=False, name=None)],
+    )
+
+
+def _bind_frames(conn, statement, user_namespace):
+    """Fills in ``FROM :name`` placeholders naming DataFrames in the namespace
+
+    Each such DataFrame is uploaded into a temporary table on ``conn``,
+    which the statement then reads.  The upload is reused for as long
+    as the frame exists with the same contents, and the table dropped
+    once the frame has been garbage-collected."""
+    while conn.stale_tables:
+        conn.internal_connection.exec_driver_sql(
+            "DROP TABLE IF EXISTS %s" % conn.stale_tables.pop()
+        )
+    tables = {}
+    for name in table_placeholders(statement):
+        frame = user_namespace.get(name)
+        cls = type(frame)
+        if (cls.__module__.split(".")[0], cls.__name__) != ("pandas", "DataFrame"):
+            continue
+        key = id(frame)
+        digest = _frame_digest(frame)
+        driver = id(conn.internal_connection.connection.driver_connection)
+        cached = conn.frame_tables.get(key)
+        if cached and digest is not None and cached[:2] == (digest, driver):
+            tables[name] = cached[2]
+            continue
+        if cached:
+            table = cached[2]
+            conn.internal_connection.exec_driver_sql("DROP TABLE IF EXISTS %s" % table)
+        else:
+            table = "ipython_sql_frame_%d" % next(_frame_table_names)
+            weakref.finalize(frame, _forget_frame, conn, key, table)
+        _upload_frame(conn, frame, table)
+        conn.frame_tables[key] = (digest, driver, table)
+        tables[name] = table
+    if not tables:
+        return statement
+    return bind_tables(statement, tables)
+
+
+def _apply_autolimit(conn, statement, config):
+    """Pushes ``config.autolimit`` down into ``statement``, if it is a bare SELECT
+
+    Spares the database from producing rows that would be discarded."""
+    if not config.autolimit or statement_kind(statement) != "SELECT":
+        return statement
+    limited = add_limit(statement, config.autolimit, conn.dialect.name)
+    if limited is None:
+        return statement
+    if config.feedback:
+        print("Limited to %d rows by autolimit." % config.autolimit)
+    return limited
+
+
+def _apply_sample(conn, statement, config, sample, seed):
+    """Makes ``statement`` read a random sample of each of its tables"""
+    statement, tables = add_sample(statement, sample, conn.dialect.name, seed=seed)
+    if config.feedback:
+        print("Sampling %s of %s." % (sample, ", ".join(tables) or "no tables"))
+    return statement
+
+
+def _needs_temporary_table(statement, user_namespace, in_list_threshold):
+    """Might ``statement`` load a DataFrame or a long ``IN`` list into a
+    temporary table, as ``_bind_frames`` and ``_text`` do?"""
+    if table_placeholders(statement):
+        return True
+    if not in_list_threshold:
+        return False
+    for name in sqlalchemy.sql.text(statement)._bindparams:
+        value = user_namespace.get(name)
+        if _is_sequence(value) and len(value) > in_list_threshold:
+            return True
+    return False
+
+
+def _route(conn, statements, config, user_namespace):
+    """The connection to run each of ``statements`` on
+
+    With replicas, reads (SELECTs, and meta-commands like ``\\d``) go
+    to a replica chosen by ``config.replica_routing``, and everything
+    else to ``conn``, the primary.  So do reads needing a temporary
+    table, which a read-only replica may not allow.  Once a statement
+    has gone to the primary, so do the rest, so they see what it wrote;
+    and so does everything inside an explicit transaction."""
+    if not conn.replicas:
+        return [conn] * len(statements)
+    targets = []
+    sticky = conn.in_transaction
+    for statement in statements:
+        kind = statement_kind(statement)
+        if (
+            not sticky
+            and (kind == "META" or (kind == "SELECT" and is_read_only(statement)))
+            and not _needs_temporary_table(
+                statement, user_namespace, config.in_list_threshold
+            )
+        ):
+            targets.append(conn.pick_replica(config.replica_routing))
         else:
-            return resultset
+            sticky = True
+            targets.append(conn)
+    return targets
+
+
+def _known_rowcount(result):
+    """``result``'s rowcount, or None where the driver doesn't know it"""
+    rowcount = getattr(result, "rowcount", -1)
+    if rowcount is None or rowcount < 0:
+        return None
+    return rowcount
+
+
+def _end_cell(conn, replicas, config, transaction, error=None):
+    """Commits the cell's work or, after ``error``, rolls it back"""
+    if error is None:
+        # one commit per cell, once the results are safely fetched
+        for replica in replicas:
+            _commit(conn=replica, config=config)
+        if transaction:
+            conn.commit()
+        else:
+            _commit(conn=conn, config=config)
+        return
+    for replica in conn.replicas:
+        replica.rollback()
+    if conn.in_transaction:
+        conn.rollback()
+        print("Transaction rolled back.")
+    else:
+        conn.needs_rollback = True
+
+
+def run(
+    conn,
+    sql,
+    config,
+    user_namespace,
+    timeout=None,
+    transaction=False,
+    sample=None,
+    seed=None,
+    progressive=False,
+):
+    """Runs each statement in ``sql``, returning the results of the last
+
+    ``timeout`` (seconds) overrides ``config.statement_timeout``.
+    ``sample`` (a percentage like ``"10%"``, or a number of rows) makes
+    the last statement read only a random sample of each table;
+    ``seed`` makes that sample repeatable.
+    With ``transaction``, all the statements are committed together,
+    or not at all.  A failed statement inside any explicit transaction
+    rolls the whole transaction back.
+    On KeyboardInterrupt, the running statement is cancelled through
+    the driver and the connection rolled back before re-raising.
+    Reads may run on one of ``conn``'s replicas; see ``_route``.
+    With ``config.query_cache_size``, the results of lone SELECTs are
+    cached, and served again until their tables change; see ``sql.cache``.
+    With ``progressive``, a ``ProgressiveResultSet`` is returned as soon
+    as the first rows arrive, and the commit waits until it has them
+    all; until then, ``conn.wait()`` blocks.
+    With ``config.query_log``, each statement run is recorded in that
+    log, failed or not; see ``sql.querylog``.
+    """
+    if sql.strip():
+        timeout = timeout or config.statement_timeout
+        replicas = []
+        executed = []
+        if transaction:
+            conn.begin()
+        try:
+            statements = list(split_statements(sql, conn.dialect.name)) or [sql]
+            if sample:
+                statements[-1] = _apply_sample(
+                    conn, statements[-1], config, sample, seed
+                )
+            statements[-1] = _apply_autolimit(conn, statements[-1], config)
+            targets = _route(conn, statements, config, user_namespace)
+            replicas = [t for t in conn.replicas if t in targets]
+            cached = None
+            if (
+                config.query_cache_size
+                and len(statements) == 1
+                and not (sample or progressive or transaction or conn.in_transaction)
+            ):
+                cached = cache.key(statements[0], user_namespace, config.autolimit)
+            if cached is not None:
+                entry, snapshot = cache.lookup(conn, *cached)
+                if entry is not None:
+                    _end_cell(conn, [], config, transaction)
+                    if config.feedback:
+                        print("%d rows, from cache." % len(entry.rows))
+                    proxy = FakeResultProxy(list(entry.rows), entry.keys)
+                    return _output(ResultSet(proxy, config), config)
+            with contextlib.ExitStack() as stack:
+                for target in [conn] + replicas:
+                    stack.enter_context(
+                        _namespace_frames(target, statements, user_namespace, config)
+                    )
+                    stack.enter_context(_statement_timeout(target, timeout))
+                # the background fetch needs a connection it can use from
+                # another thread, and a result it can add rows to
+                progressive = (
+                    progressive
+                    and not config.autopandas
+                    and not config.autopolars
+                    and not _thread_bound(targets[-1])
+                )
+                for idx, (statement, target) in enumerate(zip(statements, targets)):
+                    execution = querylog.begin(statement, target.name)
+                    executed.append(execution)
+                    result = _execute(
+                        target,
+                        statement,
+                        user_namespace,
+                        stream=progressive and idx == len(statements) - 1,
+                        timeout=timeout,
+                        in_list_threshold=config.in_list_threshold,
+                        autocommit=config.autocommit,
+                    )
+                    querylog.finish(execution, _known_rowcount(result))
+                    if target is not conn:
+                        target.record_latency(execution["duration"])
+                    if result and config.feedback:
+                        print(interpret_rowcount(result.rowcount))
+                if progressive and result.returns_rows:
+                    cleanup = stack.pop_all()
+
+                    def finish(error):
+                        cleanup.close()
+                        _end_cell(conn, replicas, config, transaction, error)
+
+                    try:
+                        resultset = ProgressiveResultSet(
+                            result, config, finish=finish
+                        )
+                    except Exception:
+                        cleanup.close()
+                        raise
+                    targets[-1].fetching = resultset.thread
+                    querylog.log(config, executed)
+                    return resultset
+                resultset = ResultSet(result, config)
+                if result.returns_rows:
+                    # the last statement's time includes fetching its rows
+                    querylog.finish(
+                        execution,
+                        len(resultset),
+                        querylog.result_bytes(resultset) if config.query_log else None,
+                    )
+            _end_cell(conn, replicas, config, transaction)
+            if cached is not None and result.returns_rows:
+                cache.store(
+                    conn, *cached, snapshot, resultset, config.query_cache_size
+                )
+        except Exception as ex:
+            querylog.fail(executed, ex)
+            _end_cell(conn, replicas, config, transaction, error=ex)
+            querylog.log(config, executed)
+            raise
+        except KeyboardInterrupt as ex:
+            querylog.fail(executed, ex)
+            for target in [conn] + conn.replicas:
+                _cancel(target)
+                try:
+                    target.rollback()
+                except Exception:
+                    # unusable after the interrupt; reconnect on next use
+                    target.internal_connection.invalidate()
+            querylog.log(config, executed)
+            raise
+        querylog.log(config, executed)
+        return _output(resultset, config)
         # returning only last result, intentionally
     else:
         return "Connected: %s" % conn.name
 
 
+def _highest(previous, column):
+    """The largest non-NULL value of ``column`` in an earlier result, if any
+
+    ``previous`` may be a ``ResultSet`` or a pandas or polars DataFrame."""
+    if isinstance(previous, ResultSet):
+        if column not in list(previous.keys):
+            return None
+        idx = list(previous.keys).index(column)
+        values = [row[idx] for row in previous if row[idx] is not None]
+        return max(values) if values else None
+    try:
+        highest = previous[column].max()
+    except Exception:
+        return None  # not a frame, or no such column
+    if hasattr(highest, "to_pydatetime"):
+        highest = highest.to_pydatetime()
+    elif hasattr(highest, "item"):
+        highest = highest.item()  # a NumPy scalar drivers can't bind
+    if highest is None or highest != highest:  # NULL or NaN
+        return None
+    return highest
+
+
+def _append(previous, newer):
+    """``previous`` with the rows of ``newer``, of the same kind, added
+
+    ``ResultSet`` and polars DataFrames are extended in place; pandas
+    DataFrames, which can't grow in place, are concatenated."""
+    if isinstance(previous, ResultSet):
+        previous.extend(newer)
+        return previous
+    if type(previous).__module__.startswith("polars"):
+        if hasattr(previous, "extend"):
+            return previous.extend(newer)
+        import polars
+
+        return polars.concat([previous, newer])
+    import pandas
+
+    return pandas.concat([previous, newer], ignore_index=True)
+
+
+def incremental(conn, sql, config, user_namespace, previous, column, **kwargs):
+    """Runs SELECT ``sql`` for the rows newer than those in ``previous``
+
+    ``previous`` is an earlier result of the same query - a ``ResultSet``,
+    or a pandas or polars DataFrame - whose ``column`` only grows, like a
+    timestamp or serial id.  Only rows with ``column`` above its highest
+    value in ``previous`` are fetched, and added to ``previous``, which
+    is returned.  Without a ``previous`` result of the same kind, the
+    whole query runs.  Other arguments are as for ``run``.
+    """
+    statements = parse(sql)
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        raise ValueError("Only a single SELECT statement can be run incrementally")
+    highest = _highest(previous, column)
+    if highest is None:
+        return run(conn, sql, config, user_namespace, **kwargs)
+    statement = str(statements[0])[: _end_of_sql(statements[0])]
+    newer = run(
+        conn,
+        "SELECT * FROM (%s) AS ipython_sql_incremental "
+        "WHERE %s > :ipython_sql_watermark" % (statement, column),
+        config,
+        dict(user_namespace, ipython_sql_watermark=highest),
+        **kwargs
+    )
+    if type(newer) is not type(previous) and not (
+        isinstance(previous, ResultSet) and isinstance(newer, ResultSet)
+    ):
+        raise TypeError(
+            "Can't add new rows to a %s; rerun without --incremental-on"
+            % type(previous).__name__
+        )
+    if config.feedback:
+        print("%d new rows above %s = %r" % (len(newer), column, highest))
+    return _append(previous, newer)
+
+
+# statements of each script file committed so far by ``run_file``,
+# by (path, connection), for ``resume``
+_checkpoints = {}
+
+
+def run_file(conn, path, config, user_namespace, commit_every, resume=False):
+    """Runs a SQL script file, streaming its statements as they are read
+
+    The file is never loaded whole: each statement is executed as soon
+    as ``sql.parse.iter_statements`` has read to its end, and a commit
+    issued after every ``commit_every`` statements, so huge dump files
+    run in constant memory.  With ``feedback``, progress is reported at
+    each commit.  If a statement fails, the work since the last commit
+    is rolled back and the error raised; with ``resume``, a later run of
+    the same file on the same connection skips the statements already
+    committed.  Returns a message saying how many statements ran.
+    """
+    if commit_every < 1:
+        raise ValueError("--commit-every must be a positive number of statements")
+    if conn.in_transaction:
+        raise ValueError("--commit-every can't be used inside a transaction")
+    key = (os.path.abspath(path), repr(conn.url))
+    skip = _checkpoints.get(key, 0) if resume else 0
+    size = os.path.getsize(path)
+    started = time.time()
+    committed = number = skip
+    # logged at each commit, not each statement, to keep up with the file
+    executed = []
+    with open(path, "r") as infile:
+        statements = iter_statements(infile, dialect=conn.dialect.name)
+        for number, (statement, line) in enumerate(statements, 1):
+            if number <= skip:
+                continue
+            execution = querylog.begin(statement, conn.name)
+            executed.append(execution)
+            try:
+                result = _execute(
+                    conn,
+                    statement,
+                    user_namespace,
+                    in_list_threshold=config.in_list_threshold,
+                    autocommit=config.autocommit,
+                )
+            except Exception as ex:
+                querylog.fail(executed, ex)
+                conn.rollback()
+                querylog.log(config, executed)
+                _checkpoints[key] = committed
+                print(
+                    "Statement %d (line %d) failed; %d statements were committed. "
+                    "Fix it, and rerun with --resume to carry on from there."
+                    % (number, line, committed)
+                )
+                raise
+            querylog.finish(execution, _known_rowcount(result))
+            if number - committed >= commit_every:
+                if conn.can_commit:
+                    conn.commit()
+                querylog.log(config, executed)
+                executed = []
+                committed = number
+                _checkpoints[key] = committed
+                if config.feedback:
+                    print(
+                        "%d statements committed (line %d, %d%% of the file), "
+                        "%.0f statements/s"
+                        % (
+                            committed,
+                            line,
+                            100 * infile.tell() / max(size, 1),
+                            (committed - skip) / max(time.time() - started, 1e-6),
+                        )
+                    )
+    if conn.can_commit:
+        conn.commit()
+    querylog.log(config, executed)
+    _checkpoints.pop(key, None)
+    return "%d statements run from %s%s" % (
+        number - skip,
+        path,
+        " (after %d skipped)" % skip if skip else "",
+    )
+
+
+def iter_batches(conn, sql, config, user_namespace, batch_size):
+    """Runs ``sql``, yielding the last statement's results in batches
+
+    Each batch is a ``ResultSet`` (or a DataFrame, with ``autopandas``
+    or ``autopolars``) of at most ``batch_size`` rows, fetched from a
+    streaming cursor only when the previous batch has been consumed,
+    so arbitrarily large results can be processed in constant memory.
+    ``autolimit`` caps the total number of rows across all batches.
+
+    Statements before the last are executed, and logged, as by ``run``.
+    The commit
+    is issued once the last statement's results are exhausted.
+    """
+    if batch_size < 1:
+        raise ValueError("batch size must be a positive number of rows")
+    statements = list(split_statements(sql, conn.dialect.name))
+    if not statements:
+        return
+    statements[-1] = _apply_autolimit(conn, statements[-1], config)
+    executed = []
+    with _namespace_frames(conn, statements, user_namespace, config):
+        try:
+            for statement in statements[:-1]:
+                execution = querylog.begin(statement, conn.name)
+                executed.append(execution)
+                result = _execute(
+                    conn,
+                    statement,
+                    user_namespace,
+                    in_list_threshold=config.in_list_threshold,
+                    autocommit=config.autocommit,
+                )
+                querylog.finish(execution, _known_rowcount(result))
+                if result and config.feedback:
+                    print(interpret_rowcount(result.rowcount))
+            execution = querylog.begin(statements[-1], conn.name)
+            executed.append(execution)
+            result = _execute(
+                conn,
+                statements[-1],
+                user_namespace,
+                stream=True,
+                in_list_threshold=config.in_list_threshold,
+                autocommit=config.autocommit,
+            )
+        except Exception as ex:
+            querylog.fail(executed, ex)
+            conn.needs_rollback = True
+            querylog.log(config, executed)
+            raise
+        # the last statement is logged once its rows are exhausted, or
+        # the batches abandoned, with the time taken until then
+        fetched = 0
+        try:
+            if not result.returns_rows:
+                querylog.finish(execution, _known_rowcount(result))
+                if config.feedback:
+                    print(interpret_rowcount(result.rowcount))
+                return
+            keys = list(result.keys())
+            remaining = config.autolimit or None
+            while remaining is None or remaining > 0:
+                size = batch_size if remaining is None else min(batch_size, remaining)
+                rows = result.fetchmany(size)
+                if not rows:
+                    break
+                fetched += len(rows)
+                if remaining is not None:
+                    remaining -= len(rows)
+                batch = ResultSet(FakeResultProxy(list(rows), keys), config)
+                del rows
+                yield _output(batch, config)
+                del batch  # let the consumer's copy be the only reference
+        except Exception as ex:
+            querylog.finish(execution, fetched, error=ex)
+            conn.needs_rollback = True
+            raise
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+            if execution["duration"] is None:
+                querylog.finish(execution, fetched)
+            querylog.log(config, executed)
+    _commit(conn=conn, config=config)
+
+
 class PrettyTable(prettytable.PrettyTable):
     def __init__(self, *args, **kwargs):
         self.row_count = 0
@@ -388,7 +1646,11 @@ class PrettyTable(prettytable.PrettyTable):
         return super(PrettyTable, self).__init__(*args, **kwargs)
 
     def add_rows(self, data):
-        if self.row_count and (data.config.displaylimit == self.displaylimit):
+        if (
+            self.row_count
+            and data.config.displaylimit == self.displaylimit
+            and self.row_count == min(len(data), self.displaylimit or len(data))
+        ):
             return  # correct number of rows already present
         self.clear_rows()
         self.displaylimit = data.config.displaylimit
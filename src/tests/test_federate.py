@@ -0,0 +1,84 @@
+import pytest
+
+from sql.connection import Connection
+from sql.federate import plan
+
+
+@pytest.fixture
+def aliased(tmp_path):
+    """Two SQLite databases, aliased ``shop`` and ``crm``"""
+    conns = []
+    for alias, ddl in (
+        (
+            "shop",
+            "CREATE TABLE orders (id INT, customer_id INT, total REAL, note TEXT)",
+        ),
+        ("crm", "CREATE TABLE customers (id INT, name TEXT, region TEXT)"),
+    ):
+        conn = Connection("sqlite:///%s" % (tmp_path / ("%s.db" % alias)))
+        conn.internal_connection.exec_driver_sql(ddl)
+        conn.alias = alias
+        conns.append(conn)
+    yield conns
+    for conn in conns:
+        Connection.close(conn)
+
+
+def test_plan_pushes_down_columns_and_conditions(aliased):
+    sources, statement = plan(
+        "SELECT c.name, sum(o.total) FROM shop.orders o "
+        "JOIN crm.customers c ON o.customer_id = c.id "
+        "WHERE o.total > 5 AND c.region = 'north' GROUP BY c.name"
+    )
+    orders, customers = sources
+    assert orders.query == (
+        "SELECT o.id, o.customer_id, o.total FROM orders AS o WHERE o.total > 5"
+    )
+    assert customers.query == (
+        "SELECT c.id, c.name, c.region FROM customers AS c " "WHERE c.region = 'north'"
+    )
+    assert "FROM shop_o AS o JOIN crm_c AS c ON" in str(statement)
+
+
+def test_plan_keeps_conditions_on_several_tables(aliased):
+    sources, _ = plan(
+        "SELECT o.id FROM shop.orders o, crm.customers c "
+        "WHERE o.customer_id = c.id OR c.region = 'south'"
+    )
+    assert all(not source.conditions for source in sources)
+
+
+def test_plan_fetches_every_column_for_wildcard(aliased):
+    sources, _ = plan("SELECT o.*, c.name FROM shop.orders o, crm.customers c")
+    orders, customers = sources
+    assert orders.columns is None
+    assert customers.columns == ["name"]
+
+
+def test_plan_count_star(aliased):
+    (orders,), _ = plan("SELECT count(*) FROM shop.orders")
+    assert orders.query == "SELECT orders.id FROM orders AS orders"
+
+
+def test_plan_keeps_conditions_on_outer_joined_tables(aliased):
+    (orders, customers), _ = plan(
+        "SELECT o.id FROM shop.orders o "
+        "LEFT JOIN crm.customers c ON o.customer_id = c.id "
+        "WHERE c.id IS NULL AND o.total > 5"
+    )
+    assert orders.conditions == ["o.total > 5"]
+    assert customers.conditions == []
+    (orders, customers), _ = plan(
+        "SELECT o.id FROM shop.orders o "
+        "RIGHT JOIN crm.customers c ON o.customer_id = c.id "
+        "WHERE o.total > 5 AND c.region = 'north'"
+    )
+    assert orders.conditions == []
+    assert customers.conditions == ["c.region = 'north'"]
+
+
+def test_plan_needs_aliased_tables(aliased):
+    with pytest.raises(ValueError):
+        plan("SELECT * FROM orders")
+    with pytest.raises(ValueError):
+        plan("DELETE FROM shop.orders")
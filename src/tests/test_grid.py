@@ -0,0 +1,87 @@
+import gc
+
+import pytest
+
+from sql import grid
+from sql.run import FakeResultProxy, ResultSet
+
+
+class Config(object):
+    autolimit = 0
+    style = "DEFAULT"
+    displaylimit = None
+    displaygrid = True
+
+
+def resultset(size):
+    rows = [(n, "row %d" % n, None) for n in range(size)]
+    return ResultSet(FakeResultProxy(rows, ["n", "name", "empty"]), Config())
+
+
+def test_window():
+    results = resultset(1000)
+    rows = grid.window(results, 10, 12)
+    assert rows == [[10, "row 10", None], [11, "row 11", None]]
+    assert len(grid.window(results, -5, 10000)) == grid.MAX_WINDOW
+
+
+def test_without_a_kernel_is_the_table():
+    results = resultset(1000)
+    assert results._repr_mimebundle_() is None
+    html = results._repr_html_()
+    assert "ipython-sql-grid" not in html
+    assert "row 999" in html
+
+
+def test_preview_holds_the_first_page():
+    html = grid.preview_html(resultset(1000))
+    assert "<th>name</th>" in html
+    assert "row %d" % (grid.FIRST_PAGE - 1) in html
+    assert "row %d" % grid.FIRST_PAGE not in html
+    assert "%d more rows" % (1000 - grid.FIRST_PAGE) in html
+    assert "more rows" not in grid.preview_html(resultset(3))
+
+
+class Widget(object):
+    def _repr_mimebundle_(self, **kwargs):
+        return {
+            "text/plain": "Grid()",
+            "application/vnd.jupyter.widget-view+json": {"model_id": "abc"},
+        }
+
+
+def test_bundle_with_a_kernel(monkeypatch):
+    monkeypatch.setattr(grid, "widget", lambda resultset: Widget())
+    bundle = resultset(1000)._repr_mimebundle_()
+    assert bundle["application/vnd.jupyter.widget-view+json"] == {"model_id": "abc"}
+    assert "row 999" not in bundle["text/html"]
+    assert "%d more rows" % (1000 - grid.FIRST_PAGE) in bundle["text/html"]
+
+
+def test_reply():
+    results = resultset(100)
+    request = {"request": 3, "start": 98, "stop": 150}
+    assert grid.reply(results, request) == {
+        "request": 3,
+        "start": 98,
+        "rows": [[98, "row 98", None], [99, "row 99", None]],
+        "total": 100,
+    }
+    assert grid.reply(None, {"request": 4}) == {"request": 4, "expired": True}
+
+
+def test_widget_serves_windows(monkeypatch):
+    pytest.importorskip("anywidget")
+    monkeypatch.setattr(grid, "_in_kernel", lambda: True)
+    results = resultset(100)
+    widget = grid.widget(results)
+    assert widget.keys == ["n", "name", "empty"]
+    assert widget.total == 100
+    assert len(widget.rows) == grid.FIRST_PAGE
+    sent = []
+    monkeypatch.setattr(widget, "send", sent.append)
+    widget._handle_custom_msg({"request": 1, "start": 98, "stop": 150}, [])
+    assert sent[0]["rows"] == [[98, "row 98", None], [99, "row 99", None]]
+    del results
+    gc.collect()
+    assert widget.comm is None  # closed with its result set
@@ -0,0 +1,86 @@
+import re
+
+import pytest
+
+from sql.connection import Connection
+from sql.lazy import run
+
+
+class Config(object):
+    autocommit = True
+    autolimit = 0
+    autopandas = False
+    autopolars = False
+    displaylimit = None
+    in_list_threshold = 1000
+    query_log = ""
+    style = "DEFAULT"
+    feedback = False
+    displaygrid = False
+
+
+@pytest.fixture
+def lazy(tmp_path):
+    conn = Connection.set("sqlite:///%s" % (tmp_path / "lazy.db"), displaycon=False)
+    conn.internal_connection.exec_driver_sql(
+        "CREATE TABLE sales (region TEXT, product TEXT, amount INT)"
+    )
+    for row in [
+        ("north", "tea", 3),
+        ("north", "cake", 5),
+        ("south", "tea", 7),
+        ("south", "tea", 1),
+    ]:
+        conn.internal_connection.exec_driver_sql(
+            "INSERT INTO sales VALUES (?, ?, ?)", row
+        )
+    conn.internal_connection.commit()
+    yield run(conn, "SELECT * FROM sales WHERE amount > :least", Config(), {"least": 0})
+    Connection.close(conn)
+
+
+def test_columns_without_rows(lazy):
+    assert lazy.columns == ["region", "product", "amount"]
+
+
+def test_filter_sort_head(lazy):
+    result = (
+        lazy.filter(lazy.c.amount > 1, product="tea").sort("-amount").head(1).collect()
+    )
+    assert list(result) == [("south", "tea", 7)]
+    assert lazy.filter("amount < 4").count() == 2
+
+
+def test_groupby_agg_runs_in_database(lazy):
+    grouped = lazy.groupby("region").agg(
+        {"amount": "sum"}, n=("product", "nunique"), average=("amount", "mean")
+    )
+    assert "GROUP BY" in grouped.sql()
+    result = grouped.sort("region").collect()
+    assert list(result) == [("north", 8, 2, 4.0), ("south", 8, 1, 4.0)]
+    assert result.keys == ["region", "amount", "n", "average"]
+
+
+def test_select(lazy):
+    result = lazy.select("product", double=lazy.c.amount * 2).sort("double").head(2)
+    assert list(result.collect()) == [("tea", 2), ("tea", 6)]
+
+
+def test_head_limits_the_sorted_query(lazy):
+    top = lazy.sort("-amount").head(3).head(2)
+    sql = top.sql()
+    assert sql.count("LIMIT") == 1
+    assert re.search(r"ORDER BY \S*amount DESC\s+LIMIT", sql)
+    assert list(top.collect()) == [("south", "tea", 7), ("north", "cake", 5)]
+    assert top.count() == 2
+    assert lazy.sort("amount").count() == 4
+
+
+def test_display_fetches_a_preview(lazy, monkeypatch):
+    import sql.lazy
+
+    monkeypatch.setattr(sql.lazy, "PREVIEW_ROWS", 2)
+    html = lazy.sort("amount")._repr_html_()
+    assert html.count("<tr>") == 3  # the header, and two rows
+    assert "First 2 rows" in html
+    assert "First" not in str(lazy.filter(lazy.c.amount > 4))
@@ -5,6 +5,8 @@ from textwrap import dedent
 
 import pytest
 
+import sql.querylog
+
 
 def runsql(ip_session, statements):
     if isinstance(statements, str):
@@ -125,6 +127,543 @@ def test_autolimit(ip):
     assert len(result) == 1
 
 
+def test_autolimit_pushed_into_sql(ip, capsys):
+    ip.run_line_magic("config", "SqlMagic.autolimit = 1")
+    try:
+        result = runsql(ip, "SELECT * FROM test;")
+        assert "Limited to 1 rows by autolimit" in capsys.readouterr().out
+        assert len(result) == 1
+        result = runsql(ip, "SELECT * FROM test LIMIT 2;")
+        assert "autolimit" not in capsys.readouterr().out
+        assert len(result) == 1
+    finally:
+        ip.run_line_magic("config", "SqlMagic.autolimit = 0")
+
+
+def test_sample(ip):
+    runsql(
+        ip,
+        "CREATE TABLE numbers AS WITH RECURSIVE c(x) AS "
+        "(SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 1000) SELECT x FROM c",
+    )
+    try:
+        rows = ip.run_line_magic("sql", "--sample 10 sqlite:// SELECT * FROM numbers")
+        assert len(rows) == 10
+        sampled = ip.run_line_magic(
+            "sql", "--sample 10% --seed 42 sqlite:// SELECT COUNT(*) FROM numbers n"
+        )[0][0]
+        assert 0 < sampled < 1000
+        resampled = ip.run_line_magic(
+            "sql", "--sample 10% --seed 42 sqlite:// SELECT COUNT(*) FROM numbers n"
+        )[0][0]
+        assert sampled == resampled
+    finally:
+        runsql(ip, "DROP TABLE numbers")
+
+
+def test_seeded_sample_is_not_evenly_spaced(ip):
+    runsql(
+        ip,
+        "CREATE TABLE numbers AS WITH RECURSIVE c(x) AS "
+        "(SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 10000) SELECT x FROM c",
+    )
+    try:
+        query = "--sample 10 --seed %d sqlite:// SELECT x FROM numbers"
+        samples = [
+            sorted(row[0] for row in ip.run_line_magic("sql", query % seed))
+            for seed in (3, 4)
+        ]
+        for sample in samples:
+            assert len(sample) == 10
+            steps = {later - earlier for earlier, later in zip(sample, sample[1:])}
+            assert len(steps) > 1
+        assert samples[0] != samples[1]
+    finally:
+        runsql(ip, "DROP TABLE numbers")
+
+
+def test_query_dataframes_in_duckdb(ip):
+    pytest.importorskip("duckdb_engine")
+    pd = pytest.importorskip("pandas")
+    ip.user_global_ns["frame"] = pd.DataFrame({"n": [1, 2, 3], "name": list("abc")})
+    ip.user_global_ns["shadowed"] = pd.DataFrame({"n": [100]})
+    try:
+        ip.run_line_magic("sql", "duckdb:// CREATE TABLE shadowed AS SELECT 1 AS n")
+        result = ip.run_line_magic(
+            "sql", "SELECT SUM(frame.n) + MAX(shadowed.n) FROM frame, shadowed"
+        )
+        assert result[0][0] == 7
+        # views over the frames are gone once the query is done
+        tables = ip.run_line_magic(
+            "sql", "SELECT table_name FROM information_schema.tables"
+        )
+        assert ("frame",) not in tables
+    finally:
+        ip.run_line_magic("sql", "duckdb:// DROP TABLE shadowed")
+        runsql(ip, "")
+
+
+def test_chunks(ip):
+    ip.run_line_magic("config", "SqlMagic.autolimit = 0")
+    ip.run_line_magic("config", "SqlMagic.autopandas = False")
+    batches = list(ip.run_line_magic("sql", "--chunks 1 sqlite:// SELECT * FROM test"))
+    assert len(batches) == 2
+    assert [len(batch) for batch in batches] == [1, 1]
+    assert batches[1][0] == (2, "bar")
+
+
+def test_chunks_respect_autolimit(ip):
+    ip.run_line_magic("config", "SqlMagic.autolimit = 3")
+    runsql(ip, "INSERT INTO test VALUES (3, 'baz'), (4, 'qux')")
+    batches = list(ip.run_line_magic("sql", "--chunks 2 sqlite:// SELECT * FROM test"))
+    ip.run_line_magic("config", "SqlMagic.autolimit = 0")
+    assert [len(batch) for batch in batches] == [2, 1]
+
+
+ENDLESS_QUERY = (
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) "
+    "SELECT COUNT(*) FROM c"
+)
+
+
+def test_timeout(ip):
+    result = ip.run_line_magic("sql", "--timeout 0.2 sqlite:// " + ENDLESS_QUERY)
+    assert result is None  # interrupted; error printed
+    assert runsql(ip, "SELECT * FROM test;")[0][0] == 1
+
+
+def test_statement_timeout_config(ip):
+    ip.run_line_magic("config", "SqlMagic.statement_timeout = 0.2")
+    try:
+        assert runsql(ip, ENDLESS_QUERY) is None
+    finally:
+        ip.run_line_magic("config", "SqlMagic.statement_timeout = None")
+    assert runsql(ip, "SELECT * FROM test;")[0][0] == 1
+
+
+def test_rollback_only_after_failure(ip):
+    from sqlalchemy import event
+
+    conn = runsql(ip, "%sql -l")["sqlite://"]
+    rollbacks = []
+
+    def on_rollback(connection):
+        rollbacks.append(connection)
+
+    event.listen(conn.internal_connection, "rollback", on_rollback)
+    try:
+        runsql(ip, "SELECT * FROM test;")
+        runsql(ip, "SELECT * FROM test;")
+        assert not rollbacks
+        runsql(ip, "SELECT * FROM no_such_table;")
+        assert runsql(ip, "SELECT * FROM test;")[0][0] == 1
+        assert len(rollbacks) == 1
+    finally:
+        event.remove(conn.internal_connection, "rollback", on_rollback)
+
+
+def test_one_commit_per_cell(ip):
+    from sqlalchemy import event
+
+    conn = runsql(ip, "%sql -l")["sqlite://"]
+    commits = []
+
+    def on_commit(connection):
+        commits.append(connection)
+
+    event.listen(conn.internal_connection, "commit", on_commit)
+    try:
+        ip.run_cell_magic(
+            "sql",
+            "",
+            """
+            sqlite://
+            INSERT INTO test VALUES (3, 'baz');
+            INSERT INTO test VALUES (4, 'qux');
+            """,
+        )
+    finally:
+        event.remove(conn.internal_connection, "commit", on_commit)
+    assert len(commits) == 1
+    assert len(runsql(ip, "SELECT * FROM test;")) == 4
+
+
+def test_transaction_in_cell(ip):
+    ip.run_cell_magic(
+        "sql",
+        "",
+        """
+        sqlite://
+        BEGIN;
+        INSERT INTO test VALUES (3, 'baz');
+        ROLLBACK;
+        """,
+    )
+    assert len(runsql(ip, "SELECT * FROM test;")) == 2
+
+
+def test_transaction_keeps_earlier_statements(ip):
+    ip.run_cell_magic(
+        "sql",
+        "",
+        """
+        sqlite://
+        INSERT INTO test VALUES (3, 'baz');
+        BEGIN;
+        INSERT INTO test VALUES (4, 'qux');
+        ROLLBACK;
+        """,
+    )
+    assert runsql(ip, "SELECT * FROM test WHERE n > 2;") == [(3, "baz")]
+    runsql(ip, "DELETE FROM test WHERE n = 3")
+
+
+def test_transaction_across_cells(ip):
+    runsql(ip, "BEGIN")
+    runsql(ip, "INSERT INTO test VALUES (3, 'baz')")
+    runsql(ip, "INSERT INTO test VALUES (4, 'qux')")
+    runsql(ip, "ROLLBACK")
+    assert len(runsql(ip, "SELECT * FROM test;")) == 2
+    ip.run_line_magic("sql", "--transaction sqlite://")
+    runsql(ip, "INSERT INTO test VALUES (3, 'baz')")
+    runsql(ip, "COMMIT")
+    assert len(runsql(ip, "SELECT * FROM test;")) == 3
+
+
+def test_transaction_flag_is_atomic(ip):
+    ip.run_cell_magic(
+        "sql",
+        "--transaction",
+        """
+        sqlite://
+        INSERT INTO test VALUES (3, 'baz');
+        INSERT INTO no_such_table VALUES (4, 'qux');
+        """,
+    )
+    assert len(runsql(ip, "SELECT * FROM test;")) == 2
+
+
+def test_federated(ip, tmp_path):
+    ip.run_line_magic("sql", "--alias mem sqlite://")
+    shop = "sqlite:///%s" % (tmp_path / "shop.db")
+    ip.run_line_magic("sql", "--alias shop %s CREATE TABLE orders (author, n)" % shop)
+    ip.run_line_magic("sql", "%s INSERT INTO orders VALUES ('Brecht', 3)" % shop)
+    ip.run_line_magic("sql", "%s INSERT INTO orders VALUES ('Brecht', 4)" % shop)
+    try:
+        result = ip.run_cell_magic(
+            "sql",
+            "--federated",
+            """
+            SELECT a.first_name, sum(o.n)
+            FROM shop.orders o JOIN mem.author a ON o.author = a.last_name
+            WHERE o.n > 3
+            GROUP BY a.first_name
+            """,
+        )
+    finally:
+        ip.run_line_magic("sql", "-x %s" % shop)
+    assert list(result) == [("Bertold", 4)]
+
+
+def test_federated_anti_join(ip, tmp_path):
+    shop = "sqlite:///%s" % (tmp_path / "shop.db")
+    crm = "sqlite:///%s" % (tmp_path / "crm.db")
+    ip.run_line_magic("sql", "--alias shop %s CREATE TABLE orders (id, cid)" % shop)
+    ip.run_line_magic(
+        "sql", "%s INSERT INTO orders VALUES (1, 1), (2, 2), (3, 9)" % shop
+    )
+    ip.run_line_magic("sql", "--alias crm %s CREATE TABLE customers (id)" % crm)
+    ip.run_line_magic("sql", "%s INSERT INTO customers VALUES (1), (2)" % crm)
+    try:
+        result = ip.run_cell_magic(
+            "sql",
+            "--federated",
+            """
+            SELECT o.id FROM shop.orders o LEFT JOIN crm.customers c
+            ON o.cid = c.id WHERE c.id IS NULL
+            """,
+        )
+    finally:
+        ip.run_line_magic("sql", "-x %s" % shop)
+        ip.run_line_magic("sql", "-x %s" % crm)
+    assert list(result) == [(3,)]
+
+
+def test_materialize(ip, tmp_path):
+    ip.run_line_magic(
+        "config", 'SqlMagic.materialize_engine = "sqlite:///%s/{name}.db"' % tmp_path
+    )
+    try:
+        message = ip.run_line_magic(
+            "sql",
+            "--materialize authors --watermark year_of_death sqlite:// "
+            "SELECT * FROM author",
+        )
+        assert message.startswith("2 rows materialized into authors")
+        local = "sqlite:///%s/authors.db" % tmp_path
+        runsql(ip, "INSERT INTO author VALUES ('Bertolt', 'Brecht', 1956)")
+        runsql(ip, "INSERT INTO author VALUES ('Dario', 'Fo', 2016)")
+        message = ip.run_line_magic("sql", "--refresh authors")
+        assert message.startswith("1 new rows refreshed in authors")
+        result = ip.run_line_magic(
+            "sql", "%s SELECT last_name FROM authors ORDER BY year_of_death" % local
+        )
+        assert [row[0] for row in result] == ["Shakespeare", "Brecht", "Fo"]
+        result = ip.run_line_magic(
+            "sql", "%s SELECT rows FROM ipython_sql_materialized" % local
+        )
+        assert result[0][0] == 3
+    finally:
+        ip.run_line_magic("sql", "-x %s" % local)
+        ip.run_line_magic(
+            "config", 'SqlMagic.materialize_engine = "sqlite:///ipython_sql_{name}.db"'
+        )
+
+
+def test_incremental_on(ip):
+    ip.user_global_ns.pop("authors", None)
+    ip.run_line_magic(
+        "sql", "--incremental-on year_of_death sqlite:// authors << SELECT * FROM author"
+    )
+    authors = ip.user_global_ns["authors"]
+    assert len(authors) == 2
+    runsql(ip, "INSERT INTO author VALUES ('Dario', 'Fo', 2016)")
+    ip.run_line_magic(
+        "sql", "--incremental-on year_of_death sqlite:// authors << SELECT * FROM author"
+    )
+    assert ip.user_global_ns["authors"] is authors
+    assert [row[1] for row in authors] == ["Shakespeare", "Brecht", "Fo"]
+
+
+def test_incremental_on_dataframe(ip):
+    pytest.importorskip("pandas")
+    ip.user_global_ns.pop("authors", None)
+    ip.run_line_magic("config", "SqlMagic.autopandas = True")
+    try:
+        ip.run_line_magic(
+            "sql",
+            "--incremental-on year_of_death sqlite:// authors << SELECT * FROM author",
+        )
+        runsql(ip, "INSERT INTO author VALUES ('Dario', 'Fo', 2016)")
+        ip.run_line_magic(
+            "sql",
+            "--incremental-on year_of_death sqlite:// authors << SELECT * FROM author",
+        )
+    finally:
+        ip.run_line_magic("config", "SqlMagic.autopandas = False")
+    assert ip.user_global_ns["authors"].last_name.tolist() == [
+        "Shakespeare",
+        "Brecht",
+        "Fo",
+    ]
+
+
+def test_query_cache(ip, tmp_path):
+    import sqlite3
+
+    from sql.connection import Connection
+
+    path = tmp_path / "cached.db"
+    db = "sqlite:///%s" % path
+    ip.run_line_magic("config", "SqlMagic.query_cache_size = 10")
+    try:
+        ip.run_line_magic("sql", "%s CREATE TABLE n (n INT)" % db)
+        ip.run_line_magic("sql", "%s INSERT INTO n VALUES (1)" % db)
+        query = "%s SELECT count(*) FROM n" % db
+        assert ip.run_line_magic("sql", query)[0][0] == 1
+        conn = Connection.current
+        assert len(conn.query_cache) == 1
+        assert ip.run_line_magic("sql", query)[0][0] == 1
+
+        # written through %sql
+        ip.run_line_magic("sql", "%s INSERT INTO n VALUES (2)" % db)
+        assert not conn.query_cache
+        assert ip.run_line_magic("sql", query)[0][0] == 2
+
+        # written elsewhere
+        other = sqlite3.connect(str(path))
+        other.execute("INSERT INTO n VALUES (3)")
+        other.commit()
+        other.close()
+        assert len(conn.query_cache) == 1
+        assert ip.run_line_magic("sql", query)[0][0] == 3
+
+        # cut short by autolimit, where LIMIT couldn't be rewritten
+        limited = "%s SELECT * FROM n LIMIT 3" % db
+        ip.run_line_magic("config", "SqlMagic.autolimit = 2")
+        assert len(ip.run_line_magic("sql", limited)) == 2
+        ip.run_line_magic("config", "SqlMagic.autolimit = 0")
+        assert len(ip.run_line_magic("sql", limited)) == 3
+    finally:
+        ip.run_line_magic("config", "SqlMagic.autolimit = 0")
+        ip.run_line_magic("config", "SqlMagic.query_cache_size = 0")
+        ip.run_line_magic("sql", "-x %s" % db)
+
+
+def test_query_log(ip, tmp_path):
+    log = tmp_path / "log.db"
+    ip.run_line_magic("config", "SqlMagic.query_log = %r" % str(log))
+    try:
+        for year in (1600, 1900, 2000):
+            ip.run_line_magic(
+                "sql",
+                "sqlite:// SELECT * FROM author WHERE year_of_death > %d" % year,
+            )
+        top = ip.run_line_magic("sql", "--top-queries 1")
+        assert len(top) == 1
+        row = top.dict()
+        assert row["calls"] == (3,)
+        assert row["query"] == ("SELECT * FROM author WHERE year_of_death > ?",)
+        assert row["rows"] == (3,)
+        assert row["p50_s"][0] <= row["p95_s"][0] <= row["p99_s"][0]
+    finally:
+        ip.run_line_magic("config", "SqlMagic.query_log = ''")
+
+
+def test_query_log_failures_and_other_paths(ip, tmp_path):
+    log = tmp_path / "log.db"
+    ip.run_line_magic("config", "SqlMagic.query_log = %r" % str(log))
+    try:
+        ip.run_line_magic("sql", "sqlite:// SELECT * FROM no_such_table")
+        list(ip.run_line_magic("sql", "--chunks 1 sqlite:// SELECT * FROM test"))
+        ip.run_line_magic("sql", "--lazy sqlite:// authors << SELECT * FROM author")
+        ip.user_global_ns["authors"].collect()
+        keys, rows = sql.querylog.top(str(log))
+        logged = {row[-1]: dict(zip(keys, row)) for row in rows}
+        assert logged["SELECT * FROM no_such_table"]["errors"] == 1
+        assert logged["SELECT * FROM test"]["rows"] == 2
+        assert logged["SELECT * FROM test"]["errors"] == 0
+        assert any(
+            "author" in query and entry["rows"] == 2
+            for query, entry in logged.items()
+        )
+    finally:
+        ip.run_line_magic("config", "SqlMagic.query_log = ''")
+
+
+def test_lazy(ip):
+    ip.run_line_magic("sql", "--lazy sqlite:// authors << SELECT * FROM author")
+    authors = ip.user_global_ns["authors"]
+    assert authors.columns == ["first_name", "last_name", "year_of_death"]
+    recent = authors.filter(authors.c.year_of_death > 1900).select("last_name")
+    assert list(recent.collect()) == [("Brecht",)]
+    assert "Brecht" in recent._repr_html_()
+
+
+def test_partition_on(ip, tmp_path):
+    from sql.connection import Connection
+
+    db = "sqlite:///%s" % (tmp_path / "big.db")
+    ip.run_line_magic("sql", "%s CREATE TABLE big (id, name)" % db)
+    for n in range(20):
+        ip.run_line_magic(
+            "sql", "%s INSERT INTO big VALUES (%d, 'row %d')" % (db, n, n)
+        )
+    ip.run_line_magic("sql", "%s INSERT INTO big VALUES (NULL, 'no id')" % db)
+    try:
+        result = ip.run_line_magic(
+            "sql", "--partition-on id --partitions 3 %s SELECT * FROM big" % db
+        )
+        bounded = ip.run_line_magic(
+            "sql",
+            "--partition-on id --partition-bounds 5,10 %s "
+            "SELECT id, name FROM big WHERE id > 2" % db,
+        )
+        ip.run_line_magic(
+            "sql", "--partition-on nosuch --partitions 3 %s SELECT * FROM big" % db
+        )
+        assert Connection.current.needs_rollback
+    finally:
+        ip.run_line_magic("sql", "-x %s" % db)
+    assert sorted(result, key=str) == sorted(
+        [(n, "row %d" % n) for n in range(20)] + [(None, "no id")], key=str
+    )
+    assert len(bounded) == 17
+
+
+def test_fanout(ip, tmp_path):
+    shards = ["sqlite:///%s" % (tmp_path / ("shard%d.db" % n)) for n in range(3)]
+    for n, shard in enumerate(shards[:2]):
+        ip.run_line_magic(
+            "sql", "--alias shard%d %s CREATE TABLE t (x)" % (n, shard)
+        )
+        ip.run_line_magic("sql", "%s INSERT INTO t VALUES (%d)" % (shard, n))
+    ip.run_line_magic("sql", "--alias shard2 %s SELECT 1" % shards[2])
+    try:
+        result = ip.run_line_magic("sql", "--fanout shard* SELECT x FROM t")
+    finally:
+        for shard in shards:
+            ip.run_line_magic("sql", "-x %s" % shard)
+    assert list(result) == [("shard0", 0), ("shard1", 1)]
+    assert result.keys == ["source", "x"]
+    assert "no such table" in str(result.shards[2].error)
+
+
+def test_replica_routing(ip, tmp_path):
+    urls = ["sqlite:///%s" % (tmp_path / db) for db in ("primary.db", "replica.db")]
+    for url in urls:
+        ip.run_line_magic("sql", "%s CREATE TABLE t (source)" % url)
+        ip.run_line_magic("sql", "%s INSERT INTO t VALUES ('%s')" % (url, url))
+    primary, replica = urls
+    ip.run_line_magic("sql", "--replica-of %s %s" % (primary, replica))
+    try:
+        read = ip.run_line_magic("sql", "%s SELECT source FROM t" % primary)
+        after_write = ip.run_cell_magic(
+            "sql",
+            primary,
+            "INSERT INTO t VALUES ('new'); SELECT count(*) FROM t",
+        )
+        assert read[0][0] == replica
+        assert after_write[0][0] == 2
+        # a long IN list needs a temporary table, so is read on the primary
+        ip.user_ns["ids"] = list(range(5))
+        ip.run_line_magic("config", "SqlMagic.in_list_threshold = 2")
+        long_list = ip.run_line_magic(
+            "sql", "%s SELECT source FROM t WHERE 1 IN :ids" % primary
+        )
+        assert long_list[0][0] == primary
+        # so does a DataFrame used as a table
+        pandas = pytest.importorskip("pandas")
+        ip.user_ns["frame"] = pandas.DataFrame({"n": [1]})
+        frame_read = ip.run_line_magic(
+            "sql", "%s SELECT source FROM t JOIN :frame f ON f.n = 1" % primary
+        )
+        assert frame_read[0][0] == primary
+    finally:
+        ip.run_line_magic("config", "SqlMagic.in_list_threshold = 1000")
+        for url in urls:
+            ip.run_line_magic("sql", "-x %s" % url)
+
+
+def test_progressive(ip, tmp_path):
+    db = "sqlite:///%s" % (tmp_path / "slow.db")
+    ip.run_line_magic(
+        "sql",
+        "%s CREATE TABLE slow AS WITH RECURSIVE c(n) AS "
+        "(SELECT 1 UNION ALL SELECT n + 1 FROM c WHERE n < 3000) SELECT n FROM c"
+        % db,
+    )
+    try:
+        result = ip.run_line_magic("sql", "--progressive %s SELECT n FROM slow" % db)
+        assert len(result) >= 1000
+        str(result)  # displayed, perhaps before all the rows are in
+        assert result.wait() is result
+        assert len(result) == 3000
+        assert "3000 rows in" in result.status()
+        assert "| 3000 |" in str(result)
+        # whole-result uses wait for every row, not just those in so far
+        result = ip.run_line_magic("sql", "--progressive %s SELECT n FROM slow" % db)
+        assert len(result) == 3000
+        result = ip.run_line_magic("sql", "--progressive %s SELECT n FROM slow" % db)
+        assert len(result.dict()["n"]) == 3000
+        ip.run_line_magic("config", "SqlMagic.column_local_vars = True")
+        ip.run_line_magic("sql", "--progressive %s SELECT n FROM slow" % db)
+        assert len(ip.user_global_ns["n"]) == 3000
+    finally:
+        ip.run_line_magic("config", "SqlMagic.column_local_vars = False")
+        ip.run_line_magic("sql", "-x %s" % db)
+
+
 def test_persist(ip):
     runsql(ip, "")
     ip.run_cell("results = %sql SELECT * FROM test;")
@@ -228,6 +767,7 @@ def test_column_local_vars(ip):
     assert "William" in ip.user_global_ns["first_name"]
     assert "Shakespeare" in ip.user_global_ns["last_name"]
     assert len(ip.user_global_ns["first_name"]) == 2
+    assert ip.user_global_ns["year_of_death"].sum() == 1616 + 1956
     ip.run_line_magic("config", "SqlMagic.column_local_vars = False")
 
 
@@ -250,6 +790,40 @@ def test_bind_vars(ip):
     assert result[0][0] == 22
 
 
+def test_bind_list(ip):
+    ip.user_global_ns["names"] = ["foo", "baz"]
+    result = runsql(ip, "SELECT n FROM test WHERE name IN :names")
+    assert list(result) == [(1,)]
+    result = runsql(ip, "SELECT n FROM test WHERE name NOT IN (:names)")
+    assert list(result) == [(2,)]
+
+
+def test_bind_long_list_through_temp_table(ip):
+    ip.run_line_magic("config", "SqlMagic.in_list_threshold = 2")
+    ip.user_global_ns["ns"] = tuple(range(2, 100))
+    try:
+        result = runsql(ip, "SELECT name FROM test WHERE n IN :ns")
+    finally:
+        ip.run_line_magic("config", "SqlMagic.in_list_threshold = 1000")
+    assert list(result) == [("bar",)]
+
+
+def test_dataframe_as_table(ip):
+    ip.run_cell("import gc; import pandas as pd; import sql.connection")
+    ip.run_cell("frame = pd.DataFrame({'n': [1, 2], 'name': ['foo', 'x']})")
+    result = runsql(ip, "SELECT f.n FROM :frame f JOIN test ON f.name = test.name")
+    assert list(result) == [(1,)]
+    conn = ip.user_ns["sql"].connection.Connection.current
+    (table,) = [entry[2] for entry in conn.frame_tables.values()]
+    runsql(ip, "SELECT count(*) FROM :frame")
+    assert [entry[2] for entry in conn.frame_tables.values()] == [table]
+
+    ip.run_cell("del frame; gc.collect()")
+    assert not conn.frame_tables
+    runsql(ip, "SELECT 1")
+    assert (table,) not in runsql(ip, "SELECT name FROM sqlite_temp_master")
+
+
 def test_autopandas(ip):
     ip.run_line_magic("config", "SqlMagic.autopandas = True")
     dframe = runsql(ip, "SELECT * FROM test;")
@@ -258,6 +832,41 @@ def test_autopandas(ip):
     assert dframe.name[0] == "foo"
 
 
+def test_typed_dataframe(ip):
+    pytest.importorskip("pandas")
+    ip.run_line_magic("config", "SqlMagic.autopandas = False")
+    result = runsql(
+        ip,
+        """SELECT 1 AS n, 'a' AS kind, 'x' AS label, 1.5 AS amount, '2024-01-02' AS day
+           UNION ALL SELECT NULL, 'a', 'y', NULL, NULL
+           UNION ALL SELECT 300, 'a', 'z', 2.5, NULL""",
+    )
+    frame = result.DataFrame(typed=True)
+    assert str(frame.n.dtype) == "Int64"
+    assert frame.n.isna().tolist() == [False, True, False]
+    assert str(frame.kind.dtype) == "category"
+    assert str(frame.label.dtype).startswith("string")
+    assert str(frame.amount.dtype) == "float64"
+    assert str(frame.day.dtype) == "category"  # strings, as SQLite has no dates
+    downcast = result.DataFrame(typed=True, downcast=True)
+    assert str(downcast.n.dtype) == "Int16"
+    assert str(downcast.amount.dtype) == "float32"
+    assert str(result.DataFrame().n.dtype) == "float64"
+
+
+def test_typed_dataframe_decimals():
+    import decimal
+
+    pandas = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    from sql.run import _compact_column
+
+    values = [decimal.Decimal("0.10"), None, decimal.Decimal("12345678901234567.89"), 3]
+    series = _compact_column(pandas, values, downcast=True)
+    assert str(series.dtype) == "decimal128(19, 2)[pyarrow]"
+    assert series.sum() == decimal.Decimal("12345678901234570.99")
+
+
 def test_csv(ip):
     ip.run_line_magic("config", "SqlMagic.autopandas = False")  # uh-oh
     result = runsql(ip, "SELECT * FROM test;")
@@ -291,6 +900,57 @@ def test_sql_from_file(ip):
         assert result.result == [(1, "foo"), (2, "bar")]
 
 
+def test_sql_from_file_streaming(ip, tmp_path, capsys):
+    script = tmp_path / "load.sql"
+    script.write_text(
+        "CREATE TABLE loaded (n INT, note TEXT);\n"
+        + "".join("INSERT INTO loaded VALUES (%d, 'x;y');\n" % n for n in range(5))
+        + "INSERT INTO missing VALUES (1);\n"
+        + "INSERT INTO loaded VALUES (5, 'z');\n"
+    )
+    db = "sqlite:///%s" % (tmp_path / "loaded.db")
+    try:
+        ip.run_cell("%%sql --file %s --commit-every 2 %s" % (script, db))
+        assert "no such table: missing" in capsys.readouterr().out
+        # statements 1-6 committed in pairs; the 7th failed
+        assert ip.run_line_magic("sql", "%s SELECT count(*) FROM loaded" % db)[0][0] == 5
+        ip.run_line_magic("sql", "%s CREATE TABLE missing (n INT)" % db)
+        message = ip.run_line_magic(
+            "sql", "--file %s --commit-every 2 --resume %s" % (script, db)
+        )
+        assert message.endswith("(after 6 skipped)")
+        assert ip.run_line_magic("sql", "%s SELECT count(*) FROM loaded" % db)[0][0] == 6
+    finally:
+        ip.run_line_magic("sql", "-x %s" % db)
+
+
+def test_sql_from_file_streaming_trigger(ip, tmp_path):
+    script = tmp_path / "trigger.sql"
+    script.write_text(
+        "CREATE TABLE t (n INT);\n"
+        "CREATE TABLE audit (n INT, note TEXT);\n"
+        "CREATE TRIGGER t_audit AFTER INSERT ON t BEGIN\n"
+        "  INSERT INTO audit VALUES (new.n, 'it''s; \\');\n"
+        "  UPDATE audit SET n = CASE WHEN n > 1 THEN n ELSE 0 END;\n"
+        "END;\n"
+        "INSERT INTO t VALUES (1);\n"
+    )
+    db = "sqlite:///%s" % (tmp_path / "trigger.db")
+    try:
+        message = ip.run_line_magic(
+            "sql", "--file %s --commit-every 10 %s" % (script, db)
+        )
+        assert message.startswith("4 statements run")
+        result = ip.run_line_magic("sql", "%s SELECT * FROM audit" % db)
+        assert list(result) == [(0, "it's; \\")]
+        with pytest.raises(ValueError):
+            ip.run_cell_magic(
+                "sql", "--file %s --commit-every 10 %s" % (script, db), "SELECT 1"
+            )
+    finally:
+        ip.run_line_magic("sql", "-x %s" % db)
+
+
 def test_sql_from_nonexistent_file(ip):
     ip.run_line_magic("config", "SqlMagic.autopandas = False")
     with tempfile.TemporaryDirectory() as tempdir:
@@ -309,6 +969,51 @@ def test_dict(ip):
     assert len(result["last_name"]) == 2
 
 
+def test_to_numpy(ip):
+    numpy = pytest.importorskip("numpy")
+    result = runsql(ip, "SELECT * FROM author;")
+    array = result.to_numpy()
+    assert array.dtype.names == ("first_name", "last_name", "year_of_death")
+    assert array["year_of_death"].dtype == numpy.int64
+    assert list(array["last_name"]) == ["Shakespeare", "Brecht"]
+    assert result.arrays()["year_of_death"].tolist() == [1616, 1956]
+
+
+def test_autopolars(ip):
+    pl = pytest.importorskip("polars")
+    ip.run_line_magic("config", "SqlMagic.autopolars = True")
+    try:
+        frame = runsql(ip, "SELECT * FROM author;")
+        assert isinstance(frame, pl.DataFrame)
+        assert frame["year_of_death"].to_list() == [1616, 1956]
+        ip.run_line_magic("config", "SqlMagic.polars_lazy = True")
+        lazy = runsql(ip, "SELECT * FROM author;")
+        assert isinstance(lazy, pl.LazyFrame)
+        assert lazy.filter(pl.col("year_of_death") > 1900).collect().height == 1
+    finally:
+        ip.run_line_magic("config", "SqlMagic.autopolars = False")
+        ip.run_line_magic("config", "SqlMagic.polars_lazy = False")
+
+
+def test_duplicate_columns_to_polars_and_numpy(ip):
+    pytest.importorskip("numpy")
+    pl = pytest.importorskip("polars")
+    join = (
+        "SELECT a.last_name, b.last_name FROM author a "
+        "JOIN author b ON a.year_of_death < b.year_of_death;"
+    )
+    assert runsql(ip, join).to_numpy().dtype.names == ("last_name", "last_name_1")
+    assert list(runsql(ip, join).arrays()) == ["last_name", "last_name_1"]
+    ip.run_line_magic("config", "SqlMagic.autopolars = True")
+    try:
+        frame = runsql(ip, join)
+        assert isinstance(frame, pl.DataFrame)
+        assert frame.row(0) == ("Shakespeare", "Brecht")
+        assert frame.columns == ["last_name", "last_name_1"]
+    finally:
+        ip.run_line_magic("config", "SqlMagic.autopolars = False")
+
+
 def test_dicts(ip):
     result = runsql(ip, "SELECT * FROM author;")
     for row in result.dicts():
@@ -0,0 +1,60 @@
+import datetime
+
+import pytest
+
+from sql.connection import Connection
+from sql.parallel import parse_bounds, partition_starts, resolve_connections
+
+
+def test_partition_starts_integers():
+    assert partition_starts(1, 100, 4) == [1, 26, 51, 76]
+    assert partition_starts(1, 3, 10) == [1, 2, 3]
+
+
+def test_partition_starts_floats_and_dates():
+    assert partition_starts(0.0, 1.0, 4) == [0.0, 0.25, 0.5, 0.75]
+    assert partition_starts(
+        datetime.date(2024, 1, 1), datetime.date(2024, 1, 3), 4
+    ) == [datetime.date(2024, 1, 1), datetime.date(2024, 1, 2)]
+
+
+def test_partition_starts_times():
+    assert partition_starts(datetime.time(8), datetime.time(16), 4) == [
+        datetime.time(8),
+        datetime.time(10),
+        datetime.time(12),
+        datetime.time(14),
+    ]
+
+
+def test_partition_starts_rejects_text():
+    with pytest.raises(ValueError):
+        partition_starts("a", "z", 4)
+
+
+def test_parse_bounds():
+    assert parse_bounds("0, 1000") == (0, 1000)
+    assert parse_bounds("0.5,2") == (0.5, 2.0)
+    assert parse_bounds("2024-01-01, 2024-12-31") == (
+        datetime.date(2024, 1, 1),
+        datetime.date(2024, 12, 31),
+    )
+    assert parse_bounds("2024-01-01 06:00,2024-01-02") == (
+        datetime.datetime(2024, 1, 1, 6),
+        datetime.datetime(2024, 1, 2),
+    )
+    assert parse_bounds("09:00,17:30") == (datetime.time(9), datetime.time(17, 30))
+    with pytest.raises(ValueError):
+        parse_bounds("1000")
+
+
+def test_resolve_connections():
+    conn = Connection.set("sqlite://", displaycon=False)
+    conn.alias = "tenant_a"
+    try:
+        assert resolve_connections("tenant_*") == [conn]
+        assert resolve_connections("tenant_a, tenant_a") == [conn]
+        with pytest.raises(ValueError):
+            resolve_connections("tenant_b")
+    finally:
+        conn.alias = None
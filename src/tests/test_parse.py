@@ -1,7 +1,15 @@
+import io
 import os
 from pathlib import Path
 
-from sql.parse import connection_from_dsn_section, parse, without_sql_comment
+from sql.parse import (
+    connection_from_dsn_section,
+    iter_statements,
+    parse,
+    split_statements,
+    statement_kind,
+    without_sql_comment,
+)
 
 try:
     from traitlets.config.configurable import Configurable
@@ -182,3 +190,133 @@ def test_without_sql_persist():
     line = "--persist my_table --uff da"
     expected = "--persist my_table"
     assert without_sql_comment(parser=parser_stub, line=line) == expected
+
+
+def test_iter_statements():
+    script = (
+        "-- a script\n"
+        "SELECT 1;\n"
+        "INSERT INTO t VALUES ('a;b', 'it''s'); /* c; */\n"
+        "CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;\n"
+        "\\d t\n"
+        'SELECT "we;ird" FROM t -- trailing ;\n'
+        ";\n"
+        "-- only a comment;\n"
+        "SELECT 2"
+    )
+    expected = [
+        ("-- a script\nSELECT 1;", 1),
+        ("INSERT INTO t VALUES ('a;b', 'it''s');", 3),
+        (
+            "/* c; */\nCREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ "
+            "LANGUAGE sql;",
+            3,
+        ),
+        ("\\d t", 5),
+        ('SELECT "we;ird" FROM t -- trailing ;\n;', 6),
+        ("-- only a comment;\nSELECT 2", 8),
+    ]
+    for chunk_size in (1, 3, 7, 4096):
+        assert list(iter_statements(io.StringIO(script), chunk_size)) == expected
+
+
+def test_split_statements():
+    assert split_statements("SELECT 1; SELECT ';'; -- done") == (
+        "SELECT 1;",
+        "SELECT ';';",
+    )
+    assert split_statements("") == ()
+    trigger = (
+        "CREATE TRIGGER t AFTER INSERT ON x BEGIN UPDATE y SET a = 1; END;\n"
+        "SELECT 1"
+    )
+    assert split_statements(trigger) == (
+        "CREATE TRIGGER t AFTER INSERT ON x BEGIN UPDATE y SET a = 1; END;",
+        "SELECT 1",
+    )
+    split_statements.cache_clear()
+    split_statements("SELECT 1")
+    split_statements("SELECT 1")
+    assert split_statements.cache_info().hits == 1
+
+
+def test_split_statements_backslash_escapes():
+    mysql = "INSERT INTO t VALUES ('O\\'Brien; x'), (\"a\\\";b\"); SELECT 1"
+    assert split_statements(mysql, "mysql") == (
+        "INSERT INTO t VALUES ('O\\'Brien; x'), (\"a\\\";b\");",
+        "SELECT 1",
+    )
+    assert split_statements(mysql) == split_statements(mysql, "mysql")
+    postgres = "SELECT E'it\\'s; x', 'C:\\'; SELECT 1"
+    assert split_statements(postgres, "postgresql") == (
+        "SELECT E'it\\'s; x', 'C:\\';",
+        "SELECT 1",
+    )
+
+
+def test_iter_statements_backslash_escapes():
+    script = "INSERT INTO t VALUES ('a\\';b', 'c\\\\');\nSELECT 'd;'"
+    expected = [
+        ("INSERT INTO t VALUES ('a\\';b', 'c\\\\');", 1),
+        ("SELECT 'd;'", 2),
+    ]
+    for chunk_size in (1, 2, 5, 4096):
+        statements = iter_statements(io.StringIO(script), chunk_size, "mysql")
+        assert list(statements) == expected
+
+
+def test_iter_statements_begin_as_a_name():
+    script = "select 1 as begin;\nselect 'x' begin;\nselect 2"
+    expected = [
+        ("select 1 as begin;", 1),
+        ("select 'x' begin;", 2),
+        ("select 2", 3),
+    ]
+    for chunk_size in (1, 3, 4096):
+        assert list(iter_statements(io.StringIO(script), chunk_size)) == expected
+
+
+def test_split_statements_blocks():
+    procedure = (
+        "CREATE PROCEDURE p() BEGIN IF x THEN SELECT 1; END IF; "
+        "SELECT CASE WHEN y THEN 2 END; END; SELECT 3"
+    )
+    assert split_statements(procedure) == (
+        "CREATE PROCEDURE p() BEGIN IF x THEN SELECT 1; END IF; "
+        "SELECT CASE WHEN y THEN 2 END; END;",
+        "SELECT 3",
+    )
+    assert split_statements("BEGIN; INSERT INTO t VALUES (1); END") == (
+        "BEGIN;",
+        "INSERT INTO t VALUES (1);",
+        "END",
+    )
+    assert split_statements("BEGIN TRANSACTION; SELECT 1") == (
+        "BEGIN TRANSACTION;",
+        "SELECT 1",
+    )
+    assert split_statements("select 1 as begin; select 2") == (
+        "select 1 as begin;",
+        "select 2",
+    )
+    assert split_statements("select start, begin from t; select 2; select 3") == (
+        "select start, begin from t;",
+        "select 2;",
+        "select 3",
+    )
+    mysql = (
+        "CREATE DEFINER=`root`@`localhost` TRIGGER t BEFORE INSERT ON x "
+        "FOR EACH ROW BEGIN SET NEW.a = 1; END; SELECT 1"
+    )
+    assert split_statements(mysql, "mysql")[1] == "SELECT 1"
+
+
+def test_statement_kind():
+    assert statement_kind("-- a comment\n/* and another */ select 1") == "SELECT"
+    assert statement_kind("WITH a AS (SELECT 1) SELECT * FROM a") == "SELECT"
+    assert statement_kind("WITH a AS (SELECT 1) INSERT INTO t SELECT * FROM a") == "DML"
+    assert statement_kind("DELETE FROM t") == "DML"
+    assert statement_kind("create table t (a int)") == "DDL"
+    assert statement_kind("BEGIN") == "TRANSACTION"
+    assert statement_kind("\\d t") == "META"
+    assert statement_kind("PRAGMA table_info(t)") == "OTHER"
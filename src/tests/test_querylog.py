@@ -0,0 +1,34 @@
+from sql.querylog import _percentile, begin, fail, fingerprint, finish, normalize
+
+
+def test_normalize():
+    assert normalize(
+        "select * from t -- all of it\nwhere id = 1 and name = 'it''s' and x in (1, 2, 3);"
+    ) == "SELECT * FROM t WHERE id = ? AND name = ? AND x IN (?)"
+    assert normalize("INSERT INTO t VALUES (1, 'a'), (2, 'b')") == (
+        "INSERT INTO t VALUES (?)"
+    )
+    assert normalize("SELECT :name FROM t") == "SELECT :name FROM t"
+
+
+def test_fingerprint():
+    assert fingerprint(normalize("SELECT 1")) == fingerprint(normalize("select  2"))
+    assert fingerprint(normalize("SELECT 1")) != fingerprint(normalize("SELECT 1, 2"))
+
+
+def test_percentile():
+    durations = [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert _percentile(durations, 0.5) == 3.0
+    assert _percentile(durations, 0.95) == 4.8
+    assert _percentile([7.0], 0.99) == 7.0
+
+
+def test_fail_keeps_what_was_fetched():
+    first, second = begin("SELECT 1", "db"), begin("SELECT 2", "db")
+    finish(first, 1)
+    finish(second, 10)
+    fail([first, second], TimeoutError("canceled\nafter 5s"))
+    assert first["error"] is None
+    assert second["error"] == "TimeoutError: canceled"
+    assert second["rows"] == 10
+    assert second["duration"] >= 0
@@ -0,0 +1,162 @@
+import pytest
+
+from sql.rewrite import (
+    add_limit,
+    add_sample,
+    bind_tables,
+    is_read_only,
+    parse,
+    parse_sample,
+    table_placeholders,
+    table_references,
+    tables_read,
+    tables_written,
+)
+
+
+def test_add_limit():
+    assert (
+        add_limit("SELECT * FROM work", 10, "sqlite") == "SELECT * FROM work LIMIT 10"
+    )
+
+
+def test_add_limit_before_trailing_comment_and_semicolon():
+    assert (
+        add_limit("SELECT * FROM work -- all of them\n;", 10, "postgresql")
+        == "SELECT * FROM work LIMIT 10 -- all of them\n;"
+    )
+
+
+def test_add_limit_after_cte():
+    assert (
+        add_limit(
+            "WITH w AS (SELECT * FROM work LIMIT 99) SELECT * FROM w", 5, "sqlite"
+        )
+        == "WITH w AS (SELECT * FROM work LIMIT 99) SELECT * FROM w LIMIT 5"
+    )
+
+
+def test_add_limit_top():
+    assert (
+        add_limit("SELECT DISTINCT title FROM work", 10, "mssql")
+        == "SELECT DISTINCT TOP 10 title FROM work"
+    )
+
+
+def test_add_limit_fetch_first():
+    assert (
+        add_limit("SELECT * FROM work;", 10, "oracle")
+        == "SELECT * FROM work FETCH FIRST 10 ROWS ONLY;"
+    )
+
+
+def test_add_limit_leaves_limited_statements_alone():
+    assert add_limit("SELECT * FROM work LIMIT 3", 10, "sqlite") is None
+    assert add_limit("SELECT TOP 3 * FROM work", 10, "mssql") is None
+    assert add_limit("SELECT * FROM work FETCH FIRST 3 ROWS ONLY", 10, "oracle") is None
+
+
+def test_add_limit_leaves_other_statements_alone():
+    assert add_limit("INSERT INTO work SELECT * FROM play", 10, "sqlite") is None
+    assert add_limit("DELETE FROM work", 10, "sqlite") is None
+    assert add_limit("SELECT * FROM work FOR UPDATE", 10, "postgresql") is None
+
+
+def test_table_references():
+    statement = parse(
+        "SELECT * FROM work w JOIN (SELECT * FROM character) c ON c.id = w.id "
+        "WHERE EXTRACT(YEAR FROM w.date) IN (SELECT year FROM paragraph)"
+    )[0]
+    names = [ref.get_real_name() for ref in table_references(statement)]
+    assert names == ["work", "character", "paragraph"]
+
+
+def test_parse_sample():
+    assert parse_sample("10%") == (10.0, True)
+    assert parse_sample("250") == (250, False)
+    with pytest.raises(ValueError):
+        parse_sample("150%")
+    with pytest.raises(ValueError):
+        parse_sample("lots")
+
+
+def test_add_sample_postgresql():
+    assert add_sample("SELECT * FROM work w", "10%", "postgresql", seed=7) == (
+        "SELECT * FROM work w TABLESAMPLE SYSTEM (10) REPEATABLE (7)",
+        ["work"],
+    )
+
+
+def test_add_sample_duckdb():
+    assert add_sample("SELECT * FROM work", "100", "duckdb") == (
+        "SELECT * FROM work TABLESAMPLE 100 ROWS (reservoir)",
+        ["work"],
+    )
+
+
+def test_add_sample_skips_ctes():
+    sampled, tables = add_sample(
+        "WITH w AS (SELECT * FROM work) SELECT * FROM w", "5%", "duckdb"
+    )
+    assert tables == ["work"]
+    assert sampled.endswith("SELECT * FROM w")
+
+
+def test_add_sample_rejects_dml():
+    with pytest.raises(ValueError):
+        add_sample("DELETE FROM work", "5%", "sqlite")
+
+
+def test_is_read_only():
+    assert is_read_only("SELECT * FROM work")
+    assert is_read_only("WITH w AS (SELECT * FROM work) SELECT * FROM w;")
+    assert not is_read_only("SELECT * INTO copy FROM work")
+    assert not is_read_only("SELECT * FROM work FOR UPDATE")
+    assert not is_read_only(
+        "WITH gone AS (DELETE FROM work RETURNING *) SELECT * FROM gone"
+    )
+    assert not is_read_only("UPDATE work SET title = 'x'")
+    assert not is_read_only("BEGIN")
+
+
+def test_table_placeholders():
+    assert table_placeholders(
+        "SELECT :x FROM :frame f JOIN (SELECT * FROM :other) o ON f.a = o.a"
+    ) == ["frame", "other"]
+
+
+def test_bind_tables():
+    assert (
+        bind_tables("SELECT * FROM :df WHERE a = :a", {"df": "tmp"})
+        == "SELECT * FROM tmp AS df WHERE a = :a"
+    )
+    assert (
+        bind_tables("SELECT * FROM work w, :df AS d", {"df": "tmp"})
+        == "SELECT * FROM work w, tmp AS d"
+    )
+
+
+def test_tables_read():
+    assert tables_read(
+        "WITH w AS (SELECT * FROM work) "
+        "SELECT * FROM w JOIN public.chapter c ON w.id = c.workid "
+        "WHERE c.n IN (SELECT n FROM paragraph)"
+    ) == set(["work", "chapter", "paragraph"])
+
+
+@pytest.mark.parametrize(
+    "sql,written",
+    [
+        ("INSERT INTO work (id, title) VALUES (1, 'x')", set(["work"])),
+        ("UPDATE ONLY public.work SET title = 'x'", set(["work"])),
+        ("DELETE FROM user WHERE id = 1", set(["user"])),
+        ("DROP TABLE IF EXISTS a, b", set(["a", "b"])),
+        ("CREATE TABLE IF NOT EXISTS a (n INT)", set(["a"])),
+        ("TRUNCATE TABLE a; COMMIT", set(["a"])),
+        ("SELECT * FROM work", set()),
+        ("CREATE INDEX idx ON work (title)", None),
+        ("SET search_path TO other", None),
+    ],
+)
+def test_tables_written(sql, written):
+    assert tables_written(sql) == written